@@ -3,12 +3,25 @@
 #if defined VERTEX_SHADER
 
 in vec3  in_position;
+
+#if defined COMPACT_VERTICES
+// Octahedral normal stored as two signed 16-bit integers
+in vec2  in_normal;
+// Half-float texture coordinates
+in vec2  in_texcoord_0;
+
+// Skinning: unsigned-normalized weights (8-bit, or raw 16-bit integers with WEIGHTS_16BIT) and unsigned joint indices,
+// where unused slots hold the largest index
+in vec4  in_jointsWeight;
+in uvec4 in_jointsIdx;
+#else
 in vec3  in_normal;
 in vec2  in_texcoord_0;
 
 // Skinning
 in vec4 in_jointsWeight;
 in ivec4 in_jointsIdx;
+#endif
 
 out vec2 tex_coords;
 out vec3 normal;
@@ -22,15 +35,77 @@ uniform mat4 view;
 const int MAX_BONES = 100;
 uniform int numBones;
 uniform int numBoneInfluences;
+#if defined PACKED_JOINTS
+// First three rows of the joint matrices, the last one being (0, 0, 0, 1)
+uniform mat3x4 jointsMatrices[MAX_BONES];
+#else
 uniform mat4 jointsMatrices[MAX_BONES];
+#endif
+
+// Baked clip sampled from a texture instead of jointsMatrices: four texels (the columns of the joint matrix) per
+// joint, animationFramesPerRow frames side by side in each row. The fractional part of animationFrame blends towards
+// the next frame
+uniform bool useAnimationTexture;
+uniform sampler2D animationTexture;
+uniform float animationFrame;
+uniform int animationFramesPerRow;
+
+mat4 fetchJointMatrix(int joint, int frame) {
+    int column = 4 * (numBones * (frame % animationFramesPerRow) + joint);
+    int row = frame / animationFramesPerRow;
+    return mat4(texelFetch(animationTexture, ivec2(column, row), 0),
+                texelFetch(animationTexture, ivec2(column + 1, row), 0),
+                texelFetch(animationTexture, ivec2(column + 2, row), 0),
+                texelFetch(animationTexture, ivec2(column + 3, row), 0));
+}
+
+mat4 jointMatrix(int joint) {
+    if (!useAnimationTexture) {
+#if defined PACKED_JOINTS
+        mat3x4 rows = jointsMatrices[joint];
+        return transpose(mat4(rows[0], rows[1], rows[2], vec4(0.0, 0.0, 0.0, 1.0)));
+#else
+        return jointsMatrices[joint];
+#endif
+    }
+
+    int frame = int(animationFrame);
+    float weight = animationFrame - float(frame);
+    if (weight == 0.0)
+        return fetchJointMatrix(joint, frame);
+    return fetchJointMatrix(joint, frame) * (1.0 - weight) + fetchJointMatrix(joint, frame + 1) * weight;
+}
+
+#if defined COMPACT_VERTICES
+vec3 decodeOctahedral(vec2 encoded) {
+    vec2 e = encoded / 32767.0;
+    vec3 n = vec3(e, 1.0 - abs(e.x) - abs(e.y));
+    float t = max(-n.z, 0.0);
+    n.x += n.x >= 0.0 ? -t : t;
+    n.y += n.y >= 0.0 ? -t : t;
+    return n;
+}
+#endif
 
 void main() {
     vec4 totalPosition = vec4(0.0);
     vec4 tempPosition = vec4(in_position, 1.0);
 
+#if defined COMPACT_VERTICES
+    vec3 vertexNormal = decodeOctahedral(in_normal);
+#if defined WEIGHTS_16BIT
+    vec4 jointsWeight = in_jointsWeight / 65535.0;
+#else
+    vec4 jointsWeight = in_jointsWeight;
+#endif
+#else
+    vec3 vertexNormal = in_normal;
+    vec4 jointsWeight = in_jointsWeight;
+#endif
+
     for (int i = 0; i < numBoneInfluences; i++) {
-        int boneIdx = in_jointsIdx[i];
-        float weight = in_jointsWeight[i];
+        int boneIdx = int(in_jointsIdx[i]);
+        float weight = jointsWeight[i];
 
         if (boneIdx == -1)
             continue;
@@ -38,11 +113,11 @@ void main() {
         if (boneIdx >= numBones)
             break;
 
-        vec4 localPosition = jointsMatrices[boneIdx] * tempPosition;
+        vec4 localPosition = jointMatrix(boneIdx) * tempPosition;
         totalPosition += localPosition * weight;
     }
 
-    normal = mat3(transpose(inverse(model))) * normalize(in_normal);
+    normal = mat3(transpose(inverse(model))) * normalize(vertexNormal);
     fragPos = vec3(model * totalPosition); 
 
     gl_Position = projection * view * model * totalPosition;
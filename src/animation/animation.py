@@ -1,25 +1,98 @@
-from pyrr import Matrix44
-from animation.bone import Bone
-from typing import Optional
+from animation.baked import BakedClip, get_baked_clip
+from animation.compression import CompressedClipTracks
+from animation.keyframe import JointChannels
+from animation.pose import ClipTracks, INTERPOLATION_METHODS, LINEAR, SELECTION_SIZE, SamplingContext, \
+    select_keyframes, sample_hermite, forward_kinematics, build_palette, sample_poses
+from animation.skeleton import Skeleton
+from typing import Dict, Optional, Tuple, Union
 import numpy as np
 
 
 class Animation:
     """
-    Represents an animation.
+    Represents an animation. The clip only holds the keyframe channels of the nodes it animates and refers to a
+    Skeleton shared with the other clips of the same file. Its pose is stored as an (N, 4, 4) array of world
+    transforms in skeleton node order, held with the rest of its playback state by a SamplingContext allocated on
+    first use, and evaluated by compiled kernels. In baking mode, the pose is instead read from tables of poses
+    pre-sampled at a fixed rate and shared by every instance playing the clip. A compressed clip drops its float
+    keyframes and samples quantized ones instead.
     """
-    def __init__(self, name: str, duration: float, root_bone: Bone, root_transform: Matrix44) -> None:
+    def __init__(self, name: str, duration: float, skeleton: Skeleton, channels: Dict[int, JointChannels],
+                 tracks: Optional[Union[ClipTracks, CompressedClipTracks]] = None) -> None:
         """
         Constructor.
         :param name: Animation name.
         :param duration: Animation duration.
-        :param root_bone: Animation root bone.
-        :param root_transform: Animation root transform.
+        :param skeleton: Skeleton the animation is played on.
+        :param channels: Keyframe channels of the animation, by skeleton node index.
+        :param tracks: Tracks of the animated nodes, gathered from channels if not given.
         """
         self.name = name
         self.duration = duration
-        self.root_bone = root_bone
-        self.root_transform = root_transform
+        self.skeleton = skeleton
+        self.channels = channels
+        self.root_transform = skeleton.root_transform if skeleton.root_transform is not None else np.identity(4)
+        self.animated_nodes = tracks.nodes if tracks is not None else get_animated_nodes(skeleton, channels)
+        self.tracks = tracks if tracks is not None else ClipTracks.from_channels(self.animated_nodes, channels)
+        self.context: Optional[SamplingContext] = None
+        self.bake_rate: Optional[float] = None
+        self.bake_blend = True
+        self.baked_pose: Optional[Tuple[BakedClip, float]] = None
+
+    def copy(self) -> 'Animation':
+        """
+        Creates an animation sharing the skeleton and keyframes of this one, but with its own pose.
+        :return: Copied animation.
+        """
+        return Animation(self.name, self.duration, self.skeleton, self.channels, self.tracks)
+
+    def set_bake_rate(self, bake_rate: Optional[float], blend: bool = True) -> None:
+        """
+        Enables or disables baking mode.
+        :param bake_rate: Frames per second the clip is baked at, None to evaluate poses exactly.
+        :param blend: Whether to blend the two baked frames around the timestamp instead of taking the nearest one.
+        """
+        self.bake_rate = bake_rate
+        self.bake_blend = blend
+        self.baked_pose = None
+
+    def compress(self) -> None:
+        """
+        Replaces the keyframes of the clip with quantized ones and drops its keyframe channels. Copies made
+        afterwards share the compressed keyframes.
+        """
+        if isinstance(self.tracks, CompressedClipTracks):
+            return
+        self.tracks = CompressedClipTracks(self.tracks)
+        self.channels = {}
+        self.baked_pose = None
+
+    def get_number_of_keyframes(self) -> int:
+        """
+        Gets the number of keyframes of the animation, i.e. the number of translation keyframes of the root node.
+        :return: Number of keyframes.
+        """
+        root_channels = self.channels.get(0)
+        if root_channels is None or root_channels.translations is None:
+            # Compressed clips only keep the tracks of the animated nodes
+            return len(self.tracks.get_root_times())
+        return len(root_channels.translations)
+
+    def get_world_transforms(self) -> np.ndarray:
+        """
+        Returns the current pose, allocating it (in rest pose) if the animation has not been posed yet.
+        :return: (N, 4, 4) world transform of every skeleton node.
+        """
+        return self.get_context().world
+
+    def get_context(self) -> SamplingContext:
+        """
+        Returns the playback state of the animation, allocating it if the animation has not been posed yet.
+        :return: Sampling context of the animation.
+        """
+        if self.context is None:
+            self.context = SamplingContext(self.skeleton)
+        return self.context
 
     def set_pose(self, timestamp: float, interpolation_method: str, n_keyframes: int) -> None:
         """
@@ -28,53 +101,176 @@ class Animation:
         :param interpolation_method: Interpolation method ('linear' or 'hermite').
         :param n_keyframes: Number of equidistant Keyframes to use for the interpolation.
         """
+        method = INTERPOLATION_METHODS.get(interpolation_method)
+        if method is None:
+            raise ValueError("Invalid interpolation method: {}".format(interpolation_method))
+
         t = timestamp % self.duration
-        self.root_bone.set_pose(t, interpolation_method, n_keyframes, self.root_transform, True)
+        if self.bake_rate is not None:
+            self.baked_pose = (get_baked_clip(self, interpolation_method, n_keyframes, self.bake_rate), t)
+            return
+        self.baked_pose = None
+
+        context = self.get_context()
+        tracks = self.tracks
+        if len(tracks.nodes) == 0:
+            return
+
+        root_times = tracks.get_root_times()
+        indices = context.get_indices(len(root_times), n_keyframes)
 
-    def get_sorted_joints(self):
+        # Local TRS of all the animated nodes, then a single sweep composing them (parents come before children)
+        select_keyframes(t, method, indices, root_times, context.keys, context.key_times)
+        if method == LINEAR:
+            tracks.sample_linear(t, indices, context.keys, context.trs)
+        else:
+            segments = tracks.get_hermite_segments(n_keyframes)
+            sample_hermite(t, context.keys, context.key_times, tracks.nodes, segments.n_segments, 0,
+                           segments.translations, segments.rotation_starts, segments.rotations, segments.scales,
+                           context.trs)
+        forward_kinematics(tracks.nodes, self.skeleton.parents, self.root_transform, context.trs, context.world)
+        context.palette_dirty = True
+
+    def sample_poses(self, timestamps: np.ndarray, interpolation_method: str, n_keyframes: int,
+                     space: str = 'world') -> np.ndarray:
         """
-        Returns a sorted list of the skeleton's joints.
-        :return: Sorted list of skeleton joints.
+        Evaluates the poses of the clip at many timestamps in a single parallel kernel call, as set_pose would one by
+        one. The clip's own pose is left untouched.
+        :param timestamps: (T,) timestamps, wrapped around the clip's duration.
+        :param interpolation_method: Interpolation method ('linear' or 'hermite').
+        :param n_keyframes: Number of equidistant Keyframes to use for the interpolation.
+        :param space: 'world' for the world transforms of the nodes, 'local' for their local transforms.
+        :return: (T, N, 4, 4) world transforms, or (T, N, TRS_SIZE) local translation, rotation (xyzw quaternion) and
+        scale, of every skeleton node. Nodes the clip does not animate keep their rest transform (Skeleton.rest_trs
+        in local space).
         """
-        nodes = [(self.root_bone, self.root_transform)]
-        joints = []
+        method = INTERPOLATION_METHODS.get(interpolation_method)
+        if method is None:
+            raise ValueError("Invalid interpolation method: {}".format(interpolation_method))
+        if space not in ('world', 'local'):
+            raise ValueError("Invalid pose space: {}".format(space))
 
-        while len(nodes) > 0:
-            current_node, parent_transform = nodes.pop()
-            if current_node.index > -1:
-                joint_matrix = np.transpose(current_node.inverse_bind_matrix)
-                joint_matrix = current_node.local_transform @ joint_matrix
-                joint_matrix = np.transpose(joint_matrix)
+        timestamps = np.asarray(timestamps, dtype=np.float64) % self.duration
+        n_poses = len(timestamps)
+        trs = np.tile(self.skeleton.rest_trs, (n_poses, 1, 1))
+        world = np.tile(np.asarray(self.skeleton.rest_transforms, dtype=np.float64), (n_poses, 1, 1, 1))
 
-                pair = (current_node.index, joint_matrix)
-                joints.append(pair)
+        if len(self.tracks.nodes) > 0:
+            # Compressed clips are sampled from their keyframes decoded once for the whole batch, which matches set_pose
+            # within float32 rounding
+            tracks = self.tracks.decompress()
+            root_times = tracks.get_root_times()
+            indices = np.linspace(0, len(root_times) - 1, n_keyframes, dtype=int)
+            if method == LINEAR:
+                n_segments, translations, rotation_starts, rotations, scales = (
+                    0, np.zeros((0, 4, 3)), np.zeros((0, 4)), np.zeros((0, 3, 3)), np.zeros((0, 4, 3)))
+            else:
+                segments = self.tracks.get_hermite_segments(n_keyframes)
+                n_segments, translations, rotation_starts, rotations, scales = (
+                    segments.n_segments, segments.translations, segments.rotation_starts, segments.rotations,
+                    segments.scales)
 
-                nodes.extend(
-                    [(child, joint_matrix) for child in current_node.children]
-                )
+            sample_poses(timestamps, method, indices, root_times, tracks.nodes, tracks.translation_times,
+                         tracks.translation_values, tracks.translation_offsets, tracks.translation_lengths,
+                         tracks.rotation_times, tracks.rotation_values, tracks.rotation_offsets,
+                         tracks.rotation_lengths, tracks.scale_times, tracks.scale_values, tracks.scale_offsets,
+                         tracks.scale_lengths, n_segments, translations, rotation_starts, rotations, scales,
+                         self.skeleton.parents, self.root_transform,
+                         np.zeros((n_poses, SELECTION_SIZE), dtype=np.int64), np.zeros((n_poses, 4), dtype=np.float32),
+                         trs, world)
 
-        joints = [x[1] for x in sorted(joints, key=lambda x: x[0])]
-        return np.array(joints, dtype='f4')
+        return world if space == 'world' else trs
+
+    def get_node_positions(self) -> np.ndarray:
+        """
+        Returns the world position of every skeleton node in the current pose.
+        :return: (N, 3) node positions.
+        """
+        if self.baked_pose is not None:
+            baked, timestamp = self.baked_pose
+            return baked.get_positions(timestamp, self.bake_blend)
+        return self.get_world_transforms()[:, :-1, 3]
 
-    def assert_channels_not_empty(self, bone: Optional[Bone] = None) -> None:
+    def get_sorted_joints(self) -> np.ndarray:
+        """
+        Returns the joint palette of the current pose, i.e. the skinning matrix of every joint in joint order. It is
+        only rebuilt when the pose has changed since the last call.
+        :return: (J, 4, 4) array of transposed joint matrices. It is reused by the next calls and must not be modified.
+        """
+        if self.baked_pose is not None:
+            baked, timestamp = self.baked_pose
+            return baked.get_palette(timestamp, self.bake_blend)
+        return self.get_palette()[:self.skeleton.get_number_of_joints()]
+
+    def get_palette(self, layout: str = '4x4') -> np.ndarray:
+        """
+        Returns the upload-ready joint palette of the current pose: a contiguous float32 buffer of PALETTE_SIZE (or
+        more) matrices that can be written to the shader's jointsMatrices array without any copy. It is only rebuilt
+        when the pose or the layout has changed since the last call.
+        :param layout: Layout of the joint matrices, one of PALETTE_LAYOUTS.
+        :return: (P, 4, 4) or (P, 3, 4) palette buffer, padded with zeros past the joints. It is reused by the next
+        calls and must not be modified.
+        """
+        context = self.get_context()
+        context.set_palette_layout(layout)
+
+        if self.baked_pose is not None:
+            baked, timestamp = self.baked_pose
+            palette = baked.get_palette(timestamp, self.bake_blend)
+            context.palette[:len(palette)] = palette if layout == '4x4' else palette.transpose(0, 2, 1)[:, :3]
+            # The buffer no longer holds the palette of the evaluated pose
+            context.palette_dirty = True
+            return context.palette
+
+        if context.palette_dirty:
+            build_palette(context.world, self.skeleton.joint_nodes, self.skeleton.joint_inverse_binds, context.palette)
+            context.palette_dirty = False
+            context.palette_builds += 1
+        return context.palette
+
+    def get_shared_nbytes(self) -> Dict[int, int]:
+        """
+        Returns the sizes of the data the clip shares with its copies: its skeleton, tracks and keyframe channels.
+        :return: Size in bytes of every shared object, by object id, so that objects shared by several clips can be
+        counted once.
+        """
+        sizes = {id(self.skeleton): self.skeleton.nbytes, id(self.tracks): self.tracks.nbytes}
+        for joint_channels in self.channels.values():
+            for track in (joint_channels.translations, joint_channels.rotations, joint_channels.scales):
+                if track is not None:
+                    sizes[id(track)] = track.timestamps.nbytes + track.values.nbytes
+        return sizes
+
+    def assert_channels_not_empty(self) -> None:
         """
         Ensures that the animation data is loaded correctly.
-        :param bone: Input Bone.
         """
-        if bone is None:
-            bone = self.root_bone
+        for i, name in enumerate(self.skeleton.names):
+            joint_channels = self.channels.get(i, JointChannels())
+
+            if not joint_channels.rotations:
+                raise ValueError("Rotations channel is empty in bone: {}".format(name))
+            if not joint_channels.scales:
+                raise ValueError("Scales channel is empty in bone: {}".format(name))
+            if not joint_channels.translations:
+                raise ValueError("Translations channel is empty in bone: {}".format(name))
+
 
-        if not bone.rotations:
-            raise ValueError("Rotations channel is empty in bone: {}".format(bone.name))
-        if not bone.scales:
-            raise ValueError("Scales channel is empty in bone: {}".format(bone.name))
-        if not bone.translations:
-            raise ValueError("Translations channel is empty in bone: {}".format(bone.name))
+def get_animated_nodes(skeleton: Skeleton, channels: Dict[int, JointChannels]) -> np.ndarray:
+    """
+    Finds the nodes an animation can pose: nodes whose translation, rotation and scale are all animated, as are those
+    of all their ancestors. Other nodes keep their previous transform.
+    :param skeleton: Skeleton the animation is played on.
+    :param channels: Keyframe channels of the animation, by skeleton node index.
+    :return: Indices of the animated nodes, parents first.
+    """
+    animated = np.zeros(len(skeleton), dtype=bool)
 
-        if bone.children:
-            for child_bone in bone.children:
-                self.assert_channels_not_empty(child_bone)
+    for i, parent in enumerate(skeleton.parents):
+        joint_channels = channels.get(i)
+        if joint_channels is None or joint_channels.translations is None or joint_channels.rotations is None \
+                or joint_channels.scales is None:
+            continue
+        animated[i] = parent < 0 or animated[parent]
 
-        animation = Animation(name="my_animation", duration=5.0, root_bone=root_bone, root_transform=root_transform)
-        animation.assert_channels_not_empty()
-        
\ No newline at end of file
+    return np.flatnonzero(animated)
@@ -0,0 +1,107 @@
+import numpy as np
+from animation.lru_cache import LRUCache
+from animation.pose import build_palettes
+from animation.skeleton import read_only
+
+from typing import Tuple
+
+# Baked clips, by (clip, interpolation method, number of keyframes to use, bake rate)
+BAKED_POSES = LRUCache(256 << 20)
+
+
+class BakedClip:
+    """
+    Poses of a clip pre-sampled at a fixed rate: the joint palette and the node positions of every frame, stored in
+    contiguous float32 tables. Playing it back is a lookup of the frame at the timestamp, or a blend of the two
+    frames around it, without any per-joint math.
+    """
+
+    def __init__(self, animation, interpolation_method: str, n_keyframes: int, rate: float) -> None:
+        """
+        Constructor.
+        :param animation: Animation to bake. Its own pose is left untouched.
+        :param interpolation_method: Interpolation method ('linear' or 'hermite').
+        :param n_keyframes: Number of equidistant Keyframes to use for the interpolation.
+        :param rate: Frames per second.
+        """
+        self.duration = animation.duration
+        self.rate = rate
+
+        # One frame past the end, so that the last frame blends towards the start of the next loop
+        n_frames = int(np.ceil(self.duration * rate)) + 1
+        world = animation.sample_poses(np.arange(n_frames) / rate, interpolation_method, n_keyframes)
+        palettes = np.empty((n_frames, animation.skeleton.get_number_of_joints(), 4, 4), dtype=np.float32)
+        build_palettes(world, animation.skeleton.joint_nodes, animation.skeleton.joint_inverse_binds, palettes)
+        positions = world[:, :, :-1, 3].astype(np.float32)
+
+        self.palettes = read_only(palettes)
+        self.positions = read_only(positions)
+        self.nbytes = palettes.nbytes + positions.nbytes
+
+    def get_frame(self, timestamp: float) -> Tuple[int, float]:
+        """
+        Returns the baked frame preceding a timestamp.
+        :param timestamp: Current timestamp.
+        :return: Tuple containing the frame and the blend weight of the next frame.
+        """
+        position = (timestamp % self.duration) * self.rate
+        frame = min(int(position), len(self.palettes) - 2)
+        return frame, position - frame
+
+    def get_frame_position(self, timestamp: float, blend: bool = True) -> float:
+        """
+        Returns the position of a timestamp in frames, as read by the animation texture shader.
+        :param timestamp: Current timestamp.
+        :param blend: Whether to blend the two frames around the timestamp instead of taking the nearest one.
+        :return: Frame position; its fractional part is the blend weight of the next frame.
+        """
+        frame, weight = self.get_frame(timestamp)
+        if not blend:
+            return float(frame + 1 if weight >= 0.5 else frame)
+        return frame + weight
+
+    def get_palette(self, timestamp: float, blend: bool = True) -> np.ndarray:
+        """
+        Returns the joint palette at a timestamp.
+        :param timestamp: Current timestamp.
+        :param blend: Whether to blend the two frames around the timestamp instead of taking the nearest one.
+        :return: (J, 4, 4) array of transposed joint matrices.
+        """
+        return blend_frames(self.palettes, *self.get_frame(timestamp), blend)
+
+    def get_positions(self, timestamp: float, blend: bool = True) -> np.ndarray:
+        """
+        Returns the world position of every node at a timestamp.
+        :param timestamp: Current timestamp.
+        :param blend: Whether to blend the two frames around the timestamp instead of taking the nearest one.
+        :return: (N, 3) node positions.
+        """
+        return blend_frames(self.positions, *self.get_frame(timestamp), blend)
+
+
+def blend_frames(table: np.ndarray, frame: int, weight: float, blend: bool) -> np.ndarray:
+    """
+    Reads a frame of a baked table.
+    :param table: Baked table.
+    :param frame: Frame preceding the timestamp.
+    :param weight: Blend weight of the next frame.
+    :param blend: Whether to blend the two frames instead of taking the nearest one.
+    :return: Frame contents, as a new array.
+    """
+    if not blend:
+        return np.array(table[frame + 1 if weight >= 0.5 else frame])
+    return (table[frame] * np.float32(1.0 - weight) + table[frame + 1] * np.float32(weight)).astype(np.float32)
+
+
+def get_baked_clip(animation, interpolation_method: str, n_keyframes: int, rate: float) -> BakedClip:
+    """
+    Returns the baked poses of a clip, baking them on first use. Baked clips are shared by every instance playing
+    the clip.
+    :param animation: Animation to bake.
+    :param interpolation_method: Interpolation method ('linear' or 'hermite').
+    :param n_keyframes: Number of equidistant Keyframes to use for the interpolation.
+    :param rate: Frames per second.
+    :return: Baked clip.
+    """
+    key = (animation.tracks, interpolation_method, n_keyframes, rate)
+    return BAKED_POSES.get(key, lambda: BakedClip(animation, interpolation_method, n_keyframes, rate))
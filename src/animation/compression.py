@@ -0,0 +1,381 @@
+import numpy as np
+from animation.keyframe import Track
+from animation.pose import HERMITE_SEGMENTS, ClipTracks, HermiteSegments, key_index
+from maths import lerp, slerp
+from numba import njit
+
+from typing import Dict, List, Tuple
+
+# Largest code of a quantized translation or scale component (16 bits)
+VECTOR_CODES = 65535
+
+# Largest code of a quantized quaternion component (15 bits, the 16th bit of the three words holds the index of the
+# dropped component and its sign)
+QUATERNION_CODES = 32767
+
+# Columns of the (A, TRACK_FIELDS) track tables: offset of the track's timestamps, number of keyframes, offset of its
+# codes, and stride of the codes (0 for a constant track, which only stores one keyframe)
+TRACK_FIELDS = 4
+
+
+class CompressedClipTracks:
+    """
+    Keyframes of the animated nodes of a clip, quantized. Translations and scales are stored as 16-bit codes within
+    the range of their track, rotations as their three smallest components on 15 bits (48 bits per quaternion), and
+    tracks whose keyframes all quantize to the same code store that code once. Timestamps are kept exact, and tracks
+    with identical timestamps share them. The linear interpolation samples the codes directly; the hermite segments
+    are precomputed from the decompressed tracks.
+    """
+
+    def __init__(self, tracks: ClipTracks) -> None:
+        """
+        Constructor.
+        :param tracks: Tracks to compress.
+        """
+        self.nodes = tracks.nodes
+
+        tables: Dict[bytes, int] = {}
+        chunks: List[np.ndarray] = []
+        translation_times = share_timestamps(tracks.translation_times, tracks.translation_offsets,
+                                             tracks.translation_lengths, tables, chunks)
+        rotation_times = share_timestamps(tracks.rotation_times, tracks.rotation_offsets, tracks.rotation_lengths,
+                                          tables, chunks)
+        scale_times = share_timestamps(tracks.scale_times, tracks.scale_offsets, tracks.scale_lengths, tables, chunks)
+        self.times = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+
+        self.translation_ranges, self.translation_codes, translation_offsets, translation_strides = \
+            quantize_vectors(tracks.translation_values, tracks.translation_offsets, tracks.translation_lengths)
+        self.rotation_codes, rotation_offsets, rotation_strides = \
+            quantize_quaternions(tracks.rotation_values, tracks.rotation_offsets, tracks.rotation_lengths)
+        self.scale_ranges, self.scale_codes, scale_offsets, scale_strides = \
+            quantize_vectors(tracks.scale_values, tracks.scale_offsets, tracks.scale_lengths)
+
+        self.translation_tracks = np.stack((translation_times, tracks.translation_lengths, translation_offsets,
+                                            translation_strides), axis=1).astype(np.int64).reshape(-1, TRACK_FIELDS)
+        self.rotation_tracks = np.stack((rotation_times, tracks.rotation_lengths, rotation_offsets,
+                                         rotation_strides), axis=1).astype(np.int64).reshape(-1, TRACK_FIELDS)
+        self.scale_tracks = np.stack((scale_times, tracks.scale_lengths, scale_offsets, scale_strides),
+                                     axis=1).astype(np.int64).reshape(-1, TRACK_FIELDS)
+
+        self.nbytes = sum(array.nbytes for array in (
+            self.nodes, self.times, self.translation_ranges, self.translation_codes, self.rotation_codes,
+            self.scale_ranges, self.scale_codes, self.translation_tracks, self.rotation_tracks, self.scale_tracks))
+
+    def get_root_times(self) -> np.ndarray:
+        """
+        Returns the timestamps of the root's translation track, which drive the keyframe selection of all nodes.
+        :return: Root translation timestamps (empty if the root is not animated).
+        """
+        if len(self.nodes) == 0 or self.nodes[0] != 0:
+            return np.zeros(0, dtype=np.float32)
+        offset, length = self.translation_tracks[0, 0], self.translation_tracks[0, 1]
+        return self.times[offset: offset + length]
+
+    def get_hermite_segments(self, n_keyframes: int) -> HermiteSegments:
+        """
+        Returns the hermite segments of the clip for a number of keyframes to use, precomputing them from the
+        decompressed tracks on first use.
+        :param n_keyframes: Number of equidistant Keyframes to use for the interpolation.
+        :return: Hermite segments, shared by every instance playing the clip.
+        """
+        return HERMITE_SEGMENTS.get((self, n_keyframes), lambda: HermiteSegments(self.decompress(), n_keyframes))
+
+    def sample_linear(self, timestamp: float, indices: np.ndarray, keys: np.ndarray, trs: np.ndarray) -> None:
+        """
+        Linearly interpolates the local transforms of the animated nodes between the selected keyframes.
+        :param timestamp: Current timestamp (within the clip's duration).
+        :param indices: Indices of the equidistant keyframes used for the interpolation.
+        :param keys: (SELECTION_SIZE,) keyframe selection, as written by select_keyframes.
+        :param trs: (N, TRS_SIZE) output buffer, written for the animated nodes.
+        """
+        sample_compressed_linear(timestamp, indices, keys, self.nodes, self.times, self.translation_tracks,
+                                 self.translation_ranges, self.translation_codes, self.rotation_tracks,
+                                 self.rotation_codes, self.scale_tracks, self.scale_ranges, self.scale_codes, trs)
+
+    def decompress(self) -> ClipTracks:
+        """
+        Decodes the tracks back to floats.
+        :return: Decompressed clip tracks.
+        """
+        translations = decompress_vectors(self.translation_tracks, self.translation_ranges, self.translation_codes)
+        rotations = decompress_quaternions(self.rotation_tracks, self.rotation_codes)
+        scales = decompress_vectors(self.scale_tracks, self.scale_ranges, self.scale_codes)
+
+        return ClipTracks(self.nodes, split_decompressed(self.times, self.translation_tracks, translations),
+                          split_decompressed(self.times, self.rotation_tracks, rotations),
+                          split_decompressed(self.times, self.scale_tracks, scales))
+
+
+def share_timestamps(times: np.ndarray, offsets: np.ndarray, lengths: np.ndarray, tables: Dict[bytes, int],
+                     chunks: List[np.ndarray]) -> np.ndarray:
+    """
+    Stores the timestamps of concatenated tracks, once per distinct timestamps array.
+    :param times: Concatenated timestamps.
+    :param offsets: Offset of every track.
+    :param lengths: Length of every track.
+    :param tables: Offset of every stored timestamps array, by its bytes. Updated with the new arrays.
+    :param chunks: Stored timestamps arrays. Updated with the new arrays.
+    :return: Offset of every track's timestamps in the concatenated stored arrays.
+    """
+    time_offsets = np.zeros(len(offsets), dtype=np.int64)
+    for k, (offset, length) in enumerate(zip(offsets, lengths)):
+        track_times = times[offset: offset + length]
+        key = track_times.tobytes()
+        if key not in tables:
+            tables[key] = sum(len(chunk) for chunk in chunks)
+            chunks.append(track_times)
+        time_offsets[k] = tables[key]
+    return time_offsets
+
+
+def quantize_vectors(values: np.ndarray, offsets: np.ndarray, lengths: np.ndarray) -> tuple:
+    """
+    Quantizes concatenated translation or scale tracks to 16 bits per component, within the range of every track.
+    :param values: Concatenated (K, 3) vectors.
+    :param offsets: Offset of every track.
+    :param lengths: Length of every track.
+    :return: Tuple containing the (A, 2, 3) minimum and quantization step of every track, the (M, 3) uint16 codes,
+    and the offset and stride of every track's codes.
+    """
+    ranges = np.zeros((len(offsets), 2, 3), dtype=np.float32)
+    codes = []
+    code_offsets = np.zeros(len(offsets), dtype=np.int64)
+    strides = np.zeros(len(offsets), dtype=np.int64)
+
+    n_codes = 0
+    for k, (offset, length) in enumerate(zip(offsets, lengths)):
+        track = values[offset: offset + length].astype(np.float64)
+        minimum = track.min(axis=0) if length > 0 else np.zeros(3)
+        step = (track.max(axis=0) - minimum) / VECTOR_CODES if length > 0 else np.zeros(3)
+        ranges[k, 0] = minimum
+        ranges[k, 1] = step
+
+        track_codes = np.round((track - minimum) / np.where(step > 0, step, 1.0)).astype(np.uint16)
+        code_offsets[k], strides[k], track_codes = elide_constant(track_codes, n_codes)
+        codes.append(track_codes)
+        n_codes += len(track_codes)
+
+    return ranges, join_codes(codes), code_offsets, strides
+
+
+def quantize_quaternions(values: np.ndarray, offsets: np.ndarray, lengths: np.ndarray) -> tuple:
+    """
+    Quantizes concatenated rotation tracks with the smallest three encoding: the largest component of a unit
+    quaternion follows from the three others, which lie within [-1/sqrt(2), 1/sqrt(2)] and are stored on 15 bits.
+    The 16th bits of the three words hold the index of the largest component and its sign.
+    :param values: Concatenated (K, 4) quaternions.
+    :param offsets: Offset of every track.
+    :param lengths: Length of every track.
+    :return: Tuple containing the (M, 3) uint16 codes, and the offset and stride of every track's codes.
+    """
+    quaternions = values.astype(np.float64)
+    quaternions /= np.maximum(np.linalg.norm(quaternions, axis=1, keepdims=True), 1e-12)
+
+    largest = np.argmax(np.abs(quaternions), axis=1)
+    negative = quaternions[np.arange(len(quaternions)), largest] < 0
+    smallest = np.array([np.delete(quaternion, index) for quaternion, index in zip(quaternions, largest)],
+                        dtype=np.float64).reshape(-1, 3)
+
+    all_codes = np.round((np.clip(smallest * np.sqrt(2.0), -1.0, 1.0) + 1.0) * 0.5 * QUATERNION_CODES)
+    all_codes = all_codes.astype(np.uint16)
+    all_codes[:, 0] |= ((largest & 1) << 15).astype(np.uint16)
+    all_codes[:, 1] |= ((largest >> 1) << 15).astype(np.uint16)
+    all_codes[:, 2] |= (negative.astype(np.uint16) << 15)
+
+    codes = []
+    code_offsets = np.zeros(len(offsets), dtype=np.int64)
+    strides = np.zeros(len(offsets), dtype=np.int64)
+
+    n_codes = 0
+    for k, (offset, length) in enumerate(zip(offsets, lengths)):
+        code_offsets[k], strides[k], track_codes = elide_constant(all_codes[offset: offset + length], n_codes)
+        codes.append(track_codes)
+        n_codes += len(track_codes)
+
+    return join_codes(codes), code_offsets, strides
+
+
+def elide_constant(codes: np.ndarray, offset: int) -> Tuple[int, int, np.ndarray]:
+    """
+    Keeps a single keyframe of a track whose keyframes all have the same codes.
+    :param codes: Codes of the track.
+    :param offset: Offset the track's codes are stored at.
+    :return: Tuple containing the offset and stride of the track's codes, and the codes to store.
+    """
+    if len(codes) > 0 and np.all(codes == codes[0]):
+        return offset, 0, codes[:1]
+    return offset, 1, codes
+
+
+def join_codes(codes: List[np.ndarray]) -> np.ndarray:
+    """
+    Concatenates the codes of several tracks.
+    :param codes: Codes of every track.
+    :return: (M, 3) uint16 codes.
+    """
+    if len(codes) == 0:
+        return np.zeros((0, 3), dtype=np.uint16)
+    return np.ascontiguousarray(np.concatenate(codes), dtype=np.uint16)
+
+
+def split_decompressed(times: np.ndarray, tracks: np.ndarray, values: np.ndarray) -> List[Track]:
+    """
+    Splits decompressed values into per-node tracks.
+    :param times: Stored timestamps.
+    :param tracks: (A, TRACK_FIELDS) track table.
+    :param values: Decompressed values, one per keyframe of every track, in track order.
+    :return: List of tracks.
+    """
+    result = []
+    start = 0
+    for time_offset, length, _, _ in tracks:
+        result.append(Track(times[time_offset: time_offset + length], values[start: start + length]))
+        start += length
+    return result
+
+
+@njit(cache=True, nogil=True)
+def decode_vector(ranges: np.ndarray, codes: np.ndarray, k: int, index: int, vector: np.ndarray) -> None:
+    """
+    Decodes a translation or scale keyframe.
+    :param ranges: (A, 2, 3) minimum and quantization step of every track.
+    :param codes: (M, 3) codes.
+    :param k: Track.
+    :param index: Position of the keyframe's codes.
+    :param vector: (3,) output vector.
+    """
+    for c in range(3):
+        vector[c] = np.float64(ranges[k, 0, c]) + np.float64(codes[index, c]) * np.float64(ranges[k, 1, c])
+
+
+@njit(cache=True, nogil=True)
+def decode_quaternion(codes: np.ndarray, index: int, quaternion: np.ndarray) -> None:
+    """
+    Decodes a rotation keyframe stored with the smallest three encoding.
+    :param codes: (M, 3) codes.
+    :param index: Position of the keyframe's codes.
+    :param quaternion: (4,) output quaternion.
+    """
+    largest = (np.int64(codes[index, 0]) >> 15) | ((np.int64(codes[index, 1]) >> 15) << 1)
+    negative = (np.int64(codes[index, 2]) >> 15) == 1
+
+    squared = 0.0
+    j = 0
+    for c in range(4):
+        if c == largest:
+            continue
+        value = ((np.int64(codes[index, j]) & QUATERNION_CODES) * (2.0 / QUATERNION_CODES) - 1.0) / np.sqrt(2.0)
+        quaternion[c] = value
+        squared += value * value
+        j += 1
+
+    quaternion[largest] = np.sqrt(max(1.0 - squared, 0.0))
+    if negative:
+        quaternion[largest] = -quaternion[largest]
+
+
+@njit(cache=True, nogil=True)
+def code_index(tracks: np.ndarray, k: int, index: int) -> int:
+    """
+    Returns the position of a keyframe's codes.
+    :param tracks: (A, TRACK_FIELDS) track table.
+    :param k: Track.
+    :param index: Keyframe of the track.
+    :return: Position in the codes.
+    """
+    return tracks[k, 2] + tracks[k, 3] * index
+
+
+@njit(cache=True, nogil=True)
+def sample_compressed_linear(timestamp: float, indices: np.ndarray, keys: np.ndarray, track_nodes: np.ndarray,
+                             times: np.ndarray, translation_tracks: np.ndarray, translation_ranges: np.ndarray,
+                             translation_codes: np.ndarray, rotation_tracks: np.ndarray, rotation_codes: np.ndarray,
+                             scale_tracks: np.ndarray, scale_ranges: np.ndarray, scale_codes: np.ndarray,
+                             trs: np.ndarray) -> None:
+    """
+    Linearly interpolates the local translation, rotation and scale of every animated node between the selected
+    keyframes, decoding them from the quantized tracks. Selects the same keyframes as sample_linear.
+    :param timestamp: Current timestamp (within the clip's duration).
+    :param indices: Indices of the equidistant keyframes used for the interpolation.
+    :param keys: (SELECTION_SIZE,) keyframe selection, as written by select_keyframes.
+    :param track_nodes: (A,) animated nodes.
+    :param times: Stored timestamps.
+    :param translation_tracks: (A, TRACK_FIELDS) translation track table.
+    :param translation_ranges: (A, 2, 3) minimum and quantization step of the translation tracks.
+    :param translation_codes: Translation codes.
+    :param rotation_tracks: (A, TRACK_FIELDS) rotation track table.
+    :param rotation_codes: Rotation codes.
+    :param scale_tracks: (A, TRACK_FIELDS) scale track table.
+    :param scale_ranges: (A, 2, 3) minimum and quantization step of the scale tracks.
+    :param scale_codes: Scale codes.
+    :param trs: (N, TRS_SIZE) output buffer, written for the animated nodes.
+    """
+    left = keys[2]
+    right = keys[3]
+    vector_1 = np.empty(3)
+    vector_2 = np.empty(3)
+    quaternion_1 = np.empty(4)
+    quaternion_2 = np.empty(4)
+
+    for k in range(len(track_nodes)):
+        node = track_nodes[k]
+
+        t1 = key_index(indices, left, 0, translation_tracks[k, 1])
+        t2 = key_index(indices, right, 0, translation_tracks[k, 1])
+        decode_vector(translation_ranges, translation_codes, k, code_index(translation_tracks, k, t1), vector_1)
+        decode_vector(translation_ranges, translation_codes, k, code_index(translation_tracks, k, t2), vector_2)
+        trs[node, 0:3] = lerp(vector_1, vector_2, timestamp, times[translation_tracks[k, 0] + t1],
+                              times[translation_tracks[k, 0] + t2])
+
+        r1 = key_index(indices, left, 0, rotation_tracks[k, 1])
+        r2 = key_index(indices, right, 0, rotation_tracks[k, 1])
+        decode_quaternion(rotation_codes, code_index(rotation_tracks, k, r1), quaternion_1)
+        decode_quaternion(rotation_codes, code_index(rotation_tracks, k, r2), quaternion_2)
+        trs[node, 3:7] = slerp(quaternion_1, quaternion_2, timestamp, times[rotation_tracks[k, 0] + r1],
+                               times[rotation_tracks[k, 0] + r2])
+
+        s1 = key_index(indices, left, 0, scale_tracks[k, 1])
+        s2 = key_index(indices, right, 0, scale_tracks[k, 1])
+        decode_vector(scale_ranges, scale_codes, k, code_index(scale_tracks, k, s1), vector_1)
+        decode_vector(scale_ranges, scale_codes, k, code_index(scale_tracks, k, s2), vector_2)
+        trs[node, 7:10] = lerp(vector_1, vector_2, timestamp, times[scale_tracks[k, 0] + s1],
+                               times[scale_tracks[k, 0] + s2])
+
+
+@njit(cache=True)
+def decompress_vectors(tracks: np.ndarray, ranges: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """
+    Decodes every keyframe of quantized translation or scale tracks.
+    :param tracks: (A, TRACK_FIELDS) track table.
+    :param ranges: (A, 2, 3) minimum and quantization step of every track.
+    :param codes: Codes.
+    :return: (K, 3) vectors, one per keyframe of every track, in track order.
+    """
+    values = np.empty((np.sum(tracks[:, 1]), 3), dtype=np.float32)
+    vector = np.empty(3)
+    row = 0
+    for k in range(len(tracks)):
+        for i in range(tracks[k, 1]):
+            decode_vector(ranges, codes, k, code_index(tracks, k, i), vector)
+            values[row] = vector
+            row += 1
+    return values
+
+
+@njit(cache=True)
+def decompress_quaternions(tracks: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """
+    Decodes every keyframe of quantized rotation tracks.
+    :param tracks: (A, TRACK_FIELDS) track table.
+    :param codes: Codes.
+    :return: (K, 4) quaternions, one per keyframe of every track, in track order.
+    """
+    values = np.empty((np.sum(tracks[:, 1]), 4), dtype=np.float32)
+    quaternion = np.empty(4)
+    row = 0
+    for k in range(len(tracks)):
+        for i in range(tracks[k, 1]):
+            decode_quaternion(codes, code_index(tracks, k, i), quaternion)
+            values[row] = quaternion
+            row += 1
+    return values
@@ -0,0 +1,340 @@
+import numpy as np
+from animation.animation import Animation
+from animation.pose import ClipTracks, INTERPOLATION_METHODS, LINEAR, SELECTION_SIZE, TRS_SIZE, select_keyframes, \
+    sample_linear, sample_hermite, forward_kinematics, build_palettes, split_tracks, blend_trs
+from numba import njit, prange
+
+from typing import Dict, List, Optional, Tuple, Union
+
+
+class Crowd:
+    """
+    Poses many instances of the clips of one skeleton in a single parallel kernel call. The clips' tracks are
+    concatenated once; every call then only takes per-instance arrays (clip id, timestamp, ...), so the cost of the
+    interpreter does not grow with the number of instances. A crowd can skip some nodes (see
+    Skeleton.get_leaf_nodes): they are not sampled, but attached to their parents with the local transform they have
+    at the start of the clip.
+    """
+
+    def __init__(self, animations: List[Animation], skipped_nodes: Optional[np.ndarray] = None) -> None:
+        """
+        Constructor.
+        :param animations: Clips that instances can play, indexed by clip id. They must share their skeleton.
+        :param skipped_nodes: Nodes that are not sampled, parents first, or None to sample every animated node.
+        """
+        if len(animations) == 0:
+            raise ValueError("A crowd needs at least one animation")
+
+        self.skeleton = animations[0].skeleton
+        if any(animation.skeleton is not self.skeleton for animation in animations):
+            raise ValueError("All the animations of a crowd must share their skeleton")
+
+        self.animations = animations
+        self.durations = np.array([animation.duration for animation in animations], dtype=np.float64)
+        self.root_transform = animations[0].root_transform
+
+        # Animated nodes of clip c are tracks clip_starts[c]:clip_starts[c + 1] of the concatenated tracks
+        self.skipped_nodes = np.zeros(0, dtype=np.int64) if skipped_nodes is None else \
+            np.asarray(skipped_nodes, dtype=np.int64)
+
+        # Compressed clips are decompressed, the concatenated tracks are a copy anyway
+        tracks = [animation.tracks.decompress() for animation in animations]
+        if len(self.skipped_nodes) > 0:
+            tracks = [clip.select(~np.isin(clip.nodes, self.skipped_nodes)) for clip in tracks]
+        self.clips = tracks
+
+        # (clips, skipped nodes, 4, 4) local transforms the skipped nodes are attached to their parents with
+        self.skipped_transforms = np.zeros((len(animations), len(self.skipped_nodes), 4, 4), dtype=np.float64)
+        if len(self.skipped_nodes) > 0:
+            parents = self.skeleton.parents[self.skipped_nodes]
+            for c, animation in enumerate(animations):
+                start = animation.copy()
+                start.set_pose(0.0, 'linear', max(start.get_number_of_keyframes(), 2))
+                world = start.get_world_transforms()
+                self.skipped_transforms[c] = np.linalg.inv(world[parents]) @ world[self.skipped_nodes]
+        self.clip_starts = np.zeros(len(tracks) + 1, dtype=np.int64)
+        self.clip_starts[1:] = np.cumsum([len(clip.nodes) for clip in tracks])
+        self.tracks = concatenate_clips(tracks)
+
+        self.root_offsets = np.zeros(len(tracks), dtype=np.int64)
+        self.root_lengths = np.zeros(len(tracks), dtype=np.int64)
+        for c, clip in enumerate(tracks):
+            self.root_lengths[c] = len(clip.get_root_times())
+            if self.root_lengths[c] > 0:
+                self.root_offsets[c] = self.tracks.translation_offsets[self.clip_starts[c]]
+
+        # Equidistant keyframe indices per (clip id, n_keyframes)
+        self.index_tables: Dict[Tuple[int, int], np.ndarray] = {}
+        # Hermite segments of the (clip id, n_keyframes) pairs of the last call, packed into single arrays
+        self.packed_pairs: Optional[bytes] = None
+        self.packed_segments: Optional[tuple] = None
+
+    def get_index_table(self, clip_id: int, n_keyframes: int) -> np.ndarray:
+        """
+        Returns the indices of the equidistant keyframes a clip is interpolated with.
+        :param clip_id: Clip id.
+        :param n_keyframes: Number of equidistant Keyframes to use for the interpolation.
+        :return: Keyframe indices.
+        """
+        key = (clip_id, n_keyframes)
+        if key not in self.index_tables:
+            self.index_tables[key] = np.linspace(0, self.root_lengths[clip_id] - 1, n_keyframes, dtype=np.int64)
+        return self.index_tables[key]
+
+    def pack_hermite_segments(self, pairs: np.ndarray) -> tuple:
+        """
+        Packs the hermite segments of several (clip id, n_keyframes) pairs, reusing the previous packing while the
+        pairs do not change.
+        :param pairs: (P, 2) distinct (clip id, n_keyframes) pairs.
+        :return: Tuple containing the first row of every pair's segments, then the packed translation, start rotation,
+        rotation and scale segments.
+        """
+        key = pairs.tobytes()
+        if self.packed_pairs != key:
+            segments = [self.clips[clip_id].get_hermite_segments(int(n)) for clip_id, n in pairs]
+            bases = np.zeros(len(segments), dtype=np.int64)
+            bases[1:] = np.cumsum([len(pair.translations) for pair in segments])[:-1]
+            self.packed_segments = (bases,) + tuple(
+                np.concatenate([getattr(pair, name) for pair in segments])
+                for name in ('translations', 'rotation_starts', 'rotations', 'scales'))
+            self.packed_pairs = key
+        return self.packed_segments
+
+    def allocate(self, n_instances: int) -> np.ndarray:
+        """
+        Allocates a pose buffer in rest pose.
+        :param n_instances: Number of instances.
+        :return: (instances, N, 4, 4) world transforms.
+        """
+        return np.tile(np.asarray(self.skeleton.rest_transforms, dtype=np.float64), (n_instances, 1, 1, 1))
+
+    def advance(self, dt: float, clip_ids: np.ndarray, timestamps: np.ndarray, speeds: np.ndarray) -> np.ndarray:
+        """
+        Advances the playback time of every instance, wrapping around like Model.update.
+        :param dt: Time step.
+        :param clip_ids: (instances,) clip id of every instance.
+        :param timestamps: (instances,) current timestamps.
+        :param speeds: (instances,) playback speeds.
+        :return: (instances,) new timestamps.
+        """
+        lengths = self.durations[clip_ids]
+        timestamps = np.asarray(timestamps, dtype=np.float64) + dt * np.asarray(speeds, dtype=np.float64)
+        return np.where(timestamps >= lengths, 0.0, np.where(timestamps < 0, lengths, timestamps))
+
+    def pose(self, clip_ids: np.ndarray, timestamps: np.ndarray, interpolation_method: str,
+             n_keyframes: Union[int, np.ndarray], world: Optional[np.ndarray] = None,
+             keys: Optional[np.ndarray] = None, trs: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Evaluates the pose of every instance.
+        :param clip_ids: (instances,) clip id of every instance.
+        :param timestamps: (instances,) timestamps.
+        :param interpolation_method: Interpolation method ('linear' or 'hermite').
+        :param n_keyframes: Number of equidistant Keyframes to use for the interpolation, for all or every instance.
+        :param world: (instances, N, 4, 4) pose buffer holding the previous poses, allocated in rest pose if None.
+        Nodes that the clips do not animate keep their previous transforms.
+        :param keys: (instances, SELECTION_SIZE) keyframe cursors of the instances, updated in place so that the next
+        call starts searching from them. Fresh cursors (found by binary search) are used if None.
+        :param trs: (instances, N, TRS_SIZE) buffer receiving the local translation, rotation and scale of the sampled
+        nodes, scratch if None.
+        :return: (instances, N, 4, 4) world transform of every node of every instance.
+        """
+        method = INTERPOLATION_METHODS.get(interpolation_method)
+        if method is None:
+            raise ValueError("Invalid interpolation method: {}".format(interpolation_method))
+
+        clip_ids = np.asarray(clip_ids, dtype=np.int64)
+        n_instances = len(clip_ids)
+        n_keyframes = np.broadcast_to(np.asarray(n_keyframes, dtype=np.int64), (n_instances,))
+        if world is None:
+            world = self.allocate(n_instances)
+        if keys is None:
+            keys = np.zeros((n_instances, SELECTION_SIZE), dtype=np.int64)
+        if trs is None:
+            trs = np.zeros((n_instances, len(self.skeleton), TRS_SIZE), dtype=np.float64)
+
+        # Keyframe index tables of the distinct (clip, n_keyframes) pairs, packed into one array
+        pairs, inverse = np.unique(np.stack((clip_ids, n_keyframes), axis=1), axis=0, return_inverse=True)
+        tables = [self.get_index_table(int(clip_id), int(n)) for clip_id, n in pairs]
+        table_offsets = np.zeros(len(tables) + 1, dtype=np.int64)
+        table_offsets[1:] = np.cumsum([len(table) for table in tables])
+        indices = np.concatenate(tables) if len(tables) > 0 else np.zeros(0, dtype=np.int64)
+        inverse = inverse.reshape(-1)
+
+        if method == LINEAR:
+            bases, translations, rotation_starts, rotations, scales = (
+                np.zeros(len(pairs), dtype=np.int64), np.zeros((0, 4, 3)), np.zeros((0, 4)), np.zeros((0, 3, 3)),
+                np.zeros((0, 4, 3)))
+        else:
+            bases, translations, rotation_starts, rotations, scales = self.pack_hermite_segments(pairs)
+
+        tracks = self.tracks
+        pose_instances(np.asarray(timestamps, dtype=np.float64), method, clip_ids, self.durations,
+                       indices, table_offsets[inverse], table_offsets[inverse + 1], self.clip_starts,
+                       self.root_offsets, self.root_lengths, tracks.nodes,
+                       tracks.translation_times, tracks.translation_values, tracks.translation_offsets,
+                       tracks.translation_lengths, tracks.rotation_times, tracks.rotation_values,
+                       tracks.rotation_offsets, tracks.rotation_lengths, tracks.scale_times, tracks.scale_values,
+                       tracks.scale_offsets, tracks.scale_lengths, bases[inverse], translations, rotation_starts,
+                       rotations, scales, self.skeleton.parents, self.root_transform, keys,
+                       np.zeros((n_instances, 4), dtype=np.float32), trs, world)
+        if len(self.skipped_nodes) > 0:
+            attach_nodes(clip_ids, self.skipped_nodes, self.skeleton.parents, self.skipped_transforms, world)
+        return world
+
+    def blend(self, clip_id: int, source: np.ndarray, target: np.ndarray, weight: float, trs: np.ndarray,
+              world: np.ndarray) -> None:
+        """
+        Blends two local poses of an instance (see blend_trs) and composes its world pose. Only the sampled nodes are
+        blended, the skipped ones are attached to their parents as in pose.
+        :param clip_id: Clip id of the instance.
+        :param source: (N, TRS_SIZE) local pose at weight 0.
+        :param target: (N, TRS_SIZE) local pose at weight 1.
+        :param weight: Blend weight, above 1 to extrapolate.
+        :param trs: (N, TRS_SIZE) local pose of the instance, updated for the sampled nodes.
+        :param world: (N, 4, 4) world transforms of the instance, updated for the sampled and skipped nodes.
+        """
+        nodes = self.clips[clip_id].nodes
+        blend_trs(nodes, source, target, weight, trs)
+        forward_kinematics(nodes, self.skeleton.parents, self.root_transform, trs, world)
+        if len(self.skipped_nodes) > 0:
+            attach_nodes(np.array([clip_id], dtype=np.int64), self.skipped_nodes, self.skeleton.parents,
+                         self.skipped_transforms, world[None])
+
+    def update(self, dt: float, clip_ids: np.ndarray, timestamps: np.ndarray, speeds: np.ndarray,
+               interpolation_method: str, n_keyframes: Union[int, np.ndarray],
+               world: Optional[np.ndarray] = None, keys: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Advances the playback time of every instance and evaluates their poses.
+        :param dt: Time step.
+        :param clip_ids: (instances,) clip id of every instance.
+        :param timestamps: (instances,) current timestamps.
+        :param speeds: (instances,) playback speeds.
+        :param interpolation_method: Interpolation method ('linear' or 'hermite').
+        :param n_keyframes: Number of equidistant Keyframes to use for the interpolation, for all or every instance.
+        :param world: (instances, N, 4, 4) pose buffer holding the previous poses, allocated in rest pose if None.
+        :param keys: (instances, SELECTION_SIZE) keyframe cursors of the instances, updated in place.
+        :return: Tuple containing the new timestamps and the (instances, N, 4, 4) world transforms.
+        """
+        timestamps = self.advance(dt, clip_ids, timestamps, speeds)
+        return timestamps, self.pose(clip_ids, timestamps, interpolation_method, n_keyframes, world, keys)
+
+    def get_sorted_joints(self, world: np.ndarray) -> np.ndarray:
+        """
+        Returns the joint palettes of a batch of poses.
+        :param world: (instances, N, 4, 4) world transforms.
+        :return: (instances, J, 4, 4) arrays of transposed joint matrices, as Animation.get_sorted_joints.
+        """
+        joints = np.empty((len(world), self.skeleton.get_number_of_joints(), 4, 4), dtype=np.float32)
+        build_palettes(world, self.skeleton.joint_nodes, self.skeleton.joint_inverse_binds, joints)
+        return joints
+
+
+def concatenate_clips(clips: List[ClipTracks]) -> ClipTracks:
+    """
+    Concatenates the tracks of several clips, so that the offsets of every track index the concatenated arrays.
+    :param clips: Clip tracks.
+    :return: Concatenated clip tracks.
+    """
+    nodes = np.concatenate([clip.nodes for clip in clips])
+    translations, rotations, scales = [], [], []
+    for clip in clips:
+        translations.extend(split_tracks(clip.translation_times, clip.translation_values, clip.translation_offsets,
+                                         clip.translation_lengths))
+        rotations.extend(split_tracks(clip.rotation_times, clip.rotation_values, clip.rotation_offsets,
+                                      clip.rotation_lengths))
+        scales.extend(split_tracks(clip.scale_times, clip.scale_values, clip.scale_offsets, clip.scale_lengths))
+    return ClipTracks(nodes, translations, rotations, scales)
+
+
+@njit(parallel=True, cache=True)
+def pose_instances(timestamps: np.ndarray, method: int, clip_ids: np.ndarray, durations: np.ndarray,
+                   indices: np.ndarray, index_starts: np.ndarray, index_ends: np.ndarray, clip_starts: np.ndarray,
+                   root_offsets: np.ndarray, root_lengths: np.ndarray, track_nodes: np.ndarray,
+                   translation_times: np.ndarray, translation_values: np.ndarray, translation_offsets: np.ndarray,
+                   translation_lengths: np.ndarray, rotation_times: np.ndarray, rotation_values: np.ndarray,
+                   rotation_offsets: np.ndarray, rotation_lengths: np.ndarray, scale_times: np.ndarray,
+                   scale_values: np.ndarray, scale_offsets: np.ndarray, scale_lengths: np.ndarray,
+                   segment_bases: np.ndarray, translations: np.ndarray, rotation_starts: np.ndarray,
+                   rotations: np.ndarray, scales: np.ndarray, parents: np.ndarray, root_transform: np.ndarray,
+                   keys: np.ndarray, key_times: np.ndarray, trs: np.ndarray, world: np.ndarray) -> None:
+    """
+    Poses every instance, in parallel. Instance i plays clip clip_ids[i] at timestamps[i] and is interpolated with
+    the keyframe indices indices[index_starts[i]:index_ends[i]].
+    :param timestamps: (instances,) timestamps.
+    :param method: Interpolation method code.
+    :param clip_ids: (instances,) clip ids.
+    :param durations: (clips,) clip durations.
+    :param indices: Packed keyframe index tables.
+    :param index_starts: (instances,) start of every instance's index table.
+    :param index_ends: (instances,) end of every instance's index table.
+    :param clip_starts: (clips + 1,) first track of every clip.
+    :param root_offsets: (clips,) offset of every clip's root translation track.
+    :param root_lengths: (clips,) length of every clip's root translation track (0 if the root is not animated).
+    :param track_nodes: Animated node of every track.
+    :param translation_times: Concatenated translation timestamps.
+    :param translation_values: Concatenated translation vectors.
+    :param translation_offsets: Offsets of the translation tracks.
+    :param translation_lengths: Lengths of the translation tracks.
+    :param rotation_times: Concatenated rotation timestamps.
+    :param rotation_values: Concatenated rotation quaternions.
+    :param rotation_offsets: Offsets of the rotation tracks.
+    :param rotation_lengths: Lengths of the rotation tracks.
+    :param scale_times: Concatenated scale timestamps.
+    :param scale_values: Concatenated scale vectors.
+    :param scale_offsets: Offsets of the scale tracks.
+    :param scale_lengths: Lengths of the scale tracks.
+    :param segment_bases: (instances,) first row of every instance's hermite segments (hermite only).
+    :param translations: Packed translation segments (hermite only).
+    :param rotation_starts: Packed start rotations of the segments (hermite only).
+    :param rotations: Packed rotation segments (hermite only).
+    :param scales: Packed scale segments (hermite only).
+    :param parents: (N,) parent index of every node.
+    :param root_transform: Transform of the root's parent.
+    :param keys: (instances, SELECTION_SIZE) keyframe cursors, updated with the new selections.
+    :param key_times: (instances, 4) selected keyframe timestamps scratch buffer.
+    :param trs: (instances, N, TRS_SIZE) local TRS, written for the animated nodes.
+    :param world: (instances, N, 4, 4) world transforms, updated for the animated nodes.
+    """
+    for i in prange(len(clip_ids)):
+        clip = clip_ids[i]
+        start, end = clip_starts[clip], clip_starts[clip + 1]
+        if start == end:
+            continue
+
+        t = timestamps[i] % durations[clip]
+        clip_indices = indices[index_starts[i]: index_ends[i]]
+        root_times = translation_times[root_offsets[clip]: root_offsets[clip] + root_lengths[clip]]
+        select_keyframes(t, method, clip_indices, root_times, keys[i], key_times[i])
+        if method == LINEAR:
+            sample_linear(t, clip_indices, keys[i], track_nodes[start:end], translation_times, translation_values,
+                          translation_offsets[start:end], translation_lengths[start:end], rotation_times,
+                          rotation_values, rotation_offsets[start:end], rotation_lengths[start:end], scale_times,
+                          scale_values, scale_offsets[start:end], scale_lengths[start:end], trs[i])
+        else:
+            sample_hermite(t, keys[i], key_times[i], track_nodes[start:end], len(clip_indices) + 1,
+                           segment_bases[i], translations, rotation_starts, rotations, scales, trs[i])
+        forward_kinematics(track_nodes[start:end], parents, root_transform, trs[i], world[i])
+
+
+@njit(parallel=True, cache=True)
+def attach_nodes(clip_ids: np.ndarray, nodes: np.ndarray, parents: np.ndarray, transforms: np.ndarray,
+                 world: np.ndarray) -> None:
+    """
+    Places nodes at fixed local transforms relative to their parents, in every pose.
+    :param clip_ids: (instances,) clip id of every instance.
+    :param nodes: (S,) nodes to place, parents first. None of them is the root.
+    :param parents: (N,) parent index of every node.
+    :param transforms: (clips, S, 4, 4) local transforms of the nodes in every clip.
+    :param world: (instances, N, 4, 4) world transforms, updated for the nodes.
+    """
+    for i in prange(len(world)):
+        for s in range(len(nodes)):
+            node = nodes[s]
+            parent = parents[node]
+            for row in range(4):
+                for col in range(4):
+                    value = 0.0
+                    for j in range(4):
+                        value += world[i, parent, row, j] * transforms[clip_ids[i], s, j, col]
+                    world[i, node, row, col] = value
+
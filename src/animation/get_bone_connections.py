@@ -1,25 +1,15 @@
-from animation.bone import Bone
-from typing import List, Optional, Tuple
-from pyrr import Matrix44
+from animation.animation import Animation
+from typing import List, Tuple
+import numpy as np
 
 
-def get_bone_connections(bone: Bone, parent_position: Optional[Matrix44] = None) -> List[Tuple[Matrix44, Matrix44]]:
+def get_bone_connections(animation: Animation) -> List[Tuple[np.ndarray, np.ndarray]]:
     """
-    Gets a list of bones that are connected to a given bone.
-    :param bone: Given Bone object.
-    :param parent_position: Position of the parent bone.
-    :return: List of bone connections for a given bone.
+    Gets the line segments connecting every skeleton node to its parent in the current pose of an animation.
+    :param animation: Posed animation.
+    :return: List of (parent position, node position) pairs.
     """
-    bone_connections = []
+    positions = animation.get_node_positions()
+    parents = animation.skeleton.parents
 
-    if bone.local_transform is not None:
-        bone_position = bone.local_transform[:-1, 3]
-
-        if parent_position is not None:
-            bone_connections.append((parent_position, bone_position))
-
-        if bone.children:
-            for child in bone.children:
-                bone_connections.extend(get_bone_connections(child, bone_position))
-
-    return bone_connections
+    return [(positions[parent], positions[i]) for i, parent in enumerate(parents) if parent > -1]
@@ -1,15 +1,41 @@
 import numpy as np
+from typing import Optional
 
 
-class Keyframe:
+class Track:
     """
-    Implements a Keyframe for a given timestamp and vector or quaternion.
+    Keyframes of one animated property, stored as a struct of arrays: a timestamps array and a values array holding
+    the vector (translation or scale) or quaternion (rotation) of every Keyframe.
     """
-    def __init__(self, timestamp: float, value: np.ndarray) -> None:
+    def __init__(self, timestamps: np.ndarray, values: np.ndarray) -> None:
         """
         Constructor.
-        :param timestamp: Timestamp of the Keyframe.
-        :param value: Vector (translation or scale) or quaternion (rotation) of the Keyframe.
+        :param timestamps: (N,) timestamps of the Keyframes.
+        :param values: (N, 3) vectors or (N, 4) quaternions of the Keyframes.
         """
-        self.timestamp = timestamp
-        self.value = value
+        self.timestamps = np.ascontiguousarray(timestamps, dtype=np.float32)
+        self.values = np.ascontiguousarray(values, dtype=np.float32)
+
+    def __len__(self) -> int:
+        """
+        Returns the number of Keyframes of the track.
+        :return: Number of Keyframes.
+        """
+        return len(self.timestamps)
+
+
+class JointChannels:
+    """
+    Keyframes of the animated properties of a single skeleton node in an animation clip.
+    """
+    def __init__(self, translations: Optional[Track] = None, rotations: Optional[Track] = None,
+                 scales: Optional[Track] = None) -> None:
+        """
+        Constructor.
+        :param translations: Translation track, or None if the translation is not animated.
+        :param rotations: Rotation track, or None if the rotation is not animated.
+        :param scales: Scale track, or None if the scale is not animated.
+        """
+        self.translations = translations
+        self.rotations = rotations
+        self.scales = scales
@@ -0,0 +1,118 @@
+import numpy as np
+from animation.keyframe import JointChannels, Track
+from maths import lerp, slerp
+from numba import njit
+
+from typing import Dict, List, Optional, Tuple
+
+CHANNEL_PATHS = ('translations', 'rotations', 'scales')
+
+
+def count_keyframes(channels: Dict[int, JointChannels]) -> int:
+    """
+    Counts the keyframes of all the tracks of a clip.
+    :param channels: Keyframe channels of the clip, by skeleton node index.
+    :return: Total number of keyframes.
+    """
+    return sum(len(getattr(joint_channels, path)) for joint_channels in channels.values() for path in CHANNEL_PATHS
+               if getattr(joint_channels, path) is not None)
+
+
+def reduce_keyframes(channels: Dict[int, JointChannels], tolerance: float,
+                     angular_tolerance: Optional[float] = None) -> Dict[int, JointChannels]:
+    """
+    Removes the keyframes that interpolating their neighbours reproduces within a tolerance, so that the remaining
+    keyframes are spaced according to the motion. Tracks with the same timestamps are reduced together and keep the
+    same timestamps, as the keyframes of every node are selected from the positions of the root's keyframes.
+    :param channels: Keyframe channels of the clip, by skeleton node index.
+    :param tolerance: Largest error of the translations and scales, in model units.
+    :param angular_tolerance: Largest error of the rotations, in radians (tolerance if None).
+    :return: Reduced keyframe channels.
+    """
+    angular_tolerance = tolerance if angular_tolerance is None else angular_tolerance
+    if tolerance <= 0 or angular_tolerance <= 0:
+        raise ValueError("Keyframe reduction tolerances must be positive")
+
+    groups: Dict[bytes, List[Tuple[int, str, Track]]] = {}
+    for node, joint_channels in channels.items():
+        for path in CHANNEL_PATHS:
+            track = getattr(joint_channels, path)
+            if track is not None:
+                groups.setdefault(track.timestamps.tobytes(), []).append((node, path, track))
+
+    reduced = {node: JointChannels() for node in channels}
+    for tracks in groups.values():
+        timestamps = tracks[0][2].timestamps
+        n_keyframes = len(timestamps)
+        vectors = [track.values for _, path, track in tracks if path != 'rotations']
+        rotations = [track.values for _, path, track in tracks if path == 'rotations']
+
+        keep = simplify_tracks(timestamps,
+                               np.stack(vectors) if vectors else np.zeros((0, n_keyframes, 3), dtype=np.float32),
+                               np.stack(rotations) if rotations else np.zeros((0, n_keyframes, 4), dtype=np.float32),
+                               tolerance, angular_tolerance)
+        for node, path, track in tracks:
+            setattr(reduced[node], path, Track(track.timestamps[keep], track.values[keep]))
+
+    return reduced
+
+
+@njit(cache=True)
+def simplify_tracks(timestamps: np.ndarray, vectors: np.ndarray, rotations: np.ndarray, tolerance: float,
+                    angular_tolerance: float) -> np.ndarray:
+    """
+    Selects the keyframes of tracks sharing their timestamps with the Ramer-Douglas-Peucker algorithm: a segment
+    between two kept keyframes is split at its worst keyframe as long as interpolating the segment's ends misses
+    any track's keyframe by more than the tolerance.
+    :param timestamps: (K,) timestamps.
+    :param vectors: (C, K, 3) translation and scale tracks, interpolated linearly.
+    :param rotations: (R, K, 4) rotation tracks, interpolated spherically. The error is the rotation angle between
+    the interpolated and the original quaternions.
+    :param tolerance: Largest error of the vectors.
+    :param angular_tolerance: Largest error of the rotations, in radians.
+    :return: (K,) mask of the kept keyframes.
+    """
+    n_keyframes = len(timestamps)
+    keep = np.zeros(n_keyframes, dtype=np.bool_)
+    if n_keyframes <= 2:
+        keep[:] = True
+        return keep
+    keep[0] = True
+    keep[-1] = True
+
+    segments = np.empty((n_keyframes + 1, 2), dtype=np.int64)
+    segments[0, 0] = 0
+    segments[0, 1] = n_keyframes - 1
+    n_segments = 1
+
+    while n_segments > 0:
+        n_segments -= 1
+        start, end = segments[n_segments, 0], segments[n_segments, 1]
+
+        # Errors are relative to the tolerances, so that a keyframe is needed if its error exceeds 1
+        worst = -1
+        worst_error = 1.0
+        for i in range(start + 1, end):
+            error = 0.0
+            for c in range(vectors.shape[0]):
+                difference = lerp(vectors[c, start], vectors[c, end], timestamps[i], timestamps[start],
+                                  timestamps[end]) - vectors[c, i]
+                error = max(error, np.sqrt(np.sum(difference * difference)) / tolerance)
+            for c in range(rotations.shape[0]):
+                interpolated = slerp(rotations[c, start], rotations[c, end], timestamps[i], timestamps[start],
+                                     timestamps[end])
+                dot = min(abs(np.sum(interpolated * rotations[c, i])), 1.0)
+                error = max(error, 2.0 * np.arccos(dot) / angular_tolerance)
+            if error > worst_error:
+                worst = i
+                worst_error = error
+
+        if worst > -1:
+            keep[worst] = True
+            segments[n_segments, 0] = start
+            segments[n_segments, 1] = worst
+            segments[n_segments + 1, 0] = worst
+            segments[n_segments + 1, 1] = end
+            n_segments += 2
+
+    return keep
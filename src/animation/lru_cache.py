@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+
+from typing import Callable, Dict, Hashable
+
+
+class LRUCache:
+    """
+    Least recently used cache of precomputed animation data, bounded by the memory its entries take. Entries are
+    shared by every instance playing the same clip, and may be requested from several threads at once.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        """
+        Constructor.
+        :param max_bytes: Memory budget of the cache. The most recent entry is always kept, even if it alone exceeds it.
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes: Dict[Hashable, int] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """
+        Returns the number of cached entries.
+        :return: Number of entries.
+        """
+        return len(self.entries)
+
+    def get(self, key: Hashable, build: Callable[[], object]) -> object:
+        """
+        Returns a cached entry, building and caching it on a miss.
+        :param key: Entry key.
+        :param build: Function building the entry. The entry must have an nbytes attribute.
+        :return: Cached entry.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        # Built outside the lock, so that a slow build does not block hits on other entries
+        value = build()
+
+        with self.lock:
+            if key in self.entries:
+                return self.entries[key]
+            self.entries[key] = value
+            self.sizes[key] = value.nbytes
+            self.bytes += value.nbytes
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                evicted, _ = self.entries.popitem(last=False)
+                self.bytes -= self.sizes.pop(evicted)
+        return value
+
+    def get_hit_rate(self) -> float:
+        """
+        Returns the fraction of requests that were served from the cache.
+        :return: Hit rate, 0 if nothing was requested yet.
+        """
+        requests = self.hits + self.misses
+        return self.hits / requests if requests > 0 else 0.0
+
+    def clear(self) -> None:
+        """
+        Removes every entry and resets the statistics.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,701 @@
+import numpy as np
+from animation.keyframe import JointChannels, Track
+from animation.lru_cache import LRUCache
+from animation.skeleton import Skeleton
+from maths import *
+from numba import njit, prange
+
+from typing import Dict, List
+
+# Interpolation method codes used by the compiled kernels
+LINEAR = 0
+HERMITE = 1
+INTERPOLATION_METHODS = {'linear': LINEAR, 'hermite': HERMITE}
+
+# Layout of a row of the local TRS buffer: translation (3), rotation quaternion (4, xyzw), scale (3)
+TRS_SIZE = 10
+
+# Layout of a keyframe selection: index of the root keyframe preceding the timestamp, then the positions i0 to i3 of
+# the selected keyframes in the index table (the interpolated segment is i1-i2, i0 and i3 are the hermite neighbours)
+# and last the position of the root keyframe in the index table. The first and last entries are the cursor the next
+# selection starts searching from
+SELECTION_SIZE = 6
+
+# Number of joint matrices of the skinning uniform array of the base shader (its MAX_BONES). Palette buffers hold at
+# least as many, so that they can be uploaded as they are
+PALETTE_SIZE = 100
+
+# Layouts of the joint matrices in a palette buffer, by number of rows: '4x4' holds the transposed skinning matrices,
+# '3x4' only their first three rows (the last one of an affine matrix is always (0, 0, 0, 1))
+PALETTE_LAYOUTS = {'4x4': 4, '3x4': 3}
+
+# Precomputed hermite segments, by (clip, number of keyframes to use)
+HERMITE_SEGMENTS = LRUCache(64 << 20)
+
+
+class SamplingContext:
+    """
+    Playback state of one posed instance: the keyframes selected for the current timestamp, the scratch buffer of the
+    local transforms, the pose itself and the joint palette of the pose. Every Animation owns its context, so that
+    evaluating a pose never touches state shared with other instances and several instances can be posed concurrently.
+    The palette is rebuilt on demand, once per pose: whatever writes the pose marks it dirty. It is built straight into
+    an upload-ready buffer, padded to PALETTE_SIZE matrices, in the layout the shader reads.
+    """
+
+    def __init__(self, skeleton: Skeleton) -> None:
+        """
+        Constructor.
+        :param skeleton: Skeleton the instance is posed on. The pose starts in rest pose.
+        """
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.index_table_key = None
+        self.keys = np.zeros(SELECTION_SIZE, dtype=np.int64)
+        self.key_times = np.zeros(4, dtype=np.float32)
+        self.trs = np.array(skeleton.rest_trs, dtype=np.float64)
+        self.world = np.array(skeleton.rest_transforms, dtype=np.float64)
+        self.palette = np.zeros((max(skeleton.get_number_of_joints(), PALETTE_SIZE), 4, 4), dtype=np.float32)
+        self.palette_dirty = True
+        # Number of times the palette was rebuilt
+        self.palette_builds = 0
+
+    def set_world(self, world: np.ndarray) -> None:
+        """
+        Replaces the pose, e.g. with one evaluated by a Crowd.
+        :param world: (N, 4, 4) world transforms.
+        """
+        self.world[...] = world
+        self.palette_dirty = True
+
+    def get_nbytes(self) -> int:
+        """
+        Returns the size of the buffers of the context.
+        :return: Size in bytes.
+        """
+        return sum(array.nbytes for array in (self.indices, self.keys, self.key_times, self.trs, self.world,
+                                              self.palette))
+
+    def set_palette_layout(self, layout: str) -> None:
+        """
+        Reallocates the palette buffer if its layout changes.
+        :param layout: Palette layout, one of PALETTE_LAYOUTS.
+        """
+        rows = PALETTE_LAYOUTS.get(layout)
+        if rows is None:
+            raise ValueError("Invalid palette layout: {}".format(layout))
+        if self.palette.shape[1] != rows:
+            self.palette = np.zeros((len(self.palette), rows, 4), dtype=np.float32)
+            self.palette_dirty = True
+
+    def get_indices(self, n_root_keyframes: int, n_keyframes: int) -> np.ndarray:
+        """
+        Returns the indices of the equidistant keyframes used for the interpolation, only recomputing them when the
+        number of keyframes to use changes.
+        :param n_root_keyframes: Number of keyframes of the root's translation track.
+        :param n_keyframes: Number of equidistant Keyframes to use for the interpolation.
+        :return: Keyframe indices.
+        """
+        if self.index_table_key != (n_root_keyframes, n_keyframes):
+            self.indices = np.linspace(0, n_root_keyframes - 1, n_keyframes, dtype=int)
+            self.index_table_key = (n_root_keyframes, n_keyframes)
+        return self.indices
+
+
+class ClipTracks:
+    """
+    Keyframes of the animated nodes of a clip, concatenated into flat arrays that the pose kernel can index. Track k
+    of every channel is the track of node nodes[k] and spans offsets[k]:offsets[k] + lengths[k] of that channel's
+    timestamps and values.
+    """
+
+    def __init__(self, nodes: np.ndarray, translations: List[Track], rotations: List[Track],
+                 scales: List[Track]) -> None:
+        """
+        Constructor.
+        :param nodes: (A,) animated nodes, parents first.
+        :param translations: Translation track of every animated node.
+        :param rotations: Rotation track of every animated node.
+        :param scales: Scale track of every animated node.
+        """
+        self.nodes = np.asarray(nodes, dtype=np.int32)
+        self.translation_times, self.translation_values, self.translation_offsets, self.translation_lengths = \
+            concatenate_tracks(translations, 3)
+        self.rotation_times, self.rotation_values, self.rotation_offsets, self.rotation_lengths = \
+            concatenate_tracks(rotations, 4)
+        self.scale_times, self.scale_values, self.scale_offsets, self.scale_lengths = concatenate_tracks(scales, 3)
+        self.nbytes = sum(array.nbytes for array in (
+            self.nodes, self.translation_times, self.translation_values, self.translation_offsets,
+            self.translation_lengths, self.rotation_times, self.rotation_values, self.rotation_offsets,
+            self.rotation_lengths, self.scale_times, self.scale_values, self.scale_offsets, self.scale_lengths))
+
+    @classmethod
+    def from_channels(cls, nodes: np.ndarray, channels: Dict[int, JointChannels]) -> 'ClipTracks':
+        """
+        Gathers the tracks of the animated nodes of a clip.
+        :param nodes: (A,) animated nodes, parents first. Their translation, rotation and scale must all be animated.
+        :param channels: Keyframe channels of the clip, by skeleton node index.
+        :return: Clip tracks.
+        """
+        return cls(nodes, [channels[i].translations for i in nodes], [channels[i].rotations for i in nodes],
+                   [channels[i].scales for i in nodes])
+
+    def get_root_times(self) -> np.ndarray:
+        """
+        Returns the timestamps of the root's translation track, which drive the keyframe selection of all nodes.
+        :return: Root translation timestamps (empty if the root is not animated).
+        """
+        if len(self.nodes) == 0 or self.nodes[0] != 0:
+            return np.zeros(0, dtype=np.float32)
+        return self.translation_times[:self.translation_lengths[0]]
+
+    def get_hermite_segments(self, n_keyframes: int) -> 'HermiteSegments':
+        """
+        Returns the hermite segments of the clip for a number of keyframes to use, precomputing them on first use.
+        :param n_keyframes: Number of equidistant Keyframes to use for the interpolation.
+        :return: Hermite segments, shared by every instance playing the clip.
+        """
+        return HERMITE_SEGMENTS.get((self, n_keyframes), lambda: HermiteSegments(self, n_keyframes))
+
+    def sample_linear(self, timestamp: float, indices: np.ndarray, keys: np.ndarray, trs: np.ndarray) -> None:
+        """
+        Linearly interpolates the local transforms of the animated nodes between the selected keyframes.
+        :param timestamp: Current timestamp (within the clip's duration).
+        :param indices: Indices of the equidistant keyframes used for the interpolation.
+        :param keys: (SELECTION_SIZE,) keyframe selection, as written by select_keyframes.
+        :param trs: (N, TRS_SIZE) output buffer, written for the animated nodes.
+        """
+        sample_linear(timestamp, indices, keys, self.nodes, self.translation_times, self.translation_values,
+                      self.translation_offsets, self.translation_lengths, self.rotation_times, self.rotation_values,
+                      self.rotation_offsets, self.rotation_lengths, self.scale_times, self.scale_values,
+                      self.scale_offsets, self.scale_lengths, trs)
+
+    def select(self, keep: np.ndarray) -> 'ClipTracks':
+        """
+        Gathers the tracks of a subset of the animated nodes.
+        :param keep: (A,) whether to keep the track of every animated node.
+        :return: Clip tracks of the kept nodes.
+        """
+        keep = np.asarray(keep, dtype=bool)
+        return ClipTracks(self.nodes[keep],
+                          split_tracks(self.translation_times, self.translation_values,
+                                       self.translation_offsets[keep], self.translation_lengths[keep]),
+                          split_tracks(self.rotation_times, self.rotation_values, self.rotation_offsets[keep],
+                                       self.rotation_lengths[keep]),
+                          split_tracks(self.scale_times, self.scale_values, self.scale_offsets[keep],
+                                       self.scale_lengths[keep]))
+
+    def decompress(self) -> 'ClipTracks':
+        """
+        Returns the tracks as floats, which they already are.
+        :return: The tracks themselves.
+        """
+        return self
+
+
+class HermiteSegments:
+    """
+    Per-segment data of the hermite interpolation of a clip, which only depends on the clip and the number of
+    keyframes used: for every animated node and every segment of the equidistant keyframes, the start keyframe of
+    each channel, the (log-)delta to its end keyframe and the tangents at both ends. Row k * n_segments + s holds
+    segment s of track k.
+    """
+
+    def __init__(self, tracks: ClipTracks, n_keyframes: int) -> None:
+        """
+        Constructor.
+        :param tracks: Clip tracks.
+        :param n_keyframes: Number of equidistant Keyframes to use for the interpolation.
+        """
+        root_times = tracks.get_root_times()
+        indices = np.linspace(0, len(root_times) - 1, n_keyframes, dtype=int)
+        n_rows = len(tracks.nodes) * (n_keyframes + 1)
+
+        self.n_segments = n_keyframes + 1
+        self.translations = np.zeros((n_rows, 4, 3), dtype=np.float64)
+        self.rotation_starts = np.zeros((n_rows, 4), dtype=np.float64)
+        self.rotations = np.zeros((n_rows, 3, 3), dtype=np.float64)
+        self.scales = np.zeros((n_rows, 4, 3), dtype=np.float64)
+        build_hermite_segments(indices, root_times, tracks.translation_values, tracks.translation_offsets,
+                               tracks.translation_lengths, tracks.rotation_values, tracks.rotation_offsets,
+                               tracks.rotation_lengths, tracks.scale_values, tracks.scale_offsets,
+                               tracks.scale_lengths, self.translations, self.rotation_starts, self.rotations,
+                               self.scales)
+        self.nbytes = self.translations.nbytes + self.rotation_starts.nbytes + self.rotations.nbytes + \
+            self.scales.nbytes
+
+
+def concatenate_tracks(tracks: List[Track], n_components: int) -> tuple:
+    """
+    Concatenates tracks into flat arrays.
+    :param tracks: Tracks to concatenate.
+    :param n_components: Number of components of the tracks' values.
+    :return: Tuple containing the timestamps, values, offsets and lengths of the tracks.
+    """
+    lengths = np.array([len(track) for track in tracks], dtype=np.int64)
+    offsets = np.zeros(len(tracks), dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)[:-1]
+
+    if len(tracks) == 0:
+        return np.zeros(0, dtype=np.float32), np.zeros((0, n_components), dtype=np.float32), offsets, lengths
+
+    times = np.concatenate([track.timestamps for track in tracks]).astype(np.float32)
+    values = np.concatenate([track.values for track in tracks]).astype(np.float32)
+    return times, values, offsets, lengths
+
+
+def split_tracks(times: np.ndarray, values: np.ndarray, offsets: np.ndarray, lengths: np.ndarray) -> List[Track]:
+    """
+    Splits concatenated tracks back into per-node tracks.
+    :param times: Concatenated timestamps.
+    :param values: Concatenated values.
+    :param offsets: Offset of every track.
+    :param lengths: Length of every track.
+    :return: List of tracks.
+    """
+    return [Track(times[offset: offset + length], values[offset: offset + length])
+            for offset, length in zip(offsets, lengths)]
+
+
+@njit(cache=True, nogil=True)
+def binary_search_keyframe(timestamp: float, timestamps: np.ndarray) -> int:
+    """
+    Finds the closest smallest Keyframe of a given timestamp.
+    :param timestamp: Current timestamp.
+    :param timestamps: List of timestamps for all Keyframes.
+    :return: Index of the closest smallest Keyframe of a given timestamp.
+    """
+    # Find keyframes for given timestamp
+    low = 0
+    high = len(timestamps) - 1
+
+    while low <= high:
+        mid = (high + low) // 2
+        if timestamp > timestamps[mid]:
+            low = mid + 1
+        elif timestamp <= timestamps[mid]:
+            high = mid - 1
+
+    return high
+
+
+@njit(cache=True, nogil=True)
+def is_last_before(values: np.ndarray, target: float, position: int, inclusive: bool) -> bool:
+    """
+    Checks whether a position is the last one of a sorted array whose value is below a target.
+    :param values: Sorted values.
+    :param target: Target value.
+    :param position: Position to check, -1 if no value is below the target.
+    :param inclusive: Whether values equal to the target count as below it.
+    :return: True if values[position] is below the target and the next value is not.
+    """
+    if position < -1 or position >= len(values):
+        return False
+    if position > -1 and (values[position] > target or (values[position] == target and not inclusive)):
+        return False
+    if position < len(values) - 1 and (values[position + 1] < target or (values[position + 1] == target and inclusive)):
+        return False
+    return True
+
+
+@njit(cache=True, nogil=True)
+def seek(values: np.ndarray, target: float, cursor: int, inclusive: bool) -> int:
+    """
+    Finds the last position of a sorted array whose value is below a target, starting from a cursor. Playback moves
+    monotonically, so the previous result or one of its neighbours is nearly always the answer; anything else, such
+    as a jump of the timeline, falls back to a binary search.
+    :param values: Sorted values.
+    :param target: Target value.
+    :param cursor: Previous result.
+    :param inclusive: Whether values equal to the target count as below it.
+    :return: Last position whose value is below the target, -1 if there is none.
+    """
+    for position in (cursor, cursor + 1, cursor - 1):
+        if is_last_before(values, target, position, inclusive):
+            return position
+
+    if inclusive:
+        return np.searchsorted(values, target, side='right') - 1
+    return binary_search_keyframe(target, values)
+
+
+@njit(cache=True, nogil=True)
+def key_index(indices: np.ndarray, i: int, offset: int, length: int) -> int:
+    """
+    Returns the position of a selected keyframe in a concatenated track.
+    :param indices: Keyframe indices used for the interpolation.
+    :param i: Position in indices (negative positions count from the end).
+    :param offset: Offset of the track.
+    :param length: Length of the track.
+    :return: Position in the concatenated arrays.
+    """
+    if i < 0:
+        i += len(indices)
+    return offset + min(indices[i], length - 1)
+
+
+@njit(cache=True, nogil=True)
+def select_keyframes(timestamp: float, method: int, indices: np.ndarray, root_times: np.ndarray, keys: np.ndarray,
+                     key_times: np.ndarray) -> None:
+    """
+    Selects the keyframes to interpolate at a timestamp. They are selected from the root's translation track and
+    used for all the nodes.
+    :param timestamp: Current timestamp (within the clip's duration).
+    :param method: Interpolation method code (LINEAR or HERMITE).
+    :param indices: Indices of the equidistant keyframes used for the interpolation.
+    :param root_times: Timestamps of the root's translation track.
+    :param keys: (SELECTION_SIZE,) keyframe selection, holding the previous selection on input.
+    :param key_times: (4,) output root timestamps of the selected keyframes (hermite only).
+    """
+    n_keyframes = len(indices)
+    index = seek(root_times, timestamp, keys[0], False)
+    position = seek(indices, index, keys[5], True)
+    keys[0] = index
+    keys[5] = position
+
+    if method == LINEAR:
+        keys[2] = max(position, 0)
+        keys[3] = min(keys[2] + 1, n_keyframes - 1)
+        keys[1] = max(keys[2] - 1, 0)
+        keys[4] = min(keys[3] + 1, n_keyframes - 1)
+    else:
+        keys[2] = position
+        keys[1] = max(position - 1, 0)
+        keys[3] = min(position + 1, n_keyframes - 1)
+        keys[4] = min(keys[3] + 1, n_keyframes - 1)
+
+        for j in range(4):
+            key_times[j] = root_times[key_index(indices, keys[1 + j], 0, len(root_times))]
+
+
+@njit(cache=True, nogil=True)
+def sample_linear(timestamp: float, indices: np.ndarray, keys: np.ndarray, track_nodes: np.ndarray,
+                  translation_times: np.ndarray, translation_values: np.ndarray, translation_offsets: np.ndarray,
+                  translation_lengths: np.ndarray, rotation_times: np.ndarray, rotation_values: np.ndarray,
+                  rotation_offsets: np.ndarray, rotation_lengths: np.ndarray, scale_times: np.ndarray,
+                  scale_values: np.ndarray, scale_offsets: np.ndarray, scale_lengths: np.ndarray,
+                  trs: np.ndarray) -> None:
+    """
+    Linearly interpolates the local translation, rotation and scale of every animated node between the selected
+    keyframes.
+    :param timestamp: Current timestamp (within the clip's duration).
+    :param indices: Indices of the equidistant keyframes used for the interpolation.
+    :param keys: (SELECTION_SIZE,) keyframe selection, as written by select_keyframes.
+    :param track_nodes: (A,) animated nodes.
+    :param translation_times: Concatenated translation timestamps.
+    :param translation_values: Concatenated translation vectors.
+    :param translation_offsets: (A,) offsets of the translation tracks.
+    :param translation_lengths: (A,) lengths of the translation tracks.
+    :param rotation_times: Concatenated rotation timestamps.
+    :param rotation_values: Concatenated rotation quaternions.
+    :param rotation_offsets: (A,) offsets of the rotation tracks.
+    :param rotation_lengths: (A,) lengths of the rotation tracks.
+    :param scale_times: Concatenated scale timestamps.
+    :param scale_values: Concatenated scale vectors.
+    :param scale_offsets: (A,) offsets of the scale tracks.
+    :param scale_lengths: (A,) lengths of the scale tracks.
+    :param trs: (N, TRS_SIZE) output buffer, written for the animated nodes.
+    """
+    left = keys[2]
+    right = keys[3]
+
+    for k in range(len(track_nodes)):
+        node = track_nodes[k]
+
+        t1 = key_index(indices, left, translation_offsets[k], translation_lengths[k])
+        t2 = key_index(indices, right, translation_offsets[k], translation_lengths[k])
+        r1 = key_index(indices, left, rotation_offsets[k], rotation_lengths[k])
+        r2 = key_index(indices, right, rotation_offsets[k], rotation_lengths[k])
+        s1 = key_index(indices, left, scale_offsets[k], scale_lengths[k])
+        s2 = key_index(indices, right, scale_offsets[k], scale_lengths[k])
+
+        trs[node, 0:3] = lerp(translation_values[t1], translation_values[t2], timestamp, translation_times[t1],
+                              translation_times[t2])
+        trs[node, 3:7] = slerp(rotation_values[r1], rotation_values[r2], timestamp, rotation_times[r1],
+                               rotation_times[r2])
+        trs[node, 7:10] = lerp(scale_values[s1], scale_values[s2], timestamp, scale_times[s1], scale_times[s2])
+
+
+@njit(cache=True)
+def build_hermite_segments(indices: np.ndarray, root_times: np.ndarray, translation_values: np.ndarray,
+                           translation_offsets: np.ndarray, translation_lengths: np.ndarray,
+                           rotation_values: np.ndarray, rotation_offsets: np.ndarray, rotation_lengths: np.ndarray,
+                           scale_values: np.ndarray, scale_offsets: np.ndarray, scale_lengths: np.ndarray,
+                           translations: np.ndarray, rotation_starts: np.ndarray, rotations: np.ndarray,
+                           scales: np.ndarray) -> None:
+    """
+    Precomputes the hermite segments of every animated node. Segment s starts at position i1 = s - 1 of the index
+    table (the root keyframe may precede the first equidistant keyframe) and uses the same neighbours as
+    select_keyframes.
+    :param indices: Indices of the equidistant keyframes used for the interpolation.
+    :param root_times: Timestamps of the root's translation track.
+    :param translation_values: Concatenated translation vectors.
+    :param translation_offsets: (A,) offsets of the translation tracks.
+    :param translation_lengths: (A,) lengths of the translation tracks.
+    :param rotation_values: Concatenated rotation quaternions.
+    :param rotation_offsets: (A,) offsets of the rotation tracks.
+    :param rotation_lengths: (A,) lengths of the rotation tracks.
+    :param scale_values: Concatenated scale vectors.
+    :param scale_offsets: (A,) offsets of the scale tracks.
+    :param scale_lengths: (A,) lengths of the scale tracks.
+    :param translations: (A * S, 4, 3) output start, delta and tangents of the translations.
+    :param rotation_starts: (A * S, 4) output start rotations.
+    :param rotations: (A * S, 3, 3) output log-delta and tangents of the rotations.
+    :param scales: (A * S, 4, 3) output start, log-delta and tangents of the scales.
+    """
+    n_keyframes = len(indices)
+    n_segments = n_keyframes + 1
+    times = np.zeros(4, dtype=np.float32)
+
+    for segment in range(n_segments):
+        i1 = segment - 1
+        i0 = max(i1 - 1, 0)
+        i2 = min(i1 + 1, n_keyframes - 1)
+        i3 = min(i2 + 1, n_keyframes - 1)
+
+        if len(root_times) > 0:
+            times[0] = root_times[key_index(indices, i0, 0, len(root_times))]
+            times[1] = root_times[key_index(indices, i1, 0, len(root_times))]
+            times[2] = root_times[key_index(indices, i2, 0, len(root_times))]
+            times[3] = root_times[key_index(indices, i3, 0, len(root_times))]
+        timestamp_0, timestamp_1, timestamp_2, timestamp_3 = times[0], times[1], times[2], times[3]
+
+        for k in range(len(translation_offsets)):
+            row = k * n_segments + segment
+
+            p0 = translation_values[key_index(indices, i0, translation_offsets[k], translation_lengths[k])]
+            p1 = translation_values[key_index(indices, i1, translation_offsets[k], translation_lengths[k])]
+            p2 = translation_values[key_index(indices, i2, translation_offsets[k], translation_lengths[k])]
+            p3 = translation_values[key_index(indices, i3, translation_offsets[k], translation_lengths[k])]
+            translations[row, 0] = p1
+            translations[row, 1] = p2 - p1
+            translations[row, 2] = calculate_translation_tangent(p0, p2, timestamp_2, timestamp_0)
+            translations[row, 3] = calculate_translation_tangent(p1, p3, timestamp_3, timestamp_1)
+
+            q0 = rotation_values[key_index(indices, i0, rotation_offsets[k], rotation_lengths[k])]
+            q1 = rotation_values[key_index(indices, i1, rotation_offsets[k], rotation_lengths[k])]
+            q2 = rotation_values[key_index(indices, i2, rotation_offsets[k], rotation_lengths[k])]
+            q3 = rotation_values[key_index(indices, i3, rotation_offsets[k], rotation_lengths[k])]
+            rotation_starts[row] = q1
+            rotations[row, 0] = quat_to_scaled_angle_axis(quat_abs(quat_mult(q2, quat_inv(q1))))
+            rotations[row, 1] = calculate_rotation_tangent(q0, q2, timestamp_2, timestamp_0)
+            rotations[row, 2] = calculate_rotation_tangent(q1, q3, timestamp_3, timestamp_1)
+
+            s0 = scale_values[key_index(indices, i0, scale_offsets[k], scale_lengths[k])]
+            s1 = scale_values[key_index(indices, i1, scale_offsets[k], scale_lengths[k])]
+            s2 = scale_values[key_index(indices, i2, scale_offsets[k], scale_lengths[k])]
+            s3 = scale_values[key_index(indices, i3, scale_offsets[k], scale_lengths[k])]
+            scales[row, 0] = s1
+            scales[row, 1] = np.log(s2 / s1)
+            scales[row, 2] = calculate_scale_tangent(s0, s2, timestamp_2, timestamp_0)
+            scales[row, 3] = calculate_scale_tangent(s1, s3, timestamp_3, timestamp_1)
+
+
+@njit(cache=True, nogil=True)
+def sample_hermite(timestamp: float, keys: np.ndarray, key_times: np.ndarray, track_nodes: np.ndarray,
+                   n_segments: int, base: int, translations: np.ndarray, rotation_starts: np.ndarray,
+                   rotations: np.ndarray, scales: np.ndarray, trs: np.ndarray) -> None:
+    """
+    Interpolates the local translation, rotation and scale of every animated node with precomputed hermite segments,
+    which leaves the cubic polynomial and one quaternion exponential per node.
+    :param timestamp: Current timestamp (within the clip's duration).
+    :param keys: (SELECTION_SIZE,) keyframe selection, as written by select_keyframes.
+    :param key_times: (4,) root timestamps of the selected keyframes.
+    :param track_nodes: (A,) animated nodes.
+    :param n_segments: Number of segments per node.
+    :param base: First row of the clip's segments.
+    :param translations: Translation segments, as built by build_hermite_segments.
+    :param rotation_starts: Start rotations of the segments.
+    :param rotations: Rotation segments.
+    :param scales: Scale segments.
+    :param trs: (N, TRS_SIZE) output buffer, written for the animated nodes.
+    """
+    timestamp_norm = (timestamp - key_times[1]) / (key_times[2] - key_times[1])
+    w1, w2, w3 = return_coefficients(timestamp_norm)
+    segment = keys[2] + 1
+
+    for k in range(len(track_nodes)):
+        node = track_nodes[k]
+        row = base + k * n_segments + segment
+
+        translation = translations[row]
+        trs[node, 0:3] = w1 * translation[1] + w2 * translation[2] + w3 * translation[3] + translation[0]
+
+        rotation = rotations[row]
+        trs[node, 3:7] = quat_mult(vector3_to_quat(w1 * rotation[0] + w2 * rotation[1] + w3 * rotation[2]),
+                                   rotation_starts[row])
+
+        scale = scales[row]
+        trs[node, 7:10] = np.exp(w1 * scale[1] + w2 * scale[2] + w3 * scale[3]) * scale[0]
+
+
+@njit(cache=True, nogil=True)
+def blend_trs(track_nodes: np.ndarray, source: np.ndarray, target: np.ndarray, weight: float,
+              trs: np.ndarray) -> None:
+    """
+    Blends two local poses of the animated nodes: translations and scales linearly, rotations along the shortest arc
+    between them. Weights above 1 extrapolate past the target.
+    :param track_nodes: (A,) animated nodes.
+    :param source: (N, TRS_SIZE) local pose at weight 0.
+    :param target: (N, TRS_SIZE) local pose at weight 1.
+    :param weight: Blend weight.
+    :param trs: (N, TRS_SIZE) output local pose, written for the animated nodes.
+    """
+    for k in range(len(track_nodes)):
+        node = track_nodes[k]
+        for c in range(3):
+            trs[node, c] = source[node, c] + (target[node, c] - source[node, c]) * weight
+            trs[node, 7 + c] = source[node, 7 + c] + (target[node, 7 + c] - source[node, 7 + c]) * weight
+
+        dot = 0.0
+        for c in range(3, 7):
+            dot += source[node, c] * target[node, c]
+        sign = 1.0
+        if dot < 0.0:
+            dot, sign = -dot, -1.0
+
+        if dot < 0.9995:
+            angle = np.arccos(dot)
+            w0 = np.sin(angle * (1.0 - weight)) / np.sin(angle)
+            w1 = sign * np.sin(angle * weight) / np.sin(angle)
+        else:
+            w0, w1 = 1.0 - weight, sign * weight
+
+        norm = 0.0
+        for c in range(3, 7):
+            trs[node, c] = w0 * source[node, c] + w1 * target[node, c]
+            norm += trs[node, c] * trs[node, c]
+        norm = np.sqrt(norm)
+        if norm > 0.0:
+            for c in range(3, 7):
+                trs[node, c] /= norm
+
+
+@njit(cache=True, nogil=True)
+def forward_kinematics(track_nodes: np.ndarray, parents: np.ndarray, root_transform: np.ndarray, trs: np.ndarray,
+                       world: np.ndarray) -> None:
+    """
+    Composes the local transforms of the animated nodes along the hierarchy. Nodes must be sorted parents first.
+    :param track_nodes: (A,) animated nodes.
+    :param parents: (N,) parent index of every node, -1 for the root.
+    :param root_transform: Transform of the root's parent.
+    :param trs: (N, TRS_SIZE) local translation, rotation and scale of every node.
+    :param world: (N, 4, 4) world transforms, updated for the animated nodes.
+    """
+    rotation = np.identity(4)
+    local = np.identity(4)
+
+    for k in range(len(track_nodes)):
+        node = track_nodes[k]
+        from_quaternion(trs[node, 3:7], rotation)
+
+        # local = T @ R @ S
+        for row in range(3):
+            for col in range(3):
+                local[row, col] = rotation[row, col] * trs[node, 7 + col]
+            local[row, 3] = trs[node, row]
+
+        parent = parents[node]
+        for row in range(4):
+            for col in range(4):
+                value = 0.0
+                for i in range(4):
+                    if parent > -1:
+                        value += world[parent, row, i] * local[i, col]
+                    else:
+                        value += root_transform[row, i] * local[i, col]
+                world[node, row, col] = value
+
+
+@njit(cache=True, nogil=True)
+def build_palette(world: np.ndarray, joint_nodes: np.ndarray, inverse_binds: np.ndarray, palette: np.ndarray) -> None:
+    """
+    Writes the skinning matrix world[node] @ inverse_bind of every joint, in joint order, into a palette buffer: either
+    transposed ((P, 4, 4) buffer, the column-major layout of a mat4 uniform) or as its first three rows ((P, 3, 4)
+    buffer, the layout of a mat3x4 uniform). Entries past the joints are left untouched.
+    :param world: (N, 4, 4) world transforms.
+    :param joint_nodes: (J,) node of every joint, -1 for joints left in their bind pose (identity matrix).
+    :param inverse_binds: (J, 4, 4) inverse bind matrices in joint order.
+    :param palette: (P, 4, 4) or (P, 3, 4) float32 buffer, P >= J.
+    """
+    transposed = palette.shape[1] == 4
+
+    for j in range(len(joint_nodes)):
+        node = joint_nodes[j]
+        for row in range(palette.shape[1]):
+            for col in range(4):
+                if node < 0:
+                    value = 1.0 if row == col else 0.0
+                else:
+                    value = 0.0
+                    for i in range(4):
+                        value += world[node, row, i] * inverse_binds[j, i, col]
+                if transposed:
+                    palette[j, col, row] = value
+                else:
+                    palette[j, row, col] = value
+
+
+@njit(parallel=True, cache=True)
+def build_palettes(world: np.ndarray, joint_nodes: np.ndarray, inverse_binds: np.ndarray, palettes: np.ndarray) -> None:
+    """
+    Builds the joint palettes of a batch of poses, as build_palette.
+    :param world: (poses, N, 4, 4) world transforms.
+    :param joint_nodes: (J,) node of every joint, -1 for joints left in their bind pose.
+    :param inverse_binds: (J, 4, 4) inverse bind matrices in joint order.
+    :param palettes: (poses, P, 4, 4) or (poses, P, 3, 4) float32 buffers, P >= J.
+    """
+    for i in prange(len(world)):
+        build_palette(world[i], joint_nodes, inverse_binds, palettes[i])
+
+
+@njit(parallel=True, cache=True)
+def sample_poses(timestamps: np.ndarray, method: int, indices: np.ndarray, root_times: np.ndarray,
+                 track_nodes: np.ndarray, translation_times: np.ndarray, translation_values: np.ndarray,
+                 translation_offsets: np.ndarray, translation_lengths: np.ndarray, rotation_times: np.ndarray,
+                 rotation_values: np.ndarray, rotation_offsets: np.ndarray, rotation_lengths: np.ndarray,
+                 scale_times: np.ndarray, scale_values: np.ndarray, scale_offsets: np.ndarray,
+                 scale_lengths: np.ndarray, n_segments: int, translations: np.ndarray, rotation_starts: np.ndarray,
+                 rotations: np.ndarray, scales: np.ndarray, parents: np.ndarray, root_transform: np.ndarray,
+                 keys: np.ndarray, key_times: np.ndarray, trs: np.ndarray, world: np.ndarray) -> None:
+    """
+    Poses one clip at many timestamps, in parallel. Every pose starts from fresh keyframe cursors, so the timestamps
+    can be in any order.
+    :param timestamps: (T,) timestamps (within the clip's duration).
+    :param method: Interpolation method code.
+    :param indices: Indices of the equidistant keyframes used for the interpolation.
+    :param root_times: Timestamps of the root's translation track.
+    :param track_nodes: (A,) animated nodes.
+    :param translation_times: Concatenated translation timestamps.
+    :param translation_values: Concatenated translation vectors.
+    :param translation_offsets: Offsets of the translation tracks.
+    :param translation_lengths: Lengths of the translation tracks.
+    :param rotation_times: Concatenated rotation timestamps.
+    :param rotation_values: Concatenated rotation quaternions.
+    :param rotation_offsets: Offsets of the rotation tracks.
+    :param rotation_lengths: Lengths of the rotation tracks.
+    :param scale_times: Concatenated scale timestamps.
+    :param scale_values: Concatenated scale vectors.
+    :param scale_offsets: Offsets of the scale tracks.
+    :param scale_lengths: Lengths of the scale tracks.
+    :param n_segments: Number of hermite segments per node (hermite only).
+    :param translations: Translation segments (hermite only).
+    :param rotation_starts: Start rotations of the segments (hermite only).
+    :param rotations: Rotation segments (hermite only).
+    :param scales: Scale segments (hermite only).
+    :param parents: (N,) parent index of every node.
+    :param root_transform: Transform of the root's parent.
+    :param keys: (T, SELECTION_SIZE) keyframe selection scratch buffer, zeroed.
+    :param key_times: (T, 4) selected keyframe timestamps scratch buffer.
+    :param trs: (T, N, TRS_SIZE) local translation, rotation and scale of every node, written for the animated nodes.
+    :param world: (T, N, 4, 4) world transforms, updated for the animated nodes.
+    """
+    for i in prange(len(timestamps)):
+        t = timestamps[i]
+        select_keyframes(t, method, indices, root_times, keys[i], key_times[i])
+        if method == LINEAR:
+            sample_linear(t, indices, keys[i], track_nodes, translation_times, translation_values,
+                          translation_offsets, translation_lengths, rotation_times, rotation_values, rotation_offsets,
+                          rotation_lengths, scale_times, scale_values, scale_offsets, scale_lengths, trs[i])
+        else:
+            sample_hermite(t, keys[i], key_times[i], track_nodes, n_segments, 0, translations, rotation_starts,
+                           rotations, scales, trs[i])
+        forward_kinematics(track_nodes, parents, root_transform, trs[i], world[i])
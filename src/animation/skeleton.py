@@ -0,0 +1,131 @@
+import numpy as np
+
+from typing import List, Optional
+
+
+class Skeleton:
+    """
+    Joint hierarchy of a skin. It is built once per loaded file and shared, read-only, by every animation clip of
+    the file and by every model instance using it. The hierarchy is stored flat: nodes are sorted in depth-first
+    order, so that every parent comes before its children, and the tree is described by an array of parent indices.
+    Clips refer to nodes by their index in that order, so that poses can be evaluated with linear sweeps over arrays.
+    """
+
+    def __init__(self, names: List[str], parents: np.ndarray, joint_indices: np.ndarray, rest_transforms: np.ndarray,
+                 inverse_binds: np.ndarray, root_transform: Optional[np.ndarray] = None) -> None:
+        """
+        Constructor.
+        :param names: Node names.
+        :param parents: (N,) index of each node's parent, -1 for the root.
+        :param joint_indices: (N,) index of each node in the skin's joint list, -1 if the node is not a joint.
+        :param rest_transforms: (N, 4, 4) rest transforms.
+        :param inverse_binds: (N, 4, 4) inverse bind matrices (ignored for nodes that are not joints).
+        :param root_transform: Transform of the root's parent node, if any.
+        """
+        self.names = list(names)
+        self.parents = read_only(parents)
+        self.joint_indices = read_only(joint_indices)
+        self.rest_transforms = read_only(rest_transforms)
+        self.inverse_binds = read_only(inverse_binds)
+        self.root_transform = read_only(root_transform) if root_transform is not None else None
+
+        # Remap from joint index (as used by the vertices' JOINTS_0 attribute) to node index, -1 for joints that are
+        # not part of the hierarchy below the root
+        n_joints = int(self.joint_indices.max()) + 1 if len(self.joint_indices) > 0 else 0
+        joint_nodes = np.full(n_joints, -1, dtype=np.int32)
+        is_joint = self.joint_indices > -1
+        joint_nodes[self.joint_indices[is_joint]] = np.flatnonzero(is_joint)
+        self.joint_nodes = read_only(joint_nodes)
+
+        # (J, 4, 4) inverse bind matrices in joint order, stacked for the palette kernel. inverse_binds holds them as
+        # read from the column-major accessor, i.e. transposed
+        joint_inverse_binds = np.zeros((n_joints, 4, 4), dtype=self.inverse_binds.dtype)
+        joint_inverse_binds[self.joint_indices[is_joint]] = self.inverse_binds[is_joint]
+        self.joint_inverse_binds = read_only(np.ascontiguousarray(joint_inverse_binds.transpose(0, 2, 1)))
+
+        # (N, 10) rest translation, rotation (xyzw quaternion) and scale, for the nodes a clip does not animate
+        self.rest_trs = read_only(decompose_transforms(self.rest_transforms))
+        self.nbytes = sum(array.nbytes for array in (
+            self.parents, self.joint_indices, self.rest_transforms, self.inverse_binds, self.joint_nodes,
+            self.joint_inverse_binds, self.rest_trs))
+        self.nbytes += self.root_transform.nbytes if self.root_transform is not None else 0
+
+    def __len__(self) -> int:
+        """
+        Returns the number of nodes of the skeleton.
+        :return: Number of nodes.
+        """
+        return len(self.names)
+
+    def get_number_of_joints(self) -> int:
+        """
+        Returns the number of joints, i.e. the size of the joint palette.
+        :return: Number of joints.
+        """
+        return len(self.joint_nodes)
+
+    def get_leaf_nodes(self, max_length: int) -> np.ndarray:
+        """
+        Finds the nodes ending the hierarchy, such as finger tips, face joints and end joints: the last nodes of the
+        unbranched chains leading to a leaf.
+        :param max_length: Largest number of nodes taken from the end of a chain.
+        :return: Indices of the leaf nodes, parents first.
+        """
+        n_children = np.bincount(self.parents[self.parents > -1], minlength=len(self))
+        height = np.zeros(len(self), dtype=np.int64)
+        chain = n_children == 0
+
+        # Children come after their parents, so a reverse sweep visits every child before its parent
+        for i in range(len(self) - 1, 0, -1):
+            parent = self.parents[i]
+            height[parent] = max(height[parent], height[i] + 1)
+            if n_children[parent] == 1:
+                chain[parent] = chain[i]
+
+        return np.flatnonzero(chain & (height < max_length) & (self.parents > -1))
+
+
+def decompose_transforms(matrices: np.ndarray) -> np.ndarray:
+    """
+    Splits affine transforms into translation, rotation and scale, such that matrix = T @ R @ S. A mirroring
+    transform gets a negative x scale.
+    :param matrices: (N, 4, 4) transforms.
+    :return: (N, 10) translation, rotation (xyzw quaternion) and scale.
+    """
+    matrices = np.asarray(matrices, dtype=np.float64)
+    trs = np.zeros((len(matrices), 10), dtype=np.float64)
+    trs[:, :3] = matrices[:, :3, 3]
+
+    scales = np.linalg.norm(matrices[:, :3, :3], axis=1)
+    scales[np.linalg.det(matrices[:, :3, :3]) < 0, 0] *= -1
+    trs[:, 7:10] = scales
+
+    for i, m in enumerate(matrices[:, :3, :3] / np.where(scales != 0, scales, 1)[:, None, :]):
+        # Largest of the four components first, for precision (Shepperd's method)
+        trace = m[0, 0] + m[1, 1] + m[2, 2]
+        if trace > 0:
+            w = np.sqrt(1.0 + trace) * 2
+            quaternion = ((m[2, 1] - m[1, 2]) / w, (m[0, 2] - m[2, 0]) / w, (m[1, 0] - m[0, 1]) / w, w / 4)
+        elif m[0, 0] > m[1, 1] and m[0, 0] > m[2, 2]:
+            x = np.sqrt(1.0 + m[0, 0] - m[1, 1] - m[2, 2]) * 2
+            quaternion = (x / 4, (m[0, 1] + m[1, 0]) / x, (m[0, 2] + m[2, 0]) / x, (m[2, 1] - m[1, 2]) / x)
+        elif m[1, 1] > m[2, 2]:
+            y = np.sqrt(1.0 + m[1, 1] - m[0, 0] - m[2, 2]) * 2
+            quaternion = ((m[0, 1] + m[1, 0]) / y, y / 4, (m[1, 2] + m[2, 1]) / y, (m[0, 2] - m[2, 0]) / y)
+        else:
+            z = np.sqrt(1.0 + m[2, 2] - m[0, 0] - m[1, 1]) * 2
+            quaternion = ((m[0, 2] + m[2, 0]) / z, (m[1, 2] + m[2, 1]) / z, z / 4, (m[1, 0] - m[0, 1]) / z)
+        trs[i, 3:7] = quaternion
+    trs[:, 3:7] /= np.linalg.norm(trs[:, 3:7], axis=1, keepdims=True)
+    return trs
+
+
+def read_only(array: np.ndarray) -> np.ndarray:
+    """
+    Returns a read-only view of an array.
+    :param array: Input array.
+    :return: View of the array that cannot be written to.
+    """
+    view = np.asarray(array).view()
+    view.flags.writeable = False
+    return view
@@ -0,0 +1,161 @@
+import numpy as np
+from animation.animation import Animation
+from animation.pose import build_palettes
+from numba import njit, prange
+
+from typing import Optional, Tuple
+
+# Number of joint influences per vertex (JOINTS_0 / WEIGHTS_0)
+MAX_INFLUENCES = 4
+
+
+def is_skinned(joint_weights: np.ndarray) -> bool:
+    """
+    Checks whether vertices are bound to joints. Primitives without JOINTS_0/WEIGHTS_0 are decoded with -1 indices
+    and zero weights.
+    :param joint_weights: (V, 4) joint weights (WEIGHTS_0).
+    :return: True if any vertex has a non-zero joint weight.
+    """
+    return bool(np.any(joint_weights))
+
+
+def skin(positions: np.ndarray, normals: np.ndarray, joint_indices: np.ndarray, joint_weights: np.ndarray,
+         palettes: np.ndarray, n_joints: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Skins the vertices of a mesh primitive on the CPU, for one or several poses. Positions follow the linear blend
+    skinning of the base shader; normals, which the shader does not skin, are transformed by the blended
+    inverse-transpose of the joint matrices.
+    :param positions: (V, 3) vertex positions, as decoded by GLTFLoader.
+    :param normals: (V, 3) vertex normals.
+    :param joint_indices: (V, 4) joint indices (JOINTS_0).
+    :param joint_weights: (V, 4) joint weights (WEIGHTS_0).
+    :param palettes: (J, 4, 4) joint palette, or (T, J, 4, 4) palettes of T poses, as built by
+    Animation.get_sorted_joints (transposed joint matrices).
+    :param n_joints: Number of joints the shader is told about (numBones), at most the palette size (the default).
+    Influences from a joint index past it end the vertex's influences, as in the shader.
+    :return: Tuple containing the skinned positions and normals, (V, 3) or (T, V, 3) float32 arrays in the space of
+    the mesh (the model matrix is not applied).
+    """
+    if not is_skinned(joint_weights):
+        raise ValueError("The primitive is not skinned")
+
+    palettes = np.asarray(palettes, dtype=np.float32)
+    single = palettes.ndim == 3
+    if single:
+        palettes = palettes[None]
+
+    if n_joints is None:
+        n_joints = palettes.shape[1]
+    elif n_joints > palettes.shape[1]:
+        raise ValueError("n_joints ({}) exceeds the palette size ({})".format(n_joints, palettes.shape[1]))
+
+    n_poses, n_vertices = len(palettes), len(positions)
+    skinned_positions = np.empty((n_poses, n_vertices, 3), dtype=np.float32)
+    skinned_normals = np.empty((n_poses, n_vertices, 3), dtype=np.float32)
+    skin_vertices(np.ascontiguousarray(positions, dtype=np.float32), np.ascontiguousarray(normals, dtype=np.float32),
+                  np.ascontiguousarray(joint_indices, dtype=np.int32),
+                  np.ascontiguousarray(joint_weights, dtype=np.float32), palettes, n_joints, skinned_positions,
+                  skinned_normals)
+
+    if single:
+        return skinned_positions[0], skinned_normals[0]
+    return skinned_positions, skinned_normals
+
+
+def stream_skinned_poses(animation: Animation, positions: np.ndarray, normals: np.ndarray, joint_indices: np.ndarray,
+                         joint_weights: np.ndarray, timestamps: np.ndarray, interpolation_method: str,
+                         n_keyframes: int, file_path: str, chunk_size: int = 256) -> None:
+    """
+    Skins a mesh primitive over many timestamps of a clip and writes the results to .npy files, chunk by chunk, so
+    that long clips never hold more than chunk_size poses in memory: <file_path>_positions.npy and
+    <file_path>_normals.npy, both (T, V, 3) float32 arrays.
+    :param animation: Clip the primitive's skin is posed with.
+    :param positions: (V, 3) vertex positions.
+    :param normals: (V, 3) vertex normals.
+    :param joint_indices: (V, 4) joint indices (JOINTS_0).
+    :param joint_weights: (V, 4) joint weights (WEIGHTS_0).
+    :param timestamps: (T,) timestamps.
+    :param interpolation_method: Interpolation method ('linear' or 'hermite').
+    :param n_keyframes: Number of equidistant Keyframes to use for the interpolation.
+    :param file_path: Output path, without suffix and extension.
+    :param chunk_size: Number of poses skinned at once.
+    """
+    skeleton = animation.skeleton
+    shape = (len(timestamps), len(positions), 3)
+    positions_file = np.lib.format.open_memmap(file_path + '_positions.npy', mode='w+', dtype=np.float32,
+                                               shape=shape)
+    normals_file = np.lib.format.open_memmap(file_path + '_normals.npy', mode='w+', dtype=np.float32, shape=shape)
+
+    for start in range(0, len(timestamps), chunk_size):
+        world = animation.sample_poses(timestamps[start:start + chunk_size], interpolation_method, n_keyframes)
+        palettes = np.empty((len(world), skeleton.get_number_of_joints(), 4, 4), dtype=np.float32)
+        build_palettes(world, skeleton.joint_nodes, skeleton.joint_inverse_binds, palettes)
+        positions_file[start:start + len(world)], normals_file[start:start + len(world)] = \
+            skin(positions, normals, joint_indices, joint_weights, palettes)
+
+    positions_file.flush()
+    normals_file.flush()
+
+
+@njit(parallel=True, cache=True)
+def skin_vertices(positions: np.ndarray, normals: np.ndarray, joint_indices: np.ndarray, joint_weights: np.ndarray,
+                  palettes: np.ndarray, n_joints: int, skinned_positions: np.ndarray,
+                  skinned_normals: np.ndarray) -> None:
+    """
+    Skins every vertex in every pose, in parallel over (pose, vertex) pairs. Positions follow the base shader: the
+    sum of the weighted joint matrices applied to the vertex, skipping -1 indices and stopping at the first index
+    past n_joints. Normals are transformed by the weighted sum of the cofactor matrices of the joints' 3x3 parts (their
+    inverse-transpose, up to the determinant), which keeps them perpendicular to the surface under non-uniform
+    scale, and renormalized.
+    :param positions: (V, 3) vertex positions.
+    :param normals: (V, 3) vertex normals.
+    :param joint_indices: (V, 4) joint indices.
+    :param joint_weights: (V, 4) joint weights.
+    :param palettes: (T, J, 4, 4) transposed joint matrices.
+    :param n_joints: Number of valid joints, at most J.
+    :param skinned_positions: (T, V, 3) output positions.
+    :param skinned_normals: (T, V, 3) output normals.
+    """
+    n_vertices = len(positions)
+    for k in prange(len(palettes) * n_vertices):
+        pose = k // n_vertices
+        v = k % n_vertices
+        x, y, z = positions[v, 0], positions[v, 1], positions[v, 2]
+        nx, ny, nz = normals[v, 0], normals[v, 1], normals[v, 2]
+
+        px = py = pz = 0.0
+        qx = qy = qz = 0.0
+        for i in range(MAX_INFLUENCES):
+            joint = joint_indices[v, i]
+            if joint == -1:
+                continue
+            if joint >= n_joints:
+                break
+            # Column c of the joint matrix is palette[c]: m[c, r] is the element at row r, column c
+            m = palettes[pose, joint]
+            weight = joint_weights[v, i]
+            px += weight * (m[0, 0] * x + m[1, 0] * y + m[2, 0] * z + m[3, 0])
+            py += weight * (m[0, 1] * x + m[1, 1] * y + m[2, 1] * z + m[3, 1])
+            pz += weight * (m[0, 2] * x + m[1, 2] * y + m[2, 2] * z + m[3, 2])
+
+            # Cofactor matrix of the 3x3 part, row by row
+            qx += weight * ((m[1, 1] * m[2, 2] - m[2, 1] * m[1, 2]) * nx +
+                            (m[2, 1] * m[0, 2] - m[0, 1] * m[2, 2]) * ny +
+                            (m[0, 1] * m[1, 2] - m[1, 1] * m[0, 2]) * nz)
+            qy += weight * ((m[1, 2] * m[2, 0] - m[2, 2] * m[1, 0]) * nx +
+                            (m[2, 2] * m[0, 0] - m[0, 2] * m[2, 0]) * ny +
+                            (m[0, 2] * m[1, 0] - m[1, 2] * m[0, 0]) * nz)
+            qz += weight * ((m[1, 0] * m[2, 1] - m[2, 0] * m[1, 1]) * nx +
+                            (m[2, 0] * m[0, 1] - m[0, 0] * m[2, 1]) * ny +
+                            (m[0, 0] * m[1, 1] - m[1, 0] * m[0, 1]) * nz)
+
+        skinned_positions[pose, v, 0] = px
+        skinned_positions[pose, v, 1] = py
+        skinned_positions[pose, v, 2] = pz
+
+        length = np.sqrt(qx * qx + qy * qy + qz * qz)
+        if length > 0.0:
+            qx, qy, qz = qx / length, qy / length, qz / length
+        skinned_normals[pose, v, 0] = qx
+        skinned_normals[pose, v, 1] = qy
+        skinned_normals[pose, v, 2] = qz
@@ -0,0 +1,114 @@
+"""
+Compares compressed and uncompressed clips: bytes per clip, linear sampling throughput and the largest error of the
+posed node positions. Run from the src directory:
+
+    python -m benchmarks.clip_compression [file.gltf ...]
+
+Without files, a synthetic 60-node, 120 Hz clip is used.
+"""
+import sys
+import time
+
+import numpy as np
+from animation.animation import Animation
+from animation.keyframe import JointChannels, Track
+from animation.skeleton import Skeleton
+
+from typing import List
+
+N_POSES = 2000
+
+
+def synthetic_clips() -> List[Animation]:
+    """
+    Creates a mocap-like clip: smooth rotations and root motion, constant bone lengths and scales.
+    :return: List containing the clip.
+    """
+    rng = np.random.default_rng(0)
+    n_nodes, n_keyframes, rate = 60, 1200, 120.0
+    timestamps = np.arange(n_keyframes) / rate
+    parents = np.array([-1] + [int(rng.integers(0, i)) for i in range(1, n_nodes)])
+    skeleton = Skeleton([f'node{i}' for i in range(n_nodes)], parents, np.arange(n_nodes),
+                        np.tile(np.identity(4), (n_nodes, 1, 1)), np.tile(np.identity(4), (n_nodes, 1, 1)))
+
+    channels = {}
+    for node in range(n_nodes):
+        axis = rng.normal(size=3)
+        axis /= np.linalg.norm(axis)
+        angle = rng.uniform(0.2, 1.5) * np.sin(2 * np.pi * rng.uniform(0.2, 1.0) * timestamps + rng.uniform(0, 6))
+        rotations = np.concatenate((axis[None] * np.sin(angle / 2)[:, None], np.cos(angle / 2)[:, None]), axis=1)
+        if node == 0:
+            translations = np.stack((timestamps * 1.5, 0.05 * np.sin(4 * np.pi * timestamps), np.zeros(n_keyframes)),
+                                    axis=1)
+        else:
+            translations = np.tile(rng.uniform(-0.3, 0.3, 3), (n_keyframes, 1))
+        channels[node] = JointChannels(Track(timestamps, translations), Track(timestamps, rotations),
+                                       Track(timestamps, np.ones((n_keyframes, 3))))
+
+    return [Animation('synthetic', float(timestamps[-1]), skeleton, channels)]
+
+
+def load_clips(file_paths: List[str]) -> List[Animation]:
+    """
+    Decodes the clips of gltf files, without a GL context.
+    :param file_paths: Gltf files.
+    :return: Clips of the files.
+    """
+    from loaders.GltfLoader import GLTFLoader
+    from loaders.GltfLoader.gltf_loader_animation import get_joint_channels, get_skeleton
+
+    clips = []
+    for file_path in file_paths:
+        asset = GLTFLoader.decode(file_path)
+        if asset.skeleton is None:
+            continue
+        skeleton = get_skeleton(asset.skeleton)
+        clips.extend(Animation(data.name, data.duration, skeleton, get_joint_channels(data))
+                     for data in asset.animations)
+    return clips
+
+
+def time_poses(animation: Animation, timestamps: np.ndarray, n_keyframes: int) -> float:
+    """
+    Measures the linear sampling throughput of a clip.
+    :param animation: Clip.
+    :param timestamps: Timestamps to pose.
+    :param n_keyframes: Number of equidistant Keyframes to use for the interpolation.
+    :return: Poses per second.
+    """
+    animation.set_pose(timestamps[0], 'linear', n_keyframes)
+    start = time.perf_counter()
+    for timestamp in timestamps:
+        animation.set_pose(timestamp, 'linear', n_keyframes)
+    return len(timestamps) / (time.perf_counter() - start)
+
+
+def main(file_paths: List[str]) -> None:
+    """
+    Runs the benchmark.
+    :param file_paths: Gltf files, synthetic clips if empty.
+    """
+    clips = load_clips(file_paths) if file_paths else synthetic_clips()
+
+    print(f"{'clip':<24}{'float bytes':>12}{'packed bytes':>14}{'ratio':>7}{'float poses/s':>15}"
+          f"{'packed poses/s':>16}{'max error':>11}")
+    for clip in clips:
+        compressed = clip.copy()
+        compressed.compress()
+        n_keyframes = clip.get_number_of_keyframes()
+        timestamps = np.linspace(0, clip.duration, N_POSES, endpoint=False)
+
+        error = 0.0
+        for timestamp in timestamps[::10]:
+            clip.set_pose(timestamp, 'linear', n_keyframes)
+            compressed.set_pose(timestamp, 'linear', n_keyframes)
+            error = max(error, float(np.abs(clip.get_node_positions() - compressed.get_node_positions()).max()))
+
+        print(f"{clip.name[:23]:<24}{clip.tracks.nbytes:>12}{compressed.tracks.nbytes:>14}"
+              f"{clip.tracks.nbytes / compressed.tracks.nbytes:>7.1f}"
+              f"{time_poses(clip, timestamps, n_keyframes):>15.0f}"
+              f"{time_poses(compressed, timestamps, n_keyframes):>16.0f}{error:>11.2e}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,100 @@
+"""
+Measures the CPU linear blend skinning throughput, in skinned vertices per second, for single poses and batches of
+poses. Run from the src directory:
+
+    python -m benchmarks.skinning [file.gltf ...]
+
+Without files, a synthetic 100k-vertex, 60-joint mesh is used.
+"""
+import sys
+import time
+
+import numpy as np
+from animation.pose import build_palettes
+from animation.skinning import MAX_INFLUENCES, skin
+
+from typing import List, Tuple
+
+N_POSES = 64
+N_REPEATS = 5
+
+
+def synthetic_meshes() -> List[Tuple[str, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Creates a mesh skinned to random joints and a batch of random rigid joint palettes.
+    :return: List containing the name, positions, normals, joint indices, joint weights and (T, J, 4, 4) palettes.
+    """
+    rng = np.random.default_rng(0)
+    n_vertices, n_joints = 100000, 60
+    positions = rng.normal(size=(n_vertices, 3)).astype(np.float32)
+    normals = positions / np.linalg.norm(positions, axis=1, keepdims=True)
+    joint_indices = rng.integers(0, n_joints, size=(n_vertices, MAX_INFLUENCES)).astype(np.int32)
+    joint_weights = rng.uniform(size=(n_vertices, MAX_INFLUENCES)).astype(np.float32)
+    joint_weights /= joint_weights.sum(axis=1, keepdims=True)
+
+    angles = rng.uniform(-np.pi, np.pi, size=(N_POSES, n_joints))
+    matrices = np.tile(np.identity(4), (N_POSES, n_joints, 1, 1))
+    matrices[..., 0, 0] = matrices[..., 1, 1] = np.cos(angles)
+    matrices[..., 0, 1] = -np.sin(angles)
+    matrices[..., 1, 0] = np.sin(angles)
+    matrices[..., :3, 3] = rng.normal(size=(N_POSES, n_joints, 3))
+    palettes = matrices.transpose(0, 1, 3, 2).astype(np.float32)
+    return [('synthetic', positions, normals, joint_indices, joint_weights, palettes)]
+
+
+def load_meshes(file_paths: List[str]) -> List[Tuple[str, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Decodes the skinned primitives of gltf files, without a GL context, with the palettes of their first clip.
+    :param file_paths: Gltf files.
+    :return: List containing the name, positions, normals, joint indices, joint weights and (T, J, 4, 4) palettes of
+    every skinned primitive.
+    """
+    from loaders.GltfLoader import GLTFLoader
+
+    loader = GLTFLoader(None, cache_dir=None)
+    meshes = []
+    for file_path in file_paths:
+        asset = loader.decode(file_path)
+        animations = loader.get_animations(asset)
+        if len(animations) == 0:
+            continue
+
+        animation = animations[0]
+        skeleton = animation.skeleton
+        timestamps = np.linspace(0, animation.duration, N_POSES, endpoint=False)
+        world = animation.sample_poses(timestamps, 'linear', animation.get_number_of_keyframes())
+        palettes = np.empty((N_POSES, skeleton.get_number_of_joints(), 4, 4), dtype=np.float32)
+        build_palettes(world, skeleton.joint_nodes, skeleton.joint_inverse_binds, palettes)
+
+        for p, primitive in enumerate(asset.primitives):
+            if primitive.is_skinned():
+                meshes.append((f'{file_path}#{p}', primitive.positions, primitive.normals, primitive.joint_indices,
+                               primitive.joint_weights, palettes))
+    return meshes
+
+
+def main(file_paths: List[str]) -> None:
+    """
+    Runs the benchmark.
+    :param file_paths: Gltf files, synthetic mesh if empty.
+    """
+    meshes = load_meshes(file_paths) if file_paths else synthetic_meshes()
+
+    print(f"{'mesh':<32}{'vertices':>10}{'joints':>8}{'1 pose vert/s':>16}{f'{N_POSES} poses vert/s':>18}")
+    for name, positions, normals, joint_indices, joint_weights, palettes in meshes:
+        skin(positions, normals, joint_indices, joint_weights, palettes[:1])
+
+        start = time.perf_counter()
+        for repeat in range(N_REPEATS):
+            skin(positions, normals, joint_indices, joint_weights, palettes[repeat % N_POSES])
+        single = N_REPEATS * len(positions) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        skin(positions, normals, joint_indices, joint_weights, palettes)
+        batch = N_POSES * len(positions) / (time.perf_counter() - start)
+
+        print(f"{name[-31:]:<32}{len(positions):>10}{palettes.shape[1]:>8}{single:>16.3g}{batch:>18.3g}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
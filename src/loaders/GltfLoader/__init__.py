@@ -2,12 +2,60 @@ from render.shaders import Shaders
 from loaders.loader import Loader
 from pygltflib import *
 import numpy as np
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from loaders.GltfLoader.gltf_loader_asset import GltfAsset, PrimitiveData
+from loaders.GltfLoader.gltf_loader_buffers import BufferStore
+from loaders.GltfLoader.gltf_loader_cache import AssetCache
+from loaders.GltfLoader.gltf_loader_vertices import VERTEX_ATTRIBUTES, VERTEX_FORMATS, VERTEX_PROGRAMS, pack_vertices
 from loaders.GltfLoader.gltf_loader_helpers import *
 from loaders.GltfLoader.gltf_loader_animation import *
 from PIL import Image
 import io
 import animation.animation as a
+from animation.keyframe_reduction import count_keyframes, reduce_keyframes
+from animation.pose import PALETTE_LAYOUTS
 from moderngl import VertexArray, Texture, Program
+from typing import Dict, Iterator
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), '../../../resources/cache')
+
+
+def decode_image(data: memoryview) -> np.ndarray:
+    """
+    Decodes an encoded (png, jpeg, ...) image.
+    :param data: Encoded image data.
+    :return: (H, W, C) pixels with 3 or 4 components.
+    """
+    img = Image.open(io.BytesIO(data))
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    return np.asarray(img)
+
+
+def decode_images(buffers: BufferStore, image_indices: List[int]) -> Dict[int, np.ndarray]:
+    """
+    Decodes a set of images of a gltf file. Distinct images are decoded in parallel threads, since PIL releases the
+    GIL while decoding.
+    :param buffers: Buffer store of the gltf file.
+    :param image_indices: Indices of the images to decode.
+    :return: Dictionary mapping image indices to their (H, W, C) pixels.
+    """
+    encoded = []
+    for image_index in image_indices:
+        image = buffers.gltf.images[image_index]
+        if image.uri is None:
+            encoded.append(get_image_data(buffers, image.bufferView))
+        else:
+            encoded.append(buffers.read_uri(image.uri))
+
+    max_workers = min(len(encoded), os.cpu_count() or 1)
+    if max_workers <= 1:
+        return {image_index: decode_image(data) for image_index, data in zip(image_indices, encoded)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(zip(image_indices, pool.map(decode_image, encoded)))
 
 
 class GLTFLoader(Loader):
@@ -15,105 +63,263 @@ class GLTFLoader(Loader):
     Helper class for loading gltf files.
     """
 
+    def __init__(self, app, cache_dir: Optional[str] = DEFAULT_CACHE_DIR, vertex_format: str = 'float',
+                 keyframe_tolerance: Optional[float] = None, compress_clips: bool = False,
+                 palette_layout: str = '4x4') -> None:
+        """
+        Constructor.
+        :param app: Glw app.
+        :param cache_dir: Directory of the decoded asset cache, or None to always decode the gltf files.
+        :param vertex_format: Vertex layout of the uploaded meshes ('float', 'compact' or 'compact16').
+        :param keyframe_tolerance: Error tolerance of the keyframe reduction of the clips (in model units for
+        translations and scales, in radians for rotations), or None to keep every keyframe.
+        :param compress_clips: Whether to store the keyframes of the clips quantized.
+        :param palette_layout: Layout of the joint matrices read by the meshes' program ('4x4', or '3x4' to upload
+        25% less per draw).
+        """
+        super().__init__(app)
+        if vertex_format not in VERTEX_FORMATS:
+            raise ValueError("Invalid vertex format: {}".format(vertex_format))
+        self.vertex_format = vertex_format
+        if palette_layout not in PALETTE_LAYOUTS:
+            raise ValueError("Invalid palette layout: {}".format(palette_layout))
+        self.palette_layout = palette_layout
+        self.keyframe_tolerance = keyframe_tolerance
+        self.compress_clips = compress_clips
+        self.cache = AssetCache(os.path.normpath(cache_dir)) if cache_dir is not None else None
+        # Assets may be loaded from a prefetch thread while the main thread uses the cache
+        self.cache_lock = threading.Lock()
+
     def from_file(self, file_path: str) -> Tuple[List[Tuple[VertexArray, Texture, Program, None]], List[Animation]]:
         """
         Loads a gltf file from a given path.
         :param file_path: File path.
         :return: Gltf file contents.
         """
-        gltf = GLTF2().load(file_path)
+        return self.upload(self.load_asset(file_path))
+
+    def load_asset(self, file_path: str) -> GltfAsset:
+        """
+        Returns the decoded asset of a gltf file, from the cache if possible. Does not need a GL context and is safe
+        to call from a background thread.
+        :param file_path: File path.
+        :return: Decoded asset.
+        """
+        asset = self.load_cached(file_path)
+
+        if asset is None:
+            asset = self.decode(file_path)
+            self.save_to_cache(file_path, asset)
+
+        return asset
+
+    def load_cached(self, file_path: str) -> Optional[GltfAsset]:
+        """
+        Looks a gltf file up in the cache.
+        :param file_path: File path.
+        :return: Cached asset, or None on a miss or if caching is disabled.
+        """
+        if self.cache is None:
+            return None
+
+        with self.cache_lock:
+            return self.cache.load(file_path)
+
+    def from_files(self, file_paths: List[str], max_workers: Optional[int] = None) \
+            -> Iterator[Tuple[str, Tuple[List[Tuple[VertexArray, Texture, Program, None]], List[Animation]]]]:
+        """
+        Loads several gltf files. Files missing from the cache are decoded in a process pool, while the GPU uploads
+        stay on the calling thread, which owns the GL context.
+        :param file_paths: File paths.
+        :param max_workers: Maximum number of decoding processes (defaults to the number of CPUs).
+        :return: Iterator over (file path, gltf file contents) pairs, in the order the files finish loading.
+        """
+        pending = []
+        for file_path in file_paths:
+            asset = self.load_cached(file_path)
+            if asset is None:
+                pending.append(file_path)
+            else:
+                yield file_path, self.upload(asset)
+
+        max_workers = min(len(pending), max_workers or os.cpu_count() or 1)
+
+        if max_workers <= 1:
+            for file_path in pending:
+                asset = self.decode(file_path)
+                self.save_to_cache(file_path, asset)
+                yield file_path, self.upload(asset)
+            return
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(GLTFLoader.decode, file_path): file_path for file_path in pending}
+            for future in as_completed(futures):
+                file_path = futures[future]
+                asset = future.result()
+                self.save_to_cache(file_path, asset)
+                yield file_path, self.upload(asset)
+
+    def save_to_cache(self, file_path: str, asset: GltfAsset) -> None:
+        """
+        Stores a freshly decoded asset in the cache, if caching is enabled.
+        :param file_path: File path.
+        :param asset: Decoded asset.
+        """
+        if self.cache is None:
+            return
+
+        try:
+            with self.cache_lock:
+                self.cache.save(file_path, asset)
+        except OSError as e:
+            print(f"Could not cache {file_path}: {e}")
+
+    @staticmethod
+    def decode(file_path: str) -> GltfAsset:
+        """
+        Decodes a gltf file into numpy arrays. Does not need a GL context, so it can run in a worker process.
+        :param file_path: File path.
+        :return: Decoded asset.
+        """
+        buffers = BufferStore.load(file_path)
+        gltf = buffers.gltf
 
+        skeleton = None
         animations = []
-        if gltf.animations is not None and len(gltf.animations) > 0 and gltf.skins is not None and len(gltf.skins) > 0:
+        if gltf.skins is not None and len(gltf.skins) > 0:
+            skeleton = get_skeleton_data(gltf, buffers, gltf.skins[0])
 
-            for animation_id in list(range(0, len(gltf.animations))):
-                root_bone, root_transform, bone_dict = get_bones(gltf, gltf.skins[0])
-                duration = get_animation_duration(gltf, animation_id, bone_dict)
-                animation = a.Animation(gltf.animations[animation_id].name, duration, root_bone, root_transform)
-                # animation.assert_channels_not_empty()
-                animations.append(animation)
+            if skeleton is not None and gltf.animations is not None:
+                for animation_id in range(len(gltf.animations)):
+                    animations.append(get_animation_data(gltf, buffers, animation_id, skeleton))
 
-        programs = Shaders.instance()
-        prog = programs.get('base')
-        commands = []
+        images = [None] * len(gltf.images)
+        primitives = []
+
+        mesh_node_index = gltf.scenes[gltf.scene].nodes[0]
+        mesh_node = gltf.nodes[mesh_node_index]
+        transformation_matrix = None
+
+        if mesh_node.matrix is not None:
+            transformation_matrix = np.array(mesh_node.matrix, dtype='f4').reshape(4, 4)
 
         for mesh in gltf.meshes:
             for primitive in mesh.primitives:
 
                 positions_accessor = gltf.accessors[primitive.attributes.POSITION]
-                positions = get_accessor_data(gltf, positions_accessor, 'f4')
+                positions = get_accessor_data(buffers, positions_accessor, 'f4')
 
                 normals_accessor = gltf.accessors[primitive.attributes.NORMAL]
-                normals = get_accessor_data(gltf, normals_accessor, 'f4')
+                normals = get_accessor_data(buffers, normals_accessor, 'f4')
 
-                texture = None
+                image_index = -1
                 if primitive.attributes.TEXCOORD_0 is not None:
 
                     texcoords_accessor = gltf.accessors[primitive.attributes.TEXCOORD_0]
-                    texcoords = get_accessor_data(gltf, texcoords_accessor, 'f4')
+                    texcoords = get_accessor_data(buffers, texcoords_accessor, 'f4')
 
-                    # Load the texture
+                    # The texture is decoded once all the primitives referencing it are known
                     material = gltf.materials[primitive.material]
                     if material.pbrMetallicRoughness.baseColorTexture is not None:
-                        # gltf.convert_images(ImageFormat.FILE)
-
                         texture_index = material.pbrMetallicRoughness.baseColorTexture.index
-                        texture = gltf.textures[texture_index]
-                        image = gltf.images[texture.source]
-                        if image.uri is None:
-                            texture = get_image_data(gltf, image.bufferView)
-                        else:
-                            texture = gltf.get_data_from_buffer_uri(image.uri)
-
-                        img = Image.open(io.BytesIO(texture))
-                        components = 4 if img.mode == 'RGBA' else 3
-                        texture = self.app.ctx.texture(size=img.size, components=components,
-                                                       data=img.tobytes())
+                        image_index = gltf.textures[texture_index].source
                 else:
-                    texcoords = [(0.0, 0.0) for _ in range(len(positions))]
+                    texcoords = np.zeros((len(positions), 2), dtype='f4')
 
-                joint_indices = None
-                joint_weights = None
+                joint_indices = np.full((positions.shape[0], 4), -1, dtype='i4')
+                joint_weights = np.zeros((positions.shape[0], 4), dtype='f4')
 
                 if primitive.attributes.JOINTS_0 is not None:
                     joints_indices_accessor = gltf.accessors[primitive.attributes.JOINTS_0]
-                    joint_indices = get_accessor_data(gltf, joints_indices_accessor, 'i4')
+                    joint_indices = get_accessor_data(buffers, joints_indices_accessor, 'i4')
 
                     assert positions.shape[0] == joint_indices.shape[0]
 
                 if primitive.attributes.WEIGHTS_0 is not None:
                     joints_weights_accessor = gltf.accessors[primitive.attributes.WEIGHTS_0]
-                    joint_weights = get_accessor_data(gltf, joints_weights_accessor, 'f4')
+                    joint_weights = get_accessor_data(buffers, joints_weights_accessor, 'f4')
 
                     assert positions.shape[0] == joint_weights.shape[0]
 
                 indices_accessor = gltf.accessors[primitive.indices]
-                indices = get_accessor_data(gltf, indices_accessor, 'i4')
+                indices = get_accessor_data(buffers, indices_accessor, 'i4')
+
+                primitives.append(PrimitiveData(positions, normals, texcoords, joint_indices, joint_weights, indices,
+                                                image_index, transformation_matrix))
 
-                joint_indices = np.full((indices.shape[0], 4), -1, dtype='i4') if None else joint_indices
-                joint_weights = np.full((indices.shape[0], 4), 0, dtype='f4') if None else joint_weights
+        used_images = sorted({primitive.image for primitive in primitives if primitive.image > -1})
+        for image_index, pixels in decode_images(buffers, used_images).items():
+            images[image_index] = pixels
 
-                vertex_data = np.hstack((positions, normals, texcoords, joint_weights))
+        return GltfAsset(primitives, images, skeleton, animations, [file_path] + buffers.files)
 
-                vbo = self.app.ctx.buffer(vertex_data.astype('f4'))
-                ibo = self.app.ctx.buffer(indices)
+    def get_animations(self, asset: GltfAsset) -> List[Animation]:
+        """
+        Creates the animations of a decoded asset, reduced and compressed as configured. Does not need a GL context.
+        :param asset: Decoded asset.
+        :return: Animations of the asset, sharing its skeleton.
+        """
+        animations = []
+        if asset.skeleton is not None:
+            # One skeleton per file, shared by all of its clips
+            skeleton = get_skeleton(asset.skeleton)
+            for animation_data in asset.animations:
+                channels = get_joint_channels(animation_data)
+                if self.keyframe_tolerance is not None:
+                    n_keyframes = count_keyframes(channels)
+                    channels = reduce_keyframes(channels, self.keyframe_tolerance)
+                    print(f"Reduced keyframes of {animation_data.name}: {n_keyframes} -> {count_keyframes(channels)}")
+                animation = a.Animation(animation_data.name, animation_data.duration, skeleton, channels)
+                if self.compress_clips:
+                    animation.compress()
+                # animation.assert_channels_not_empty()
+                animations.append(animation)
+
+        return animations
+
+    def upload(self, asset: GltfAsset) -> Tuple[List[Tuple[VertexArray, Texture, Program, None]], List[Animation]]:
+        """
+        Creates the GPU resources and animations of a decoded asset. Needs the GL context.
+        :param asset: Decoded asset.
+        :return: Gltf file contents.
+        """
+        animations = self.get_animations(asset)
+
+        programs = Shaders.instance()
+        prog = programs.get(VERTEX_PROGRAMS[self.vertex_format] + ('_packed' if self.palette_layout == '3x4' else ''))
+        commands = []
+        # Primitives sharing an image share its texture
+        textures: Dict[int, Texture] = {}
 
-                jbo = self.app.ctx.buffer(joint_indices.astype('i4'))
+        for primitive in asset.primitives:
+            texture = None
+            if primitive.image > -1:
+                if primitive.image not in textures:
+                    textures[primitive.image] = self.create_texture(asset.images[primitive.image])
+                texture = textures[primitive.image]
 
-                # Create VAO
-                vao_content = [
-                    (vbo, '3f 3f 2f 4f', 'in_position', 'in_normal', 'in_texcoord_0', 'in_jointsWeight'),
-                    (jbo, '4i', 'in_jointsIdx')
-                ]
+            vertices, buffer_format = pack_vertices(primitive, self.vertex_format)
 
-                mesh_node_index = gltf.scenes[gltf.scene].nodes[0]
-                mesh_node = gltf.nodes[mesh_node_index]
-                transformation_matrix = None
+            vbo = self.app.ctx.buffer(vertices)
+            ibo = self.app.ctx.buffer(primitive.indices)
 
-                if mesh_node.matrix is not None:
-                    transformation_matrix = np.array(mesh_node.matrix, dtype='f4').reshape(4, 4)
+            # Create VAO
+            vao_content = [
+                (vbo, buffer_format, *VERTEX_ATTRIBUTES)
+            ]
 
-                commands.append(
-                    (self.app.ctx.vertex_array(prog, vao_content, ibo), texture, prog, transformation_matrix))
+            commands.append(
+                (self.app.ctx.vertex_array(prog, vao_content, ibo), texture, prog, primitive.transformation_matrix))
 
         return commands, animations
+
+    def create_texture(self, pixels: np.ndarray) -> Texture:
+        """
+        Uploads decoded pixels to a mipmapped texture.
+        :param pixels: (H, W, C) pixels.
+        :return: Texture.
+        """
+        texture = self.app.ctx.texture(size=(pixels.shape[1], pixels.shape[0]), components=pixels.shape[2],
+                                       data=np.ascontiguousarray(pixels))
+        texture.build_mipmaps()
+        return texture
@@ -1,11 +1,12 @@
-from animation.bone import Bone
-from animation.keyframe import Keyframe
+from animation.keyframe import Track, JointChannels
+from animation.skeleton import Skeleton
 from pyrr import Matrix44
 import numpy as np
 from pygltflib import *
 from loaders.GltfLoader.gltf_loader_helpers import *
+from loaders.GltfLoader.gltf_loader_asset import SkeletonData, AnimationData, ChannelData
 
-from typing import Dict, Set
+from typing import Dict, List, Set
 
 
 def build_rest_matrix(node: Node) -> Matrix44:
@@ -31,15 +32,16 @@ def build_rest_matrix(node: Node) -> Matrix44:
     return matrix
 
 
-def get_inv_bind(gltf: GLTF2, skin: Skin) -> Dict[int, np.ndarray]:
+def get_inv_bind(gltf: GLTF2, buffers: BufferStore, skin: Skin) -> Dict[int, np.ndarray]:
     """
     Retrieves the inverse bind matrices for a given skin.
     :param gltf: GLTF2 object.
+    :param buffers: Buffer store of the GLTF2 object.
     :param skin: Skin to retrieve the inverse bind matrices for.
     :return: Dictionary mapping joint indices to their corresponding inverse bind matrices.
     """
     inverse_bind_matrices_accessor = gltf.accessors[skin.inverseBindMatrices]
-    inverse_bind_matrices = get_accessor_data(gltf, inverse_bind_matrices_accessor, 'f4')
+    inverse_bind_matrices = get_accessor_data(buffers, inverse_bind_matrices_accessor, 'f4')
     inverse_bind_matrices = inverse_bind_matrices.reshape(-1, 4, 4)
 
     return {joint: inverse_bind_matrix for joint, inverse_bind_matrix in zip(skin.joints, inverse_bind_matrices)}
@@ -63,7 +65,7 @@ def find_root_node(gltf: GLTF2, skin: Skin) -> Tuple[Optional[int], Optional[Mat
         :return: Tuple containing the root node ID and its accumulated transform if found, or (None, None) if not found.
         """
         node = gltf.nodes[node_id]
-        local_transform = node.matrix if node.matrix is not None else build_rest_matrix(node)
+        local_transform = get_rest_transform(node)
 
         if node_id in skin_joints:
             return node_id, parent_transform
@@ -87,91 +89,130 @@ def find_root_node(gltf: GLTF2, skin: Skin) -> Tuple[Optional[int], Optional[Mat
     return None, None
 
 
-def get_bones(gltf: GLTF2, skin: Skin) -> Tuple[Bone, Matrix44, Dict[str, Bone]]:
+def get_rest_transform(node: Node) -> np.ndarray:
     """
-    Retrieves the bones of a skin of a GLTF2 object.
-    :param gltf: GLTF2 object.
-    :param skin: Skin to retrieve the bones for.
-    :return: Tuple containing the root bone, root transform, and a dictionary of bones with bone names as keys.
+    Returns the rest transform of a node, either from its matrix or from its TRS properties.
+    :param node: Node to get the rest transform for.
+    :return: 4x4 rest transform.
     """
+    if node.matrix is not None:
+        # Gltf matrices are stored in column-major order
+        return np.array(node.matrix, dtype=np.float64).reshape(4, 4).T
+    return np.array(build_rest_matrix(node), dtype=np.float64)
 
-    def build_bone_hierarchy(gltf: GLTF2, node_id: int, inv_binds: Dict[int, np.ndarray],
-                             bone_dict: Dict[str, Bone]) -> Bone:
-        """
-        Recursively builds the bone hierarchy.
-        :param gltf: GLTF2 object.
-        :param node_id: Current node ID.
-        :param inv_binds: Dictionary of inverse bind matrices.
-        :param bone_dict: Dictionary to store the bones.
-        :return: Root bone of the hierarchy.
-        """
-        node = gltf.nodes[node_id]
 
-        inverse_bind_matrix = inv_binds.get(node_id, None)
-        rest_transform = node.matrix if node.matrix is not None else build_rest_matrix(node)
+def get_skeleton_data(gltf: GLTF2, buffers: BufferStore, skin: Skin) -> Optional[SkeletonData]:
+    """
+    Flattens the node hierarchy of a skin of a GLTF2 object.
+    :param gltf: GLTF2 object.
+    :param buffers: Buffer store of the GLTF2 object.
+    :param skin: Skin to retrieve the skeleton for.
+    :return: Flat skeleton description, or None if the skin's root node could not be found.
+    """
+    root_node, root_transform = find_root_node(gltf, skin)
+    if root_node is None:
+        return None
+
+    inv_binds = get_inv_bind(gltf, buffers, skin)
+    joint_lookup = {node_id: joint_index for joint_index, node_id in enumerate(skin.joints)}
+    no_inverse_bind = np.zeros((4, 4), dtype=np.float32)
+
+    names = []
+    parents = []
+    joint_indices = []
+    rest_transforms = []
+    inverse_binds = []
+    node_ids = []
+
+    # Depth-first traversal so that parents are always stored before their children
+    stack = [(root_node, -1)]
+    while len(stack) > 0:
+        node_id, parent = stack.pop()
+        node = gltf.nodes[node_id]
 
-        children_bones = []
+        names.append(node.name)
+        parents.append(parent)
+        joint_indices.append(joint_lookup.get(node_id, -1))
+        rest_transforms.append(get_rest_transform(node))
+        inverse_binds.append(inv_binds.get(node_id, no_inverse_bind))
+        node_ids.append(node_id)
 
         if node.children is not None:
-            for child_id in node.children:
-                child_bone = build_bone_hierarchy(gltf, child_id, inv_binds, bone_dict)
-                children_bones.append(child_bone)
+            stack.extend((child_id, len(names) - 1) for child_id in reversed(node.children))
 
-        bone_index = skin.joints.index(node_id) if node_id in skin.joints else -1
+    if root_transform is not None:
+        root_transform = np.array(root_transform, dtype=np.float64).reshape(4, 4)
 
-        bone = Bone(name=node.name, inverse_bind_matrix=inverse_bind_matrix, rest_transform=rest_transform,
-                    children=children_bones, index=bone_index)
-        bone_dict[node.name] = bone
-        return bone
+    return SkeletonData(names=names, parents=np.array(parents, dtype=np.int32),
+                        joint_indices=np.array(joint_indices, dtype=np.int32),
+                        rest_transforms=np.array(rest_transforms, dtype=np.float64),
+                        inverse_binds=np.array(inverse_binds, dtype=np.float32),
+                        root_transform=root_transform, node_ids=np.array(node_ids, dtype=np.int32))
 
-    root_node, root_transform = find_root_node(gltf, skin)
-    inv_binds = get_inv_bind(gltf, skin)
-    root_bone = None
-    bone_dict = {}
 
-    if root_node is not None:
-        root_bone = build_bone_hierarchy(gltf, root_node, inv_binds, bone_dict)
-
-    return root_bone, root_transform, bone_dict
+def get_skeleton(skeleton: SkeletonData) -> Skeleton:
+    """
+    Creates the Skeleton shared by all the animations of a file from its flat description.
+    :param skeleton: Flat skeleton description.
+    :return: Skeleton.
+    """
+    return Skeleton(skeleton.names, skeleton.parents, skeleton.joint_indices, skeleton.rest_transforms,
+                    skeleton.inverse_binds, skeleton.root_transform)
 
 
-def get_animation_duration(gltf: GLTF2, i: int, bone_dict: Dict[str, Bone]) -> float:
+def get_animation_data(gltf: GLTF2, buffers: BufferStore, i: int, skeleton: SkeletonData) -> AnimationData:
     """
-    Gets the duration of an animation of a gltf file.
+    Decodes the keyframes of an animation of a gltf file.
     :param gltf: Gltf file.
+    :param buffers: Buffer store of the gltf file.
     :param i: Animation index.
-    :param bone_dict: Dictionary of Bones.
-    :return: Animation duration.
+    :param skeleton: Skeleton the animation's channels are matched against.
+    :return: Decoded animation.
     """
     animation = gltf.animations[i]
+    node_lookup = {int(node_id): index for index, node_id in enumerate(skeleton.node_ids)}
     duration = 0.0
+    channels = []
 
     for channel in animation.channels:
         target_node = channel.target.node
-        node_name = gltf.nodes[target_node].name
         path = channel.target.path
 
         sampler = animation.samplers[channel.sampler]
         input_accessor = gltf.accessors[sampler.input]
         output_accessor = gltf.accessors[sampler.output]
 
-        input_data = get_accessor_data(gltf, input_accessor, 'f4')
-        output_data = get_accessor_data(gltf, output_accessor, 'f4')
+        input_data = get_accessor_data(buffers, input_accessor, 'f4')
+        output_data = get_accessor_data(buffers, output_accessor, 'f4')
 
-        keyframes = [Keyframe(timestamp[0], np.array(value)) for timestamp, value in zip(input_data, output_data)]
+        if len(input_data) > 0:
+            duration = max(duration, float(input_data.max()))
 
-        duration = max(duration, max(input_data))
-
-        if node_name not in bone_dict:
+        if target_node not in node_lookup or path not in ('translation', 'rotation', 'scale'):
             continue
 
-        bone = bone_dict[node_name]
+        channels.append(ChannelData(node_lookup[target_node], path, input_data[:, 0], output_data))
+
+    return AnimationData(animation.name, duration, channels)
+
+
+def get_joint_channels(animation: AnimationData) -> Dict[int, JointChannels]:
+    """
+    Groups the channels of a decoded animation by skeleton node. The tracks reference the decoded arrays.
+    :param animation: Decoded animation.
+    :return: Dictionary mapping skeleton node indices to their Keyframe channels.
+    """
+    channels = {}
+
+    for channel in animation.channels:
+        track = Track(channel.timestamps, channel.values)
+        joint_channels = channels.setdefault(channel.node, JointChannels())
 
-        if path == "rotation":
-            bone.rotations = keyframes
-        elif path == "translation":
-            bone.translations = keyframes
-        elif path == "scale":
-            bone.scales = keyframes
+        if channel.path == "rotation":
+            joint_channels.rotations = track
+        elif channel.path == "translation":
+            joint_channels.translations = track
+        elif channel.path == "scale":
+            joint_channels.scales = track
 
-    return duration[0]
+    return channels
@@ -0,0 +1,126 @@
+import numpy as np
+from animation.skinning import is_skinned
+
+from typing import List, Optional
+
+
+class PrimitiveData:
+    """
+    CPU-side vertex and index data of a single mesh primitive.
+    """
+
+    def __init__(self, positions: np.ndarray, normals: np.ndarray, texcoords: np.ndarray, joint_indices: np.ndarray,
+                 joint_weights: np.ndarray, indices: np.ndarray, image: int = -1,
+                 transformation_matrix: Optional[np.ndarray] = None) -> None:
+        """
+        Constructor.
+        :param positions: (V, 3) vertex positions.
+        :param normals: (V, 3) vertex normals.
+        :param texcoords: (V, 2) texture coordinates.
+        :param joint_indices: (V, 4) joint indices (JOINTS_0).
+        :param joint_weights: (V, 4) joint weights (WEIGHTS_0).
+        :param indices: Triangle indices.
+        :param image: Index of the base color image, or -1 if the primitive is not textured.
+        :param transformation_matrix: Transformation matrix of the mesh node, if any.
+        """
+        self.positions = positions
+        self.normals = normals
+        self.texcoords = texcoords
+        self.joint_indices = joint_indices
+        self.joint_weights = joint_weights
+        self.indices = indices
+        self.image = image
+        self.transformation_matrix = transformation_matrix
+
+    def is_skinned(self) -> bool:
+        """
+        Checks whether the primitive is bound to joints (see animation.skinning.is_skinned).
+        :return: True if any vertex has a non-zero joint weight.
+        """
+        return is_skinned(self.joint_weights)
+
+
+class SkeletonData:
+    """
+    Flat description of the node hierarchy below the root of a skin. Nodes are stored in depth-first order, so that
+    every parent comes before its children.
+    """
+
+    def __init__(self, names: List[str], parents: np.ndarray, joint_indices: np.ndarray, rest_transforms: np.ndarray,
+                 inverse_binds: np.ndarray, root_transform: Optional[np.ndarray], node_ids: np.ndarray) -> None:
+        """
+        Constructor.
+        :param names: Node names.
+        :param parents: (N,) index of each node's parent, -1 for the root.
+        :param joint_indices: (N,) index of each node in the skin's joint list, -1 if the node is not a joint.
+        :param rest_transforms: (N, 4, 4) rest transforms.
+        :param inverse_binds: (N, 4, 4) inverse bind matrices (zero for nodes that are not joints).
+        :param root_transform: Transform of the root's parent node, if any.
+        :param node_ids: (N,) gltf node id of each node.
+        """
+        self.names = names
+        self.parents = parents
+        self.joint_indices = joint_indices
+        self.rest_transforms = rest_transforms
+        self.inverse_binds = inverse_binds
+        self.root_transform = root_transform
+        self.node_ids = node_ids
+
+
+class ChannelData:
+    """
+    Keyframes of one animated property (translation, rotation or scale) of a skeleton node.
+    """
+
+    def __init__(self, node: int, path: str, timestamps: np.ndarray, values: np.ndarray) -> None:
+        """
+        Constructor.
+        :param node: Index of the target node in the skeleton.
+        :param path: Animated property ('translation', 'rotation' or 'scale').
+        :param timestamps: (K,) keyframe timestamps.
+        :param values: (K, 3) vectors or (K, 4) quaternions.
+        """
+        self.node = node
+        self.path = path
+        self.timestamps = timestamps
+        self.values = values
+
+
+class AnimationData:
+    """
+    Keyframe channels of an animation clip.
+    """
+
+    def __init__(self, name: str, duration: float, channels: List[ChannelData]) -> None:
+        """
+        Constructor.
+        :param name: Animation name.
+        :param duration: Animation duration.
+        :param channels: Channels that target nodes of the skeleton.
+        """
+        self.name = name
+        self.duration = duration
+        self.channels = channels
+
+
+class GltfAsset:
+    """
+    Everything the renderer needs from a gltf file, decoded into plain numpy arrays. This is the output of the CPU
+    decoding stage and what the asset cache stores on disk.
+    """
+
+    def __init__(self, primitives: List[PrimitiveData], images: List[Optional[np.ndarray]],
+                 skeleton: Optional[SkeletonData], animations: List[AnimationData], sources: List[str]) -> None:
+        """
+        Constructor.
+        :param primitives: Mesh primitives.
+        :param images: (H, W, C) decoded pixels per gltf image, None for images that are not used.
+        :param skeleton: Skeleton of the first skin, if any.
+        :param animations: Animation clips.
+        :param sources: Files the asset was decoded from (the gltf file and its external buffers/images).
+        """
+        self.primitives = primitives
+        self.images = images
+        self.skeleton = skeleton
+        self.animations = animations
+        self.sources = sources
@@ -0,0 +1,147 @@
+import base64
+import json
+import mmap
+import os
+import struct
+from urllib.parse import unquote
+from pygltflib import GLTF2
+
+from typing import Dict, List, Optional, Tuple
+
+GLB_MAGIC = 0x46546C67
+GLB_CHUNK_JSON = 0x4E4F534A
+GLB_CHUNK_BIN = 0x004E4942
+
+
+def map_file(file_path: str) -> memoryview:
+    """
+    Memory-maps a file for reading.
+    :param file_path: File path.
+    :return: Read-only memoryview over the file contents.
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'')
+        # The mapping stays valid after the file is closed and is released once no view references it anymore
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def read_glb_header(data: memoryview) -> Tuple[dict, Optional[Tuple[int, int]]]:
+    """
+    Parses the header of a GLB container.
+    :param data: Contents of the GLB file.
+    :return: Tuple containing the parsed JSON chunk and the (offset, length) of the binary chunk if present.
+    """
+    magic, _, length = struct.unpack_from('<III', data, 0)
+    if magic != GLB_MAGIC:
+        raise ValueError("Not a GLB file")
+
+    json_chunk = None
+    bin_chunk = None
+    offset = 12
+
+    while offset < length:
+        chunk_length, chunk_type = struct.unpack_from('<II', data, offset)
+        offset += 8
+        if chunk_type == GLB_CHUNK_JSON:
+            json_chunk = json.loads(bytes(data[offset: offset + chunk_length]).decode('utf-8'))
+        elif chunk_type == GLB_CHUNK_BIN and bin_chunk is None:
+            bin_chunk = (offset, chunk_length)
+        offset += chunk_length
+
+    if json_chunk is None:
+        raise ValueError("GLB file does not contain a JSON chunk")
+
+    return json_chunk, bin_chunk
+
+
+class BufferStore:
+    """
+    Holds the binary buffers of a single gltf file. Every buffer is decoded (data URIs) or memory-mapped (external
+    files, GLB binary chunk) once, so that accessors and images only slice memoryviews of it.
+    """
+
+    def __init__(self, gltf: GLTF2, base_path: str, glb_data: Optional[memoryview] = None,
+                 glb_chunk: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Constructor.
+        :param gltf: GLTF2 object the buffers belong to.
+        :param base_path: Directory used to resolve relative URIs.
+        :param glb_data: Memory-mapped GLB file if the gltf was loaded from one.
+        :param glb_chunk: (offset, length) of the GLB binary chunk.
+        """
+        self.gltf = gltf
+        self.base_path = base_path
+        self.glb_data = glb_data
+        self.glb_chunk = glb_chunk
+        self.buffers: Dict[int, memoryview] = {}
+        self.uris: Dict[str, memoryview] = {}
+        # External files mapped so far
+        self.files: List[str] = []
+
+    @classmethod
+    def load(cls, file_path: str) -> 'BufferStore':
+        """
+        Loads the JSON part of a .gltf/.glb file and prepares its buffers for lazy access.
+        :param file_path: File path.
+        :return: Buffer store, with the parsed GLTF2 object available as its gltf attribute.
+        """
+        base_path = os.path.dirname(os.path.abspath(file_path))
+
+        if os.path.splitext(file_path)[1].lower() == '.glb':
+            data = map_file(file_path)
+            document, bin_chunk = read_glb_header(data)
+            gltf = GLTF2.gltf_from_json(json.dumps(document))
+            return cls(gltf, base_path, data, bin_chunk)
+
+        with open(file_path, 'r') as f:
+            gltf = GLTF2.gltf_from_json(f.read())
+        return cls(gltf, base_path)
+
+    def read_uri(self, uri: str) -> memoryview:
+        """
+        Returns the contents of a data URI or of a file referenced relative to the gltf file. Each URI is only
+        decoded or mapped once.
+        :param uri: Data URI or relative file path.
+        :return: Memoryview over the referenced data.
+        """
+        if uri not in self.uris:
+            if uri.startswith('data:'):
+                header, _, payload = uri.partition(',')
+                if header.endswith(';base64'):
+                    data = base64.b64decode(payload)
+                else:
+                    data = unquote(payload).encode('latin-1')
+                self.uris[uri] = memoryview(data)
+            else:
+                file_path = os.path.join(self.base_path, unquote(uri))
+                self.uris[uri] = map_file(file_path)
+                self.files.append(file_path)
+        return self.uris[uri]
+
+    def get_buffer(self, index: int) -> memoryview:
+        """
+        Returns the full contents of a buffer.
+        :param index: Buffer index.
+        :return: Memoryview over the buffer.
+        """
+        if index not in self.buffers:
+            buffer = self.gltf.buffers[index]
+            if buffer.uri is not None:
+                self.buffers[index] = self.read_uri(buffer.uri)
+            elif self.glb_chunk is not None:
+                offset, length = self.glb_chunk
+                self.buffers[index] = self.glb_data[offset: offset + length]
+            else:
+                raise ValueError(f"Buffer {index} has no uri and the file has no binary chunk")
+        return self.buffers[index]
+
+    def get_buffer_view(self, index: int) -> memoryview:
+        """
+        Returns the bytes covered by a buffer view.
+        :param index: Buffer view index.
+        :return: Memoryview over the buffer view.
+        """
+        buffer_view = self.gltf.bufferViews[index]
+        start = buffer_view.byteOffset or 0
+        return self.get_buffer(buffer_view.buffer)[start: start + buffer_view.byteLength]
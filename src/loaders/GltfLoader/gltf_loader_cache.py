@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from loaders.GltfLoader.gltf_loader_asset import GltfAsset, PrimitiveData, SkeletonData, AnimationData, ChannelData
+
+from typing import Dict, List, Optional
+
+# Bump whenever the decoded asset layout changes so that stale entries are ignored
+CACHE_VERSION = 1
+CHANNEL_PATHS = ['translation', 'rotation', 'scale']
+PRIMITIVE_ARRAYS = ['positions', 'normals', 'texcoords', 'joint_indices', 'joint_weights', 'indices']
+
+
+def hash_files(file_paths: List[str]) -> str:
+    """
+    Hashes the contents of a list of files.
+    :param file_paths: File paths.
+    :return: Hex digest of the files' contents.
+    """
+    digest = hashlib.sha1(str(CACHE_VERSION).encode())
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def file_stamps(file_paths: List[str]) -> List[List]:
+    """
+    Returns the path, modification time and size of a list of files.
+    :param file_paths: File paths.
+    :return: List of [path, mtime_ns, size] entries.
+    """
+    stamps = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        stamps.append([file_path, stat.st_mtime_ns, stat.st_size])
+    return stamps
+
+
+class AssetCache:
+    """
+    On-disk cache of decoded gltf assets. Every entry is a directory of .npy files (one per array) and a meta.json
+    describing how they fit together, so warm loads memory-map the arrays instead of parsing the gltf file.
+    Entries are named after the content hash of the source files; an index maps each source path to its entry
+    together with the modification times and sizes it was hashed with, so unchanged files are not re-hashed.
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        """
+        Constructor.
+        :param cache_dir: Directory the cache is stored in.
+        """
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.index = self.read_index()
+        self.hits = 0
+        self.misses = 0
+
+    def read_index(self) -> Dict[str, dict]:
+        """
+        Reads the cache index.
+        :return: Index with an 'entries' dictionary mapping source paths to their cache entry.
+        """
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            if index['version'] == CACHE_VERSION:
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+        return {'version': CACHE_VERSION, 'entries': {}}
+
+    def write_index(self) -> None:
+        """
+        Atomically writes the cache index.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def lookup(self, file_path: str) -> Optional[str]:
+        """
+        Finds the cache entry of a source file.
+        :param file_path: Source file path.
+        :return: Entry directory, or None if the file is not cached or has changed.
+        """
+        record = self.index['entries'].get(os.path.abspath(file_path))
+        if record is None:
+            return None
+
+        entry_dir = os.path.join(self.cache_dir, record['key'])
+        if not os.path.isfile(os.path.join(entry_dir, 'meta.json')):
+            return None
+
+        sources = [stamp[0] for stamp in record['files']]
+        try:
+            stamps = file_stamps(sources)
+            if stamps != record['files']:
+                # Touched files may still have the same content
+                if hash_files(sources) != record['key']:
+                    return None
+                record['files'] = stamps
+                self.write_index()
+        except OSError:
+            return None
+
+        return entry_dir
+
+    def load(self, file_path: str) -> Optional[GltfAsset]:
+        """
+        Loads a cached asset, memory-mapping its arrays.
+        :param file_path: Source file path.
+        :return: Cached asset, or None on a cache miss.
+        """
+        entry_dir = self.lookup(file_path)
+        if entry_dir is None:
+            self.misses += 1
+            return None
+
+        try:
+            asset = read_asset(entry_dir)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return asset
+
+    def save(self, file_path: str, asset: GltfAsset) -> None:
+        """
+        Stores a decoded asset.
+        :param file_path: Source file path.
+        :param asset: Decoded asset.
+        """
+        sources = [os.path.abspath(source) for source in asset.sources]
+        stamps = file_stamps(sources)
+        key = hash_files(sources)
+        entry_dir = os.path.join(self.cache_dir, key)
+
+        if not os.path.isdir(entry_dir):
+            tmp_dir = entry_dir + f'.tmp{os.getpid()}'
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            write_asset(tmp_dir, asset)
+            try:
+                os.replace(tmp_dir, entry_dir)
+            except OSError:
+                # Another process stored the same entry in the meantime
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.index['entries'][os.path.abspath(file_path)] = {'key': key, 'files': stamps}
+        self.write_index()
+
+
+def write_asset(entry_dir: str, asset: GltfAsset) -> None:
+    """
+    Writes a decoded asset as a set of .npy files plus a meta.json.
+    :param entry_dir: Directory to write the asset to.
+    :param asset: Decoded asset.
+    """
+    os.makedirs(entry_dir)
+
+    def save(name: str, array: np.ndarray) -> None:
+        np.save(os.path.join(entry_dir, f'{name}.npy'), np.ascontiguousarray(array))
+
+    meta = {'version': CACHE_VERSION, 'primitives': [], 'images': [], 'skeleton': None, 'animations': []}
+
+    for i, primitive in enumerate(asset.primitives):
+        for name in PRIMITIVE_ARRAYS:
+            save(f'primitive{i}_{name}', getattr(primitive, name))
+        if primitive.transformation_matrix is not None:
+            save(f'primitive{i}_transformation_matrix', primitive.transformation_matrix)
+        meta['primitives'].append({'image': primitive.image,
+                                   'transformation_matrix': primitive.transformation_matrix is not None})
+
+    for i, image in enumerate(asset.images):
+        if image is not None:
+            save(f'image{i}', image)
+        meta['images'].append(image is not None)
+
+    skeleton = asset.skeleton
+    if skeleton is not None:
+        save('skeleton_parents', skeleton.parents)
+        save('skeleton_joint_indices', skeleton.joint_indices)
+        save('skeleton_rest_transforms', skeleton.rest_transforms)
+        save('skeleton_inverse_binds', skeleton.inverse_binds)
+        save('skeleton_node_ids', skeleton.node_ids)
+        if skeleton.root_transform is not None:
+            save('skeleton_root_transform', skeleton.root_transform)
+        meta['skeleton'] = {'names': skeleton.names, 'root_transform': skeleton.root_transform is not None}
+
+    for i, animation in enumerate(asset.animations):
+        # Channels of the same kind are packed into one timestamps and one values array per clip
+        channels = {path: [channel for channel in animation.channels if channel.path == path] for path in CHANNEL_PATHS}
+        for path in CHANNEL_PATHS:
+            if channels[path]:
+                save(f'animation{i}_{path}_timestamps', np.concatenate([c.timestamps for c in channels[path]]))
+                save(f'animation{i}_{path}_values', np.concatenate([c.values for c in channels[path]]))
+        meta['animations'].append({
+            'name': animation.name,
+            'duration': animation.duration,
+            'channels': {path: [[c.node, len(c.timestamps)] for c in channels[path]] for path in CHANNEL_PATHS},
+        })
+
+    with open(os.path.join(entry_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def read_asset(entry_dir: str) -> GltfAsset:
+    """
+    Reads an asset written by write_asset, memory-mapping every array.
+    :param entry_dir: Directory the asset was written to.
+    :return: Decoded asset.
+    """
+    with open(os.path.join(entry_dir, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+
+    if meta['version'] != CACHE_VERSION:
+        raise ValueError(f"Unsupported cache version: {meta['version']}")
+
+    def load(name: str) -> np.ndarray:
+        return np.load(os.path.join(entry_dir, f'{name}.npy'), mmap_mode='r')
+
+    primitives = []
+    for i, primitive in enumerate(meta['primitives']):
+        arrays = {name: load(f'primitive{i}_{name}') for name in PRIMITIVE_ARRAYS}
+        transformation_matrix = load(f'primitive{i}_transformation_matrix') \
+            if primitive['transformation_matrix'] else None
+        primitives.append(PrimitiveData(image=primitive['image'], transformation_matrix=transformation_matrix,
+                                        **arrays))
+
+    images = [load(f'image{i}') if cached else None for i, cached in enumerate(meta['images'])]
+
+    skeleton = None
+    if meta['skeleton'] is not None:
+        skeleton = SkeletonData(names=meta['skeleton']['names'],
+                                parents=load('skeleton_parents'),
+                                joint_indices=load('skeleton_joint_indices'),
+                                rest_transforms=load('skeleton_rest_transforms'),
+                                inverse_binds=load('skeleton_inverse_binds'),
+                                root_transform=load('skeleton_root_transform')
+                                if meta['skeleton']['root_transform'] else None,
+                                node_ids=load('skeleton_node_ids'))
+
+    animations = []
+    for i, animation in enumerate(meta['animations']):
+        channels = []
+        for path in CHANNEL_PATHS:
+            if not animation['channels'][path]:
+                continue
+            timestamps = load(f'animation{i}_{path}_timestamps')
+            values = load(f'animation{i}_{path}_values')
+            offset = 0
+            for node, count in animation['channels'][path]:
+                channels.append(ChannelData(node, path, timestamps[offset: offset + count],
+                                            values[offset: offset + count]))
+                offset += count
+        animations.append(AnimationData(animation['name'], animation['duration'], channels))
+
+    return GltfAsset(primitives, images, skeleton, animations, sources=[])
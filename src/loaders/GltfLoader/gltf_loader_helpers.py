@@ -1,9 +1,32 @@
 import pygltflib as gltf
-import struct
 import numpy as np
-from pygltflib import Accessor, GLTF2
-
-from typing import List
+from pygltflib import Accessor
+from loaders.GltfLoader.gltf_loader_buffers import BufferStore
+
+from typing import Optional
+
+# Signed 32-bit integers are not allowed by the glTF spec for accessors, but some exporters still write them.
+INT = 5124
+
+COMPONENT_DTYPES = {
+    gltf.BYTE: np.dtype('<i1'),
+    gltf.UNSIGNED_BYTE: np.dtype('<u1'),
+    gltf.SHORT: np.dtype('<i2'),
+    gltf.UNSIGNED_SHORT: np.dtype('<u2'),
+    INT: np.dtype('<i4'),
+    gltf.UNSIGNED_INT: np.dtype('<u4'),
+    gltf.FLOAT: np.dtype('<f4'),
+}
+
+TYPE_COUNTS = {
+    "SCALAR": 1,
+    "VEC2": 2,
+    "VEC3": 3,
+    "VEC4": 4,
+    "MAT2": 4,
+    "MAT3": 9,
+    "MAT4": 16,
+}
 
 
 def accessor_type_count(accessor: Accessor) -> int:
@@ -12,112 +35,124 @@ def accessor_type_count(accessor: Accessor) -> int:
     :param accessor: Accessor object representing a buffer view.
     :return: Count of elements per component in the accessor.
     """
-    if accessor.type == "SCALAR":
-        return 1
-    elif accessor.type == "VEC2":
-        return 2
-    elif accessor.type == "VEC3":
-        return 3
-    elif accessor.type == "VEC4":
-        return 4
-    elif accessor.type == "MAT2":
-        return 4
-    elif accessor.type == "MAT3":
-        return 9
-    elif accessor.type == "MAT4":
-        return 16
-    else:
+    if accessor.type not in TYPE_COUNTS:
         raise ValueError(f"Unknown accessor type: {accessor.type}")
+    return TYPE_COUNTS[accessor.type]
 
 
-def accessor_component_type_fmt(accessor: Accessor) -> str:
+def component_type_dtype(component_type: int) -> np.dtype:
     """
-    Returns the format string for the given accessor's component type.
-    :param accessor: Accessor object representing a buffer view.
-    :return: Format string for the component type.
+    Returns the little-endian numpy dtype of a gltf component type.
+    :param component_type: Gltf component type (e.g. gltf.FLOAT).
+    :return: Numpy dtype of the component type.
     """
-    if accessor.componentType == gltf.BYTE:
-        return "b"
-    elif accessor.componentType == gltf.UNSIGNED_BYTE:
-        return "B"
-    elif accessor.componentType == gltf.SHORT:
-        return "h"
-    elif accessor.componentType == gltf.UNSIGNED_SHORT:
-        return "H"
-    elif accessor.componentType == gltf.UNSIGNED_INT:
-        return "I"
-    elif accessor.componentType == gltf.FLOAT:
-        return "f"
-    else:
-        raise ValueError(f"Unknown component type: {accessor.componentType}")
+    if component_type not in COMPONENT_DTYPES:
+        raise ValueError(f"Unknown component type: {component_type}")
+    return COMPONENT_DTYPES[component_type]
 
 
-def accessor_type_fmt(accessor: Accessor) -> str:
+def accessor_component_dtype(accessor: Accessor) -> np.dtype:
     """
-    Returns the format string for the given accessor's type and component type.
+    Returns the numpy dtype for the given accessor's component type.
     :param accessor: Accessor object representing a buffer view.
-    :return: Format string for the accessor's type and component type.
+    :return: Numpy dtype of the component type.
+    """
+    return component_type_dtype(accessor.componentType)
+
+
+def normalize_components(values: np.ndarray) -> np.ndarray:
+    """
+    Converts normalized integer components to floats as described in the gltf spec.
+    :param values: Integer values read from the buffer.
+    :return: Float values in [0, 1] for unsigned types or [-1, 1] for signed types.
+    """
+    info = np.iinfo(values.dtype)
+    normalized = values.astype('f4') / np.float32(info.max)
+    if info.min < 0:
+        np.maximum(normalized, -1.0, out=normalized)
+    return normalized
+
+
+def read_buffer_view(buffers: BufferStore, buffer_view_index: int, byte_offset: int, count: int, n_components: int,
+                     component_dtype: np.dtype) -> np.ndarray:
     """
-    fmt = accessor_component_type_fmt(accessor)
-    if accessor.type == "SCALAR":
-        return f'<{fmt}'
-    elif accessor.type == "VEC2":
-        return f'<{fmt * 2}'
-    elif accessor.type == "VEC3":
-        return f'<{fmt * 3}'
-    elif accessor.type == "VEC4":
-        return f'<{fmt * 4}'
-    elif accessor.type == "MAT2":
-        return f'<{fmt * 4}'
-    elif accessor.type == "MAT3":
-        return f'<{fmt * 9}'
-    elif accessor.type == "MAT4":
-        return f'<{fmt * 16}'
+    Maps a (possibly interleaved) buffer view to a (count, n_components) array without copying when possible.
+    :param buffers: Buffer store of the GLTF model.
+    :param buffer_view_index: Index of the buffer view to read from.
+    :param byte_offset: Offset of the first element inside the buffer view.
+    :param count: Number of elements to read.
+    :param n_components: Number of components per element.
+    :param component_dtype: Numpy dtype of each component.
+    :return: Array view over the buffer data, or an aligned copy if the data is misaligned.
+    """
+    buffer_view = buffers.gltf.bufferViews[buffer_view_index]
+    data = buffers.get_buffer_view(buffer_view_index)
+
+    element_size = component_dtype.itemsize * n_components
+    stride = buffer_view.byteStride or element_size
+    start = byte_offset
+
+    if count == 0:
+        return np.empty((0, n_components), dtype=component_dtype)
+
+    if stride == element_size:
+        values = np.frombuffer(data, dtype=component_dtype, count=count * n_components, offset=start)
+        values = values.reshape(count, n_components)
     else:
-        raise ValueError(f"Unknown accessor type: {accessor.type}")
+        # Interleaved buffer view: view the rows with the buffer view's stride
+        rows = np.frombuffer(data, dtype=np.uint8, count=(count - 1) * stride + element_size, offset=start)
+        values = np.lib.stride_tricks.as_strided(rows, shape=(count, element_size), strides=(stride, 1),
+                                                 writeable=False).view(component_dtype)
 
+    # Misaligned views are legal but slow for every later operation, so pay for one copy up front
+    if not values.flags.aligned:
+        values = values.copy()
 
-def get_image_data(gltf: GLTF2, bufferView: int) -> List[int]:
+    return values
+
+
+def get_image_data(buffers: BufferStore, bufferView: int) -> memoryview:
     """
     Retrieves the image data from a GLTF model.
-    :param gltf: GLTF2 object representing a GLTF model.
+    :param buffers: Buffer store of the GLTF model.
     :param bufferView: Index of the buffer view to retrieve the image data from.
-    :return: Image data as a list of integers.
+    :return: Encoded image data.
     """
-    buffer_view = gltf.bufferViews[bufferView]
-    buffer = gltf.buffers[buffer_view.buffer]
-    data = gltf.get_data_from_buffer_uri(buffer.uri)
-
-    start = buffer_view.byteOffset
-    end = buffer_view.byteLength
+    return buffers.get_buffer_view(bufferView)
 
-    return data[start: start + end]
 
-
-def get_accessor_data(gltf: GLTF2, accessor: Accessor, dtype: str) -> np.ndarray:
+def get_accessor_data(buffers: BufferStore, accessor: Accessor, dtype: Optional[str] = None) -> np.ndarray:
     """
     Retrieves accessor data from a GLTF model.
-    :param gltf: GLTF2 object representing a GLTF model.
+    The returned array is a read-only view of the buffer whenever the stored component type already matches dtype and
+    the data is aligned; conversions, normalization and sparse substitution produce a new array.
+    :param buffers: Buffer store of the GLTF model.
     :param accessor: Accessor object to retrieve the data from.
-    :param dtype: Data type to use for the returned numpy array.
-    :return: Accessor data as a numpy array.
+    :param dtype: Data type to use for the returned numpy array (defaults to the stored component type).
+    :return: Accessor data as a (count, components) numpy array.
     """
-    buffer_view = gltf.bufferViews[accessor.bufferView]
-    buffer = gltf.buffers[buffer_view.buffer]
-    data = gltf.get_data_from_buffer_uri(buffer.uri)
+    n_components = accessor_type_count(accessor)
+    component_dtype = accessor_component_dtype(accessor)
 
-    byte_offset = buffer_view.byteOffset + accessor.byteOffset
-    dtype_format = accessor_type_fmt(accessor)
-    component_size = struct.calcsize(dtype_format)
+    if accessor.bufferView is not None:
+        values = read_buffer_view(buffers, accessor.bufferView, accessor.byteOffset or 0, accessor.count, n_components,
+                                  component_dtype)
+    else:
+        values = np.zeros((accessor.count, n_components), dtype=component_dtype)
 
-    values = []
+    if accessor.sparse is not None and accessor.sparse.count > 0:
+        sparse = accessor.sparse
+        indices = read_buffer_view(buffers, sparse.indices.bufferView, sparse.indices.byteOffset or 0, sparse.count, 1,
+                                   component_type_dtype(sparse.indices.componentType))
+        substitutes = read_buffer_view(buffers, sparse.values.bufferView, sparse.values.byteOffset or 0, sparse.count,
+                                       n_components, component_dtype)
+        values = values.copy()
+        values[indices[:, 0]] = substitutes
 
-    for i in range(accessor.count):
-        start = byte_offset + i * component_size
-        end = start + component_size
-        chunk = data[start:end]
-        value = struct.unpack(dtype_format, chunk)
+    if accessor.normalized and values.dtype.kind in 'iu':
+        values = normalize_components(values)
 
-        values.append(value)
+    if dtype is not None and values.dtype != np.dtype(dtype):
+        values = values.astype(dtype)
 
-    return np.array(values, dtype=dtype).reshape(-1, accessor_type_count(accessor))
+    return values
@@ -0,0 +1,99 @@
+import numpy as np
+from loaders.GltfLoader.gltf_loader_asset import PrimitiveData
+
+from typing import Tuple
+
+# Vertex layouts: 'float' keeps every attribute in 32 bits (64 bytes per vertex), the compact ones quantize normals,
+# texture coordinates, joint indices and weights (8 or 16 bits per weight). 'compact' is 28 bytes per vertex: float
+# positions (12), octahedral normals (4), half float texture coordinates (4), 8-bit weights (4) and joints (4).
+# Positions stay in 32 bits so that large or offset meshes keep their precision, which puts the floor at 28 bytes
+# rather than 24: 10-10-10-2 normals would take the same 4 bytes as the octahedral ones.
+VERTEX_FORMATS = ['float', 'compact', 'compact16']
+
+# Shader program used by each layout
+VERTEX_PROGRAMS = {'float': 'base', 'compact': 'base_compact', 'compact16': 'base_compact16'}
+
+# Shader inputs, in the order the attributes are interleaved
+VERTEX_ATTRIBUTES = ('in_position', 'in_normal', 'in_texcoord_0', 'in_jointsWeight', 'in_jointsIdx')
+
+
+def encode_octahedral(normals: np.ndarray) -> np.ndarray:
+    """
+    Encodes unit vectors with the octahedral mapping, quantized to signed 16-bit integers.
+    :param normals: (V, 3) normals.
+    :return: (V, 2) encoded normals.
+    """
+    normals = np.asarray(normals, dtype=np.float32)
+    l1_norm = np.abs(normals).sum(axis=1, keepdims=True)
+    projected = normals[:, :2] / np.maximum(l1_norm, 1e-12)
+
+    # The lower hemisphere is folded over the diagonals
+    lower = normals[:, 2] < 0
+    signs = np.where(projected[lower] >= 0, 1.0, -1.0)
+    projected[lower] = (1.0 - np.abs(projected[lower][:, ::-1])) * signs
+
+    return np.round(np.clip(projected, -1.0, 1.0) * 32767.0).astype('<i2')
+
+
+def quantize_weights(weights: np.ndarray, bits: int) -> np.ndarray:
+    """
+    Quantizes skinning weights to unsigned-normalized integers, keeping the sum of every vertex's weights exact.
+    :param weights: (V, 4) weights.
+    :param bits: Bits per weight (8 or 16).
+    :return: (V, 4) quantized weights.
+    """
+    max_value = (1 << bits) - 1
+    weights = np.clip(np.asarray(weights, dtype=np.float64), 0.0, None)
+    totals = weights.sum(axis=1, keepdims=True)
+    normalized = np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+
+    quantized = np.round(normalized * max_value).astype(np.int64)
+    # Give the rounding error to the largest weight of every skinned vertex
+    error = np.where(totals[:, 0] > 0, max_value - quantized.sum(axis=1), 0)
+    largest = np.argmax(quantized, axis=1)
+    quantized[np.arange(len(quantized)), largest] += error
+
+    return quantized.astype('<u1' if bits == 8 else '<u2')
+
+
+def pack_vertices(primitive: PrimitiveData, vertex_format: str) -> Tuple[np.ndarray, str]:
+    """
+    Interleaves the vertex attributes of a primitive into a single vertex buffer.
+    :param primitive: Decoded primitive.
+    :param vertex_format: Vertex layout, one of VERTEX_FORMATS.
+    :return: Tuple containing the structured vertex array and its buffer format, with attributes in the order of
+    VERTEX_ATTRIBUTES.
+    """
+    if vertex_format not in VERTEX_FORMATS:
+        raise ValueError("Invalid vertex format: {}".format(vertex_format))
+
+    n_vertices = len(primitive.positions)
+    joint_indices = np.asarray(primitive.joint_indices)
+
+    if vertex_format == 'float':
+        layout = [('position', '<f4', 3), ('normal', '<f4', 3), ('texcoord', '<f4', 2), ('weights', '<f4', 4),
+                  ('joints', '<i4', 4)]
+        buffer_format = '3f 3f 2f 4f 4i'
+        weights = primitive.joint_weights
+        normals = primitive.normals
+        joints = joint_indices
+    else:
+        weight_bits = 16 if vertex_format == 'compact16' else 8
+        # Unused joint slots (-1) become the largest index, which the shader skips as out of range
+        joint_type = '<u1' if joint_indices.max(initial=0) < 255 else '<u2'
+        layout = [('position', '<f4', 3), ('normal', '<i2', 2), ('texcoord', '<f2', 2),
+                  ('weights', '<u1' if weight_bits == 8 else '<u2', 4), ('joints', joint_type, 4)]
+        buffer_format = '3f 2i2 2f2 {} {}'.format('4f1' if weight_bits == 8 else '4u2',
+                                                   '4u1' if joint_type == '<u1' else '4u2')
+        weights = quantize_weights(primitive.joint_weights, weight_bits)
+        normals = encode_octahedral(primitive.normals)
+        joints = joint_indices.astype(joint_type)
+
+    vertices = np.empty(n_vertices, dtype=np.dtype(layout))
+    vertices['position'] = primitive.positions
+    vertices['normal'] = normals
+    vertices['texcoord'] = primitive.texcoords
+    vertices['weights'] = weights
+    vertices['joints'] = joints
+
+    return vertices, buffer_format
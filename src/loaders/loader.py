@@ -1,4 +1,5 @@
 from abc import abstractmethod
+from typing import Any, Iterator, List, Tuple
 
 
 class Loader:
@@ -19,3 +20,12 @@ class Loader:
         :param file_path: File path.
         """
         pass
+
+    def from_files(self, file_paths: List[str]) -> Iterator[Tuple[str, Any]]:
+        """
+        Loads several files, one after the other.
+        :param file_paths: File paths.
+        :return: Iterator over (file path, file contents) pairs.
+        """
+        for file_path in file_paths:
+            yield file_path, self.from_file(file_path)
@@ -1,5 +1,6 @@
 import moderngl_window as glw
 import moderngl as gl
+from render.animation_textures import AnimationTextures
 from render.shaders import Shaders
 from render.mesh import Mesh
 from scenes.multiple_models_scene import MultipleModelsScene
@@ -22,6 +23,16 @@ class App(glw.WindowConfig):
     aspect_ratio = None
     resource_dir = (pathlib.Path(__file__).parent.parent / "resources").resolve()
     samples = 16
+    # Whether to load every model at startup, decoding them in a process pool, instead of on first use
+    preload_models = False
+    # Vertex layout of the loaded meshes: 'float', or 'compact'/'compact16' for quantized attributes
+    vertex_format = 'float'
+    # Error tolerance of the load-time keyframe reduction (model units / radians), None to keep every keyframe
+    keyframe_tolerance = None
+    # Whether to store the keyframes of the clips quantized (16-bit vectors, 48-bit quaternions)
+    compress_clips = False
+    # Layout of the uploaded joint matrices: '4x4', or '3x4' for packed affine matrices
+    palette_layout = '4x4'
 
     def __init__(self, *args: Tuple[Any], **kwargs: Any) -> None:
         """
@@ -38,11 +49,15 @@ class App(glw.WindowConfig):
         self.mouse_button = 0
         self.mpos = (0, 0)
         self.mdelta = (0, 0)
-        self.loader = GLTFLoader(self)
+        self.loader = GLTFLoader(self, vertex_format=self.vertex_format, keyframe_tolerance=self.keyframe_tolerance,
+                                 compress_clips=self.compress_clips, palette_layout=self.palette_layout)
 
         # initialize all assets
         Shaders.instance(self)
         Mesh.instance(self)
+        if self.preload_models:
+            Mesh.instance().load_all()
+        AnimationTextures.instance(self)
 
         imgui.create_context()
 
@@ -0,0 +1,238 @@
+import time
+import numpy as np
+from render.mesh import Mesh
+from render.model import Model, pose_models
+
+from typing import Dict, List, Optional, Tuple
+
+# Animation levels of detail, from the closest: smallest screen size of the skeleton (fraction of the viewport height
+# it covers), update rate in Hz (None to update every frame) and number of nodes at the end of the skeleton's chains
+# (finger tips, face and end joints) that are not sampled
+LOD_LEVELS = ((0.3, None, 0), (0.15, 30.0, 0), (0.06, 15.0, 2), (0.0, 5.0, 2))
+
+# Largest extrapolation past a pose target when its model's update is deferred, in update intervals
+MAX_EXTRAPOLATION = 1.0
+
+
+class AnimationLOD:
+    """
+    Level of detail state of a model. A model updated at a reduced rate poses its clip one update interval ahead of
+    its playback time, and its displayed pose is blended from the pose it had at the update towards that target until
+    the next update. Poses are blended in local space (translation, rotation and scale of every node), then composed
+    along the hierarchy, so that blended joints stay rigid. Targets do not cross the end of the clip; once the
+    playback loops (or jumps backwards, or the clip changes), the next update snaps to its target instead of blending
+    towards it.
+    """
+
+    def __init__(self) -> None:
+        """
+        Constructor.
+        """
+        self.level = 0
+        self.screen_size = 0.0
+        self.clip_id: Optional[int] = None
+        self.timestamp = 0.0
+        self.elapsed = 0.0
+        self.interval = 0.0
+        self.leaf_length = 0
+        # (N, TRS_SIZE) local poses blended between updates
+        self.source: Optional[np.ndarray] = None
+        self.target: Optional[np.ndarray] = None
+
+
+class AnimationStats:
+    """
+    Work done and skipped by the AnimationScheduler since it was created or reset.
+    """
+
+    def __init__(self) -> None:
+        """
+        Constructor.
+        """
+        self.frames = 0
+        self.posed = 0
+        self.interpolated = 0
+        self.deferred = 0
+        self.sampled_nodes = 0
+        self.skipped_nodes = 0
+        self.update_ms = 0.0
+
+    def reset(self) -> None:
+        """
+        Clears the statistics.
+        """
+        self.__init__()
+
+    def get_average(self, count: int) -> float:
+        """
+        Returns the average of a count per frame.
+        :param count: Total count.
+        :return: Average count per frame.
+        """
+        return count / self.frames if self.frames > 0 else 0.0
+
+    def get_skipped_ratio(self) -> float:
+        """
+        Returns the fraction of node evaluations skipped, by interpolated frames or unsampled leaf nodes.
+        :return: Skipped fraction.
+        """
+        total = self.sampled_nodes + self.skipped_nodes
+        return self.skipped_nodes / total if total > 0 else 0.0
+
+
+class AnimationScheduler:
+    """
+    Updates the poses of models with animation levels of detail. Every frame, models close to the camera are posed,
+    while distant ones are updated at reduced rates, with their leaf nodes left unsampled, and blended between
+    updates. Updates that are due are spread across frames so that the estimated posing time stays within a budget:
+    the most overdue ones come first and the others are deferred, their models extrapolating meanwhile.
+    """
+
+    def __init__(self, budget_ms: float = 2.0, levels: Tuple[tuple, ...] = LOD_LEVELS) -> None:
+        """
+        Constructor.
+        :param budget_ms: Posing time per frame, in milliseconds. Models updated every frame are always posed.
+        :param levels: Levels of detail, as LOD_LEVELS.
+        """
+        self.budget_ms = budget_ms
+        self.levels = levels
+        self.stats = AnimationStats()
+        # Running estimate of the posing time of one instance
+        self.instance_ms = 0.05
+
+    def get_level(self, model: Model, camera_position: np.ndarray, projection: np.ndarray) -> Tuple[int, float]:
+        """
+        Finds the level of detail of a model from the screen size of its skeleton.
+        :param model: Model.
+        :param camera_position: (3,) camera position.
+        :param projection: (4, 4) projection matrix.
+        :return: Tuple containing the level and the screen size.
+        """
+        positions = model.current_animation.get_node_positions()
+        low, high = positions.min(axis=0), positions.max(axis=0)
+        radius = 0.5 * float(np.linalg.norm(high - low)) * float(np.max(np.abs(model.scale)))
+        centre = np.append(0.5 * (low + high), 1.0) @ model.get_model_matrix()
+
+        distance = max(float(np.linalg.norm(centre[:3] - np.asarray(camera_position))), 1e-6)
+        screen_size = radius * float(np.asarray(projection)[1][1]) / distance
+        for level, (min_screen_size, _, _) in enumerate(self.levels):
+            if screen_size >= min_screen_size:
+                return level, screen_size
+        return len(self.levels) - 1, screen_size
+
+    def update(self, models: List[Model], dt: float, interpolation_method: str, camera_position: np.ndarray,
+               projection: np.ndarray) -> None:
+        """
+        Advances the models and updates the poses that are due, as update_models does for every model.
+        :param models: Models to update.
+        :param dt: Update time step.
+        :param interpolation_method: Interpolation method (can be 'linear' or 'hermite').
+        :param camera_position: (3,) camera position.
+        :param projection: (4, 4) projection matrix.
+        """
+        start = time.perf_counter()
+        self.stats.frames += 1
+
+        required, due = [], []
+        for model in models:
+            if model.bake_rate is not None:
+                model.update(dt, interpolation_method)
+                continue
+
+            if model.lod is None:
+                model.lod = AnimationLOD()
+            lod = model.lod
+            model.advance(dt)
+            lod.level, lod.screen_size = self.get_level(model, camera_position, projection)
+            lod.elapsed += dt
+            looped = (model.timestamp - lod.timestamp) * model.animation_speed < 0
+            if looped or lod.clip_id != model.current_animation_id:
+                lod.target = None
+
+            rate = self.levels[lod.level][1]
+            if rate is None or lod.target is None:
+                required.append(model)
+            elif lod.elapsed >= 1.0 / rate:
+                due.append(model)
+            else:
+                self.blend(model)
+                self.stats.interpolated += 1
+
+        # Most overdue first, as many as the budget left by the required updates allows, but at least one so that
+        # distant models are never starved
+        due.sort(key=lambda due_model: due_model.lod.elapsed * self.levels[due_model.lod.level][1], reverse=True)
+        n_scheduled = max(int((self.budget_ms - len(required) * self.instance_ms) / self.instance_ms), 1)
+        for model in due[n_scheduled:]:
+            self.blend(model)
+            self.stats.deferred += 1
+
+        posed = required + due[:n_scheduled]
+        if len(posed) > 0:
+            pose_start = time.perf_counter()
+            self.pose(posed, interpolation_method)
+            pose_ms = (time.perf_counter() - pose_start) * 1e3
+            self.instance_ms = 0.8 * self.instance_ms + 0.2 * pose_ms / len(posed)
+
+        self.stats.update_ms = 0.9 * self.stats.update_ms + 0.1 * (time.perf_counter() - start) * 1e3
+
+    def pose(self, models: List[Model], interpolation_method: str) -> None:
+        """
+        Poses models at their level of detail: at their playback time if they are updated every frame, one update
+        interval ahead otherwise.
+        :param models: Models to pose.
+        :param interpolation_method: Interpolation method (can be 'linear' or 'hermite').
+        """
+        groups: Dict[Tuple[str, int], List[Model]] = {}
+        for model in models:
+            groups.setdefault((model.mesh_name, self.levels[model.lod.level][2]), []).append(model)
+
+        for (mesh_name, leaf_length), group in groups.items():
+            intervals = []
+            for model in group:
+                rate = self.levels[model.lod.level][1]
+                intervals.append(0.0 if rate is None else 1.0 / rate)
+            # Within the clip, so that a blend never spans its loop
+            timestamps = np.array([np.clip(model.timestamp + interval * model.animation_speed, 0.0,
+                                           np.nextafter(model.animation_length, 0.0))
+                                   for model, interval in zip(group, intervals)], dtype=np.float64)
+
+            # Local poses start from the displayed ones, so that the nodes that are not sampled keep them
+            contexts = [model.current_animation.get_context() for model in group]
+            trs = np.stack([context.trs for context in contexts])
+            world = pose_models(mesh_name, group, timestamps, interpolation_method, leaf_length, trs)
+
+            n_skipped = len(Mesh.instance().get_crowd(mesh_name, leaf_length).skipped_nodes)
+            for model, context, interval, pose, local_pose in zip(group, contexts, intervals, world, trs):
+                lod = model.lod
+                if interval == 0.0 or lod.target is None:
+                    context.set_world(pose)
+                    context.trs[...] = local_pose
+                lod.source = np.array(context.trs) if interval > 0.0 else None
+                lod.target = local_pose
+                lod.leaf_length = leaf_length
+                lod.clip_id = model.current_animation_id
+                lod.timestamp = model.timestamp
+                lod.elapsed = 0.0
+                lod.interval = interval
+
+                n_nodes = len(model.current_animation.tracks.nodes)
+                self.stats.posed += 1
+                self.stats.sampled_nodes += n_nodes - n_skipped
+                self.stats.skipped_nodes += n_skipped
+
+    def blend(self, model: Model) -> None:
+        """
+        Blends the displayed pose of a model between its last update and its target, extrapolating if its update is
+        late.
+        :param model: Model that is not posed this frame.
+        """
+        lod = model.lod
+        self.stats.skipped_nodes += len(model.current_animation.tracks.nodes)
+        if lod.source is None:
+            return
+
+        weight = min(lod.elapsed / lod.interval, 1.0 + MAX_EXTRAPOLATION)
+        context = model.current_animation.get_context()
+        crowd = Mesh.instance().get_crowd(model.mesh_name, lod.leaf_length)
+        crowd.blend(lod.clip_id, lod.source, lod.target, weight, context.trs, context.world)
+        context.palette_dirty = True
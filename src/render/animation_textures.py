@@ -0,0 +1,110 @@
+import moderngl
+import numpy as np
+from animation.baked import BAKED_POSES, BakedClip
+from moderngl import Texture
+
+from typing import Dict, Optional, Tuple
+
+# Texture unit the animation texture is bound to (unit 0 is the model's own texture)
+ANIMATION_TEXTURE_UNIT = 1
+
+
+class AnimationTextures:
+    """
+    GPU copies of the baked clips, sampled by the vertex shader. Every baked clip is stored as a float texture with
+    four texels (the columns of the joint matrix) per joint, so that drawing a baked model only needs its current
+    frame position. As many frames as GL_MAX_TEXTURE_SIZE allows are stored side by side in each row: frame f is the
+    block f % frames_per_row of row f // frames_per_row. Clips that do not fit in a texture are not uploaded and are
+    drawn from the jointsMatrices uniform instead. Textures are released once their clip is evicted from the baked
+    pose cache.
+    """
+    _instance = None
+
+    @classmethod
+    def instance(cls, app=None) -> object:
+        """
+        Returns the singleton instance of the AnimationTextures class, or creates a new one if it does not already
+        exist.
+        :param app: Glw app.
+        :return: Singleton instance of the AnimationTextures class.
+        """
+        if cls._instance is None and app is not None:
+            cls._instance = cls(app)
+        return cls._instance
+
+    def __init__(self, app) -> None:
+        """
+        Constructor.
+        :param app: Glw app.
+        """
+        if AnimationTextures._instance is not None:
+            raise RuntimeError("AnimationTextures is a singleton and should not be instantiated more than once")
+
+        self.app = app
+        self.max_size = app.ctx.info['GL_MAX_TEXTURE_SIZE']
+        self.textures: Dict[int, Tuple[BakedClip, Optional[Texture]]] = {}
+
+    def get(self, baked: BakedClip) -> Optional[Texture]:
+        """
+        Returns the texture of a baked clip, uploading it on first use.
+        :param baked: Baked clip.
+        :return: RGBA float texture of size (4 * J * frames_per_row, rows), or None if the clip does not fit.
+        """
+        entry = self.textures.get(id(baked))
+        if entry is not None and entry[0] is baked:
+            return entry[1]
+
+        self.release_evicted()
+        layout = get_texture_layout(*baked.palettes.shape[:2], self.max_size)
+        if layout is None:
+            self.textures[id(baked)] = (baked, None)
+            return None
+
+        frames_per_row, n_rows = layout
+        n_frames, n_joints = baked.palettes.shape[:2]
+        # Pad the last row with copies of the last frame, so that every row holds frames_per_row whole frames
+        palettes = baked.palettes
+        if n_rows * frames_per_row > n_frames:
+            padding = np.repeat(palettes[-1:], n_rows * frames_per_row - n_frames, axis=0)
+            palettes = np.concatenate((palettes, padding))
+        size = (4 * n_joints * frames_per_row, n_rows)
+        texture = self.app.ctx.texture(size, 4, np.ascontiguousarray(palettes, dtype='f4').tobytes(), dtype='f4')
+        texture.filter = (moderngl.NEAREST, moderngl.NEAREST)
+        texture.repeat_x = False
+        texture.repeat_y = False
+        self.textures[id(baked)] = (baked, texture)
+        return texture
+
+    def release_evicted(self) -> None:
+        """
+        Releases the textures of the clips that are no longer in the baked pose cache.
+        """
+        cached = {id(baked) for baked in BAKED_POSES.entries.values()}
+        for key in [key for key in self.textures if key not in cached]:
+            texture = self.textures.pop(key)[1]
+            if texture is not None:
+                texture.release()
+
+    def destroy(self) -> None:
+        """
+        Releases all the textures.
+        """
+        [texture.release() for _, texture in self.textures.values() if texture is not None]
+        self.textures.clear()
+
+
+def get_texture_layout(n_frames: int, n_joints: int, max_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Returns how the frames of a baked clip are laid out in an animation texture whose sides are at most max_size.
+    :param n_frames: Number of frames.
+    :param n_joints: Number of joints.
+    :param max_size: Maximum width and height of a texture (GL_MAX_TEXTURE_SIZE).
+    :return: Number of frames per row and number of rows, or None if the clip does not fit.
+    """
+    frames_per_row = min(max_size // (4 * n_joints), n_frames)
+    if frames_per_row == 0:
+        return None
+    n_rows = -(-n_frames // frames_per_row)
+    if n_rows > max_size:
+        return None
+    return frames_per_row, n_rows
@@ -1,12 +1,52 @@
 import os
 import time
+from animation.crowd import Crowd
+from concurrent.futures import Future, ThreadPoolExecutor
 from tqdm import tqdm
 
+from typing import Dict, List, Optional, Tuple
+
+GLB_MAGIC = b'glTF'
+MODELS_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), '../../resources/models'))
+
+
+def is_model_file(file_path: str) -> bool:
+    """
+    Checks whether a file looks like a gltf model, only reading its header.
+    :param file_path: File path.
+    :return: True for .gltf files and for .glb files with a valid magic number.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.gltf':
+        return True
+    if extension == '.glb':
+        with open(file_path, 'rb') as f:
+            return f.read(4) == GLB_MAGIC
+    return False
+
+
+def index_models(models_path: str) -> Dict[str, str]:
+    """
+    Finds the model files of a models folder, one per subfolder, without decoding them.
+    :param models_path: Models folder.
+    :return: Model file path, by model (subfolder) name.
+    """
+    files = {}
+    for root, dirs, filenames in os.walk(models_path):
+        name = os.path.basename(root)
+        if name == "models":
+            continue
+        for filename in filenames:
+            model_file_path = os.path.normpath(os.path.join(root, filename))
+            if is_model_file(model_file_path):
+                files[name] = model_file_path
+    return files
+
 
 class Mesh:
     """
-    Reads all models/textures from the resources/models folder and creates corresponding GPU assets for them.
-    (vao, textures) which can then be loaded into a "model" instance using their folder names.
+    Registry of the models in the resources/models folder. At startup only the model folders are indexed; the GPU
+    assets (vao, textures) of a model are created the first time a "model" instance requests them by folder name.
     """
     _instance = None
 
@@ -21,29 +61,101 @@ class Mesh:
             cls._instance = cls(ctx)
         return cls._instance
 
-    def __init__(self, app) -> None:
+    def __init__(self, app, prefetch: bool = True) -> None:
         """
         Constructor.
         :param app: Glw app.
+        :param prefetch: Whether models can be decoded in the background before they are requested.
         """
         if Mesh._instance is not None:
             raise RuntimeError("Mesh is a singleton and should not be instantiated more than once")
 
         self.app = app
         self.data = {}
+        self.crowds: Dict[Tuple[str, int], Crowd] = {}
+        self.prefetch_enabled = prefetch
+        self.prefetching: Dict[str, Future] = {}
+        self.executor: Optional[ThreadPoolExecutor] = None
 
         start = time.time()
-        models_path = os.path.join(os.path.dirname(__file__), '../../resources/models')
-
-        for root, dirs, files in (pbar := tqdm(os.walk(models_path), bar_format="{desc}")):
-            name = os.path.basename(root)
-            if name == "models":
-                continue
-            for filename in files:
-                if os.path.splitext(filename)[1] in ['.gltf', '.glb']:
-                    pbar.set_description(f"\033[32mLoading Model: {filename}\033[0m")
-                    model_file_path = os.path.normpath(os.path.join(root, filename))
-                    self.data[name] = self.app.loader.from_file(model_file_path)
+        self.files: Dict[str, str] = index_models(MODELS_PATH)
         end = time.time()
 
-        print("elapsed??: ", end - start)
+        print(f"Indexed {len(self.files)} models in {end - start:.2f}s")
+
+    def names(self) -> List[str]:
+        """
+        Returns the names of all available models.
+        :return: Sorted list of model names.
+        """
+        return sorted(self.files)
+
+    def get(self, name: str) -> tuple:
+        """
+        Returns the GPU assets and animations of a model, loading and uploading them on first use.
+        :param name: Model name.
+        :return: Loaded model contents.
+        """
+        if name not in self.data:
+            if name not in self.files:
+                raise KeyError(f"Unknown model: {name}")
+
+            start = time.time()
+            future = self.prefetching.pop(name, None)
+            if future is not None:
+                self.data[name] = self.app.loader.upload(future.result())
+            else:
+                self.data[name] = self.app.loader.from_file(self.files[name])
+            end = time.time()
+
+            summary = f"\033[32mLoaded Model: {name}\033[0m in {end - start:.2f}s"
+            cache = getattr(self.app.loader, 'cache', None)
+            if cache is not None:
+                summary += f" (asset cache: {cache.hits} hits, {cache.misses} misses)"
+            print(summary)
+
+        return self.data[name]
+
+    def get_crowd(self, name: str, leaf_length: int = 0) -> Crowd:
+        """
+        Returns the batch evaluator posing all the instances of a model, built from its animations on first use.
+        :param name: Model name.
+        :param leaf_length: Number of nodes at the end of the skeleton's chains that are not sampled (see
+        Skeleton.get_leaf_nodes), 0 to sample every node.
+        :return: Crowd of the model's animations.
+        """
+        key = (name, leaf_length)
+        if key not in self.crowds:
+            animations = self.get(name)[1]
+            skipped_nodes = animations[0].skeleton.get_leaf_nodes(leaf_length) if leaf_length > 0 else None
+            self.crowds[key] = Crowd(animations, skipped_nodes)
+        return self.crowds[key]
+
+    def prefetch(self, name: str) -> None:
+        """
+        Starts decoding a model that is likely to be requested soon on a background thread. The GPU upload still
+        happens in get, on the thread that owns the GL context.
+        :param name: Model name.
+        """
+        if not self.prefetch_enabled or name in self.data or name in self.prefetching or name not in self.files:
+            return
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mesh-prefetch')
+
+        self.prefetching[name] = self.executor.submit(self.app.loader.load_asset, self.files[name])
+
+    def load_all(self) -> None:
+        """
+        Eagerly loads every model that has not been loaded yet, decoding them in parallel.
+        """
+        for name in list(self.prefetching):
+            self.get(name)
+
+        model_files = {path: name for name, path in self.files.items() if name not in self.data}
+
+        pbar = tqdm(total=len(model_files), bar_format="{desc}")
+        for model_file_path, contents in self.app.loader.from_files(list(model_files)):
+            pbar.set_description(f"\033[32mLoaded Model: {os.path.basename(model_file_path)}\033[0m")
+            self.data[model_files[model_file_path]] = contents
+        pbar.close()
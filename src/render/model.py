@@ -1,27 +1,14 @@
+from animation.pose import PALETTE_SIZE
+from animation.skinning import MAX_INFLUENCES
+from render.animation_textures import ANIMATION_TEXTURE_UNIT, AnimationTextures
 from render.mesh import Mesh
 from pyrr import Quaternion, Vector3, Matrix44
 import numpy as np
-from typing import Optional
-from animation.bone import Bone
+from typing import Dict, List, Optional
 from light import Light
-from animation.animation import Animation
 
 # Define MAX_BONES
-MAX_BONES = 100
-
-
-def copy_bones(bone: Bone) -> Bone:
-    """
-    Copies parent bone to the children bone.
-    :param bone: Parent bone
-    :return: Copied bone
-    """
-    copied_children = []
-    for child in bone.children:
-        copied_children.append(copy_bones(child))
-    copied_bone = Bone(bone.name, bone.inverse_bind_matrix, bone.rest_transform, copied_children, bone.local_transform,
-                       bone.rotations, bone.translations, bone.scales, bone.index)
-    return copied_bone
+MAX_BONES = PALETTE_SIZE
 
 
 class Model:
@@ -41,17 +28,18 @@ class Model:
         self.current_animation_id = None
         meshes = Mesh.instance()
         self.app = app
-        self.commands = meshes.data[mesh_name][0]
+        self.mesh_name = mesh_name
+        commands, animations = meshes.get(mesh_name)
+        self.commands = commands
         self.animations = []
-        for animation in meshes.data[mesh_name][1]:
-            self.animations.append(Animation(animation.name, animation.duration, copy_bones(animation.root_bone),
-                                             animation.root_transform))
+        for animation in animations:
+            self.animations.append(animation.copy())
 
         self.set_animation_id(0)
 
         # Check if the skeleton is properly connected
         if self.animations[0]:
-            if self.animations[0].root_bone is None:
+            if len(self.animations[0].skeleton) == 0:
                 raise ValueError("The root bone of the skeleton is not set.")
         else:
             raise ValueError("No animation data is available.")
@@ -69,6 +57,13 @@ class Model:
 
         self.n_keyframes = self.get_number_of_keyframes()
         self.max_keyframes = self.get_number_of_keyframes()
+        self.bake_rate = None
+        # Whether baked clips are sampled by the vertex shader from animation textures
+        self.gpu_animation = False
+        # Layout of the joint matrices read by the mesh's program
+        self.palette_layout = app.loader.palette_layout
+        # Animation level of detail, set by the AnimationScheduler updating the model
+        self.lod = None
 
     def update(self, dt: float, interpolation_method: str) -> None:
         """
@@ -76,6 +71,14 @@ class Model:
         :param dt: Current timestamp
         :param interpolation_method: Interpolation method (can be 'linear' or 'hermite').
         """
+        self.advance(dt)
+        self.current_animation.set_pose(self.timestamp, interpolation_method, self.n_keyframes)
+
+    def advance(self, dt: float) -> None:
+        """
+        Advances the model's playback time, without updating its pose.
+        :param dt: Update time step.
+        """
         self.timestamp += dt * self.animation_speed
         # Check if the animation reached the end
         if self.timestamp >= self.animation_length:
@@ -83,8 +86,6 @@ class Model:
         # Check if the animation reached the beginning
         elif self.timestamp < 0:
             self.timestamp = self.animation_length
- 
-        self.current_animation.set_pose(self.timestamp, interpolation_method, self.n_keyframes)
 
     def move(self, dx: float, dz: float) -> None:
         """
@@ -115,6 +116,15 @@ class Model:
         self.current_animation = self.animations[animation_id]
         self.animation_length = self.get_animation_length()
 
+    def set_bake_rate(self, bake_rate: Optional[float]) -> None:
+        """
+        Enables or disables baking mode for all the animations of the model.
+        :param bake_rate: Frames per second the animations are baked at, None to evaluate poses exactly.
+        """
+        self.bake_rate = bake_rate
+        for animation in self.animations:
+            animation.set_bake_rate(bake_rate)
+
     def get_animation_length(self) -> float:
         """
         Retrieves the animation duration from the loaded animation data.
@@ -124,24 +134,30 @@ class Model:
             return self.current_animation.duration
         return 0.0
 
-    def get_root_bone(self) -> Optional[Bone]:
-        """
-        Returns the current animation's root bone.
-        :return: Root bone of the current animation.
-        """
-        if self.current_animation:
-            return self.current_animation.root_bone
-        return None
-
     def get_number_of_keyframes(self) -> int:
         """
         Returns the total number of Keyframes of the current animation.
         :return: Total number of Keyframes of the current animation.
         """
         if self.current_animation:
-            return self.current_animation.root_bone.get_number_of_keyframes()
+            return self.current_animation.get_number_of_keyframes()
         return 0
 
+    def get_memory_report(self) -> Dict[str, int]:
+        """
+        Reports the memory used by the model's animations: the clip data (skeleton and keyframes), shared by every
+        instance of the mesh through the Mesh registry, and the pose buffers owned by this instance, only allocated for
+        the clips it has played.
+        :return: Dictionary containing the 'shared' and 'instance' sizes, in bytes.
+        """
+        shared: Dict[int, int] = {}
+        instance = 0
+        for animation in self.animations:
+            shared.update(animation.get_shared_nbytes())
+            if animation.context is not None:
+                instance += animation.context.get_nbytes()
+        return {'shared': sum(shared.values()), 'instance': instance}
+
     def calculate_model_matrix(self) -> None:
         """
         Calculates the model's transformation matrix.
@@ -170,6 +186,23 @@ class Model:
         :param view_matrix: View matrix.
         :param light: Scene light.
         """
+        # Baked clips played on the GPU only need the frame position; otherwise the palette buffer is uploaded as it is.
+        # Clips too large for an animation texture fall back to the palette buffer
+        animation_texture = None
+        palette = None
+        if self.current_animation:
+            baked_pose = self.current_animation.baked_pose
+            if self.gpu_animation and baked_pose is not None:
+                baked, timestamp = baked_pose
+                animation_texture = AnimationTextures.instance().get(baked)
+            if animation_texture is not None:
+                animation_frame = baked.get_frame_position(timestamp, self.current_animation.bake_blend)
+                n_joints = baked.palettes.shape[1]
+                frames_per_row = animation_texture.width // (4 * n_joints)
+            else:
+                palette = self.current_animation.get_palette(self.palette_layout)
+                n_joints = self.current_animation.skeleton.get_number_of_joints()
+
         for i, command in enumerate(self.commands):
             transformation_matrix, prog, texture, vao = command[3], command[2], command[1], command[0]
 
@@ -185,12 +218,74 @@ class Model:
             prog['useTexture'].value = texture is not None
 
             if self.current_animation:
-                joints_mats = self.current_animation.get_sorted_joints()
-                prog['numBones'].value = len(joints_mats)  # Pass the number of bones to the shader
-                prog['numBoneInfluences'].value = min(len(joints_mats), MAX_BONES)  # Limit number of bone influences
-                prog['jointsMatrices'].write(joints_mats.tobytes())
+                prog['numBones'].value = n_joints  # Pass the number of bones to the shader
+                # Influences per vertex: the shader indexes in_jointsIdx/in_jointsWeight, which only have four
+                prog['numBoneInfluences'].value = MAX_INFLUENCES
+                prog['useAnimationTexture'].value = animation_texture is not None
+                if animation_texture is not None:
+                    prog['animationTexture'].value = ANIMATION_TEXTURE_UNIT
+                    prog['animationFrame'].value = animation_frame
+                    prog['animationFramesPerRow'].value = frames_per_row
+                    animation_texture.use(location=ANIMATION_TEXTURE_UNIT)
+                else:
+                    prog['jointsMatrices'].write(palette)
 
             if texture is not None:
                 texture.use()
 
             vao.render()
+
+
+def update_models(models: List[Model], dt: float, interpolation_method: str) -> None:
+    """
+    Updates the poses of several models, as Model.update does, posing all the instances of a mesh with a single
+    batched Crowd call. Models in baking mode only read their baked poses and are updated one by one.
+    :param models: Models to update.
+    :param dt: Update time step.
+    :param interpolation_method: Interpolation method (can be 'linear' or 'hermite').
+    """
+    instances: Dict[str, List[Model]] = {}
+    for model in models:
+        if model.bake_rate is not None:
+            model.update(dt, interpolation_method)
+        else:
+            instances.setdefault(model.mesh_name, []).append(model)
+
+    for mesh_name, group in instances.items():
+        crowd = Mesh.instance().get_crowd(mesh_name)
+        clip_ids = np.array([model.current_animation_id for model in group], dtype=np.int64)
+        timestamps = np.array([model.timestamp for model in group], dtype=np.float64)
+        speeds = np.array([model.animation_speed for model in group], dtype=np.float64)
+        timestamps = crowd.advance(dt, clip_ids, timestamps, speeds)
+
+        world = pose_models(mesh_name, group, timestamps, interpolation_method)
+        for model, timestamp, pose in zip(group, timestamps, world):
+            model.timestamp = float(timestamp)
+            model.current_animation.get_context().set_world(pose)
+
+
+def pose_models(mesh_name: str, models: List[Model], timestamps: np.ndarray, interpolation_method: str,
+                leaf_length: int = 0, trs: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Evaluates the poses of instances of a mesh with a single batched Crowd call, starting from their current poses
+    and keyframe cursors. The cursors are updated, the poses are returned.
+    :param mesh_name: Name of the models' mesh.
+    :param models: Models to pose.
+    :param timestamps: (instances,) timestamp every model is posed at.
+    :param interpolation_method: Interpolation method (can be 'linear' or 'hermite').
+    :param leaf_length: Number of nodes at the end of the skeleton's chains that are not sampled.
+    :param trs: (instances, N, TRS_SIZE) buffer receiving the local pose of the sampled nodes, if given.
+    :return: (instances, N, 4, 4) world transforms.
+    """
+    crowd = Mesh.instance().get_crowd(mesh_name, leaf_length)
+    clip_ids = np.array([model.current_animation_id for model in models], dtype=np.int64)
+    n_keyframes = np.array([model.n_keyframes for model in models], dtype=np.int64)
+    contexts = [model.current_animation.get_context() for model in models]
+    world = np.stack([context.world for context in contexts])
+    keys = np.stack([context.keys for context in contexts])
+
+    crowd.pose(clip_ids, timestamps, interpolation_method, n_keyframes, world, keys, trs)
+
+    for context, cursor in zip(contexts, keys):
+        context.keys[...] = cursor
+    return world
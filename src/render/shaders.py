@@ -1,5 +1,9 @@
 from moderngl import Program
 
+# Defines of the variants of the base shader, by program name
+BASE_VARIANTS = {'base': {}, 'base_compact': {'COMPACT_VERTICES': 1},
+                 'base_compact16': {'COMPACT_VERTICES': 1, 'WEIGHTS_16BIT': 1}}
+
 
 class Shaders:
     """
@@ -27,7 +31,12 @@ class Shaders:
             raise RuntimeError("Shaders is a singleton and should not be instantiated more than once")
         self.shaders = {}
         self.app = app
-        self.shaders['base'] = self.app.load_program("shaders/base.glsl")
+        # Variants of the base shader reading the compact (quantized) vertex layouts, and of all of them reading
+        # packed 3x4 joint matrices
+        for name, defines in BASE_VARIANTS.items():
+            self.shaders[name] = self.app.load_program("shaders/base.glsl", defines=defines)
+            self.shaders[name + '_packed'] = self.app.load_program("shaders/base.glsl",
+                                                                   defines={**defines, 'PACKED_JOINTS': 1})
         self.shaders['lines'] = self.app.load_program("shaders/thicc_lines.glsl")
         self.shaders['skybox'] = self.app.load_program("shaders/skybox.glsl")
         self.shaders['grid'] = self.app.load_program("shaders/grid.glsl")
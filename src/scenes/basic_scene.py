@@ -3,38 +3,15 @@ from render.lines import Lines
 from render.grid import Grid
 from render.skybox import Skybox
 from scenes.scene import Scene
-from pyrr import Matrix44, Vector3
+from pyrr import Vector3
 from light import Light
 import imgui
-from animation.bone import Bone
+from animation.get_bone_connections import get_bone_connections
 import numpy as np
-from typing import List, Optional, Tuple
 import pygame
 import os
 
 
-def get_bone_connections(bone: Bone, parent_position: Optional[Matrix44] = None) -> List[Tuple[Matrix44, Matrix44]]:
-    """
-    Gets a list of bones that are connected to a given bone.
-    :param bone: Given Bone object.
-    :param parent_position: Position of the parent bone.
-    :return: List of bone connections for a given bone.
-    """
-    bone_connections = []
-
-    if bone.rest_transform is not None:
-        bone_position = bone.local_transform[:-1, 3]
-
-        if parent_position is not None:
-            bone_connections.append((parent_position, bone_position))
-
-        if bone.children:
-            for child in bone.children:
-                bone_connections.extend(get_bone_connections(child, bone_position))
-
-    return bone_connections
-
-
 class BasicScene(Scene):
     """
     Implements the scene of the application.
@@ -51,7 +28,6 @@ class BasicScene(Scene):
     max_keyframes = 2
     models = []
     current_model = ""
-    bones = None
     lines = None
     light = None
     skybox = None
@@ -77,8 +53,6 @@ class BasicScene(Scene):
 
         self.set_model('Batman')
 
-        self.bones = self.find(self.current_model).get_root_bone()
-
         self.lines = Lines(self.app, line_width=1)
         self.light = Light(
             position=Vector3([5., 5., 5.], dtype='f4'),
@@ -133,8 +107,9 @@ class BasicScene(Scene):
             if self.timestamp < 0:
                 self.timestamp = animation_length
 
-        self.current_model_entity.set_pose(self.timestamp, self.interpolation_method, self.n_keyframes)
-        bone_lines = get_bone_connections(self.current_model_entity.get_root_bone())
+        animation = self.current_model_entity.current_animation
+        animation.set_pose(self.timestamp, self.interpolation_method, self.n_keyframes)
+        bone_lines = get_bone_connections(animation)
         self.lines.update(bone_lines)
 
     def render_ui(self) -> None:
@@ -349,9 +324,10 @@ class BasicScene(Scene):
                 self.light
             )
 
-        self.grid.draw(self.app.camera.projection.matrix, self.app.camera, self.timestamp)
+        self.grid.draw(self.app.camera.projection.matrix, self.app.camera)
 
         self.render_ui()
 
         if self.show_skeleton:
-            self.lines.draw(self.app.camera.projection.matrix, self.app.camera.matrix)
+            self.lines.draw(self.app.camera.projection.matrix, self.app.camera.matrix,
+                            self.current_model_entity.get_model_matrix())
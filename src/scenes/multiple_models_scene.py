@@ -1,10 +1,14 @@
 from render.lines import Lines
+from render.mesh import Mesh
+from render.model import update_models
+from render.animation_lod import AnimationScheduler
 from render.grid import Grid
 from render.skybox import Skybox
 from scenes.scene import Scene
 from pyrr import Vector3
 from light import Light
 import imgui
+from animation.baked import BAKED_POSES
 from animation.get_bone_connections import get_bone_connections
 import pygame
 import numpy as np
@@ -19,6 +23,9 @@ class MultipleModelsScene(Scene):
     animation_speed = 1
     default_speed = False
     interpolation_method = "linear"
+    bake_rate = 30
+    animation_lod = False
+    scheduler = None
     models = []
     lines = None
     light = None
@@ -41,7 +48,11 @@ class MultipleModelsScene(Scene):
         """
         Load method.
         """
-        self.model_names = ['Batman', 'Joker']
+        meshes = Mesh.instance()
+        self.model_names = meshes.names()
+        self.scheduler = AnimationScheduler()
+        if len(self.model_names) > 0:
+            meshes.prefetch(self.model_names[self.current_model_to_add])
 
         self.lines = Lines(self.app)
         self.light = Light(
@@ -73,9 +84,12 @@ class MultipleModelsScene(Scene):
         Update method.
         :param dt: Update time step.
         """
-        for idx, model_name in enumerate(self.model_names_in_scene):
-            model = self.find(model_name)
-            model.update(dt, self.interpolation_method)
+        models = [self.find(model_name) for model_name in self.model_names_in_scene]
+        if self.animation_lod:
+            self.scheduler.update(models, dt, self.interpolation_method, np.array(self.app.camera.position),
+                                  np.array(self.app.camera.projection.matrix))
+        else:
+            update_models(models, dt, self.interpolation_method)
 
         move_speed = 0.05
         rot_speed = 0.03
@@ -129,11 +143,19 @@ class MultipleModelsScene(Scene):
 
         imgui.new_line()
         imgui.text("Available models:")
-        _, self.current_model_to_add = imgui.combo("##add_model_combo", self.current_model_to_add, self.model_names)
+        changed, self.current_model_to_add = imgui.combo("##add_model_combo", self.current_model_to_add,
+                                                         self.model_names)
+        if changed:
+            # The selected model is the most likely one to be added next
+            Mesh.instance().prefetch(self.model_names[self.current_model_to_add])
         imgui.same_line()
         if imgui.button("Add Model"):
             model_name = self.add_model(self.model_names[self.current_model_to_add])
             self.set_model(model_name)
+        imgui.same_line()
+        if imgui.button("Load All"):
+            # Decodes the models that are not loaded yet in parallel, so that adding them later is instant
+            Mesh.instance().load_all()
 
         imgui.spacing()
         imgui.spacing()
@@ -296,6 +318,32 @@ class MultipleModelsScene(Scene):
                 self.interpolation_method = "hermite"
             imgui.pop_style_color()
 
+            # Baked poses: the clip is pre-sampled at a fixed rate and played back from the baked tables
+            imgui.spacing()
+            baked = self.current_model_entity.bake_rate is not None
+            changed, baked = imgui.checkbox("Bake Poses", baked)
+            if changed:
+                self.current_model_entity.set_bake_rate(self.bake_rate if baked else None)
+            if baked:
+                changed, self.bake_rate = imgui.slider_int("Bake Rate (fps)", self.bake_rate, 10, 120)
+                if changed:
+                    self.current_model_entity.set_bake_rate(self.bake_rate)
+                _, self.current_model_entity.gpu_animation = imgui.checkbox("GPU Playback",
+                                                                            self.current_model_entity.gpu_animation)
+            imgui.text(f"Baked clips: {len(BAKED_POSES)}, {BAKED_POSES.bytes / (1 << 20):.1f} MiB, "
+                       f"hit rate {BAKED_POSES.get_hit_rate():.0%}")
+
+            lod = self.current_model_entity.lod
+            if self.animation_lod and lod is not None and self.current_model_entity.bake_rate is None:
+                _, rate, leaf_length = self.scheduler.levels[lod.level]
+                imgui.text(f"Animation LOD: {lod.level} ({'every frame' if rate is None else f'{rate:.0f} Hz'}"
+                           f"{', leaf joints skipped' if leaf_length > 0 else ''}), "
+                           f"screen size {lod.screen_size:.2f}")
+
+            memory = self.current_model_entity.get_memory_report()
+            imgui.text(f"Clip data: {memory['shared'] / 1024:.1f} KiB (shared), "
+                       f"pose buffers: {memory['instance'] / 1024:.1f} KiB (this instance)")
+
             imgui.unindent(16)
 
         imgui.spacing()
@@ -313,6 +361,22 @@ class MultipleModelsScene(Scene):
                 model.animation_speed = 0
         imgui.pop_style_color()
 
+        # Animation levels of detail: distant models are updated less often within a per-frame budget
+        imgui.spacing()
+        changed, self.animation_lod = imgui.checkbox("Animation LOD", self.animation_lod)
+        if changed:
+            for model_name in self.model_names_in_scene:
+                self.find(model_name).lod = None
+            self.scheduler.stats.reset()
+        if self.animation_lod:
+            _, self.scheduler.budget_ms = imgui.slider_float("Update Budget (ms)", self.scheduler.budget_ms, 0.1,
+                                                             10.0)
+            stats = self.scheduler.stats
+            imgui.text(f"Per frame: {stats.get_average(stats.posed):.1f} posed, "
+                       f"{stats.get_average(stats.interpolated):.1f} interpolated, "
+                       f"{stats.get_average(stats.deferred):.1f} deferred")
+            imgui.text(f"Skipped node updates: {stats.get_skipped_ratio():.0%}, update time {stats.update_ms:.2f} ms")
+
         # Add a collapsible header for Soundtrack Settings
         imgui.spacing()
         imgui.spacing()
@@ -386,6 +450,6 @@ class MultipleModelsScene(Scene):
         for model_name in self.model_names_in_scene:
             model = self.find(model_name)
             if model.show_skeleton:
-                bone_lines = get_bone_connections(model.get_root_bone())
+                bone_lines = get_bone_connections(model.current_animation)
                 self.lines.update(bone_lines)
                 self.lines.draw(self.app.camera.projection.matrix, self.app.camera.matrix, model.get_model_matrix())
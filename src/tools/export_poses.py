@@ -0,0 +1,100 @@
+"""
+Exports the poses of every clip of the models, sampled at a fixed rate, without a window or GL context. Run from the
+src directory:
+
+    python -m tools.export_poses [--rate 30] [--method hermite] [--keyframes N] [--format npz] [--output DIR]
+                                 [file.gltf ...]
+
+Without files, every model in resources/models is exported. With the npz format, every clip is written to
+<output>/<model>/<clip>.npz, holding the timestamps, the world transforms and local TRS of the nodes and the
+skeleton's node names and parents; with the npy format, to <clip>_timestamps.npy, <clip>_world.npy and <clip>_trs.npy.
+"""
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+from animation.animation import Animation
+from loaders.GltfLoader import GLTFLoader
+from render.mesh import MODELS_PATH, index_models
+
+from typing import Dict, List, Optional
+
+DEFAULT_OUTPUT = os.path.normpath(os.path.join(os.path.dirname(__file__), '../../resources/poses'))
+
+
+def get_clip_file_name(index: int, animation: Animation) -> str:
+    """
+    Builds the base name of the files of a clip, unique within its model.
+    :param index: Index of the clip in its model.
+    :param animation: Clip.
+    :return: File name, without extension.
+    """
+    return f"{index:02d}_{re.sub(r'[^A-Za-z0-9_.-]+', '_', animation.name)}"
+
+
+def export_clip(animation: Animation, file_path: str, rate: float, interpolation_method: str,
+                n_keyframes: int, file_format: str) -> int:
+    """
+    Samples the poses of a clip and writes them.
+    :param animation: Clip.
+    :param file_path: Output path, without extension.
+    :param rate: Poses per second.
+    :param interpolation_method: Interpolation method ('linear' or 'hermite').
+    :param n_keyframes: Number of equidistant Keyframes to use for the interpolation, 0 for all of them.
+    :param file_format: 'npz' or 'npy'.
+    :return: Number of poses written.
+    """
+    n_keyframes = n_keyframes if n_keyframes > 0 else animation.get_number_of_keyframes()
+    n_keyframes = max(min(n_keyframes, animation.get_number_of_keyframes()), 2)
+    timestamps = np.arange(int(np.ceil(animation.duration * rate))) / rate
+
+    world = animation.sample_poses(timestamps, interpolation_method, n_keyframes).astype(np.float32)
+    trs = animation.sample_poses(timestamps, interpolation_method, n_keyframes, 'local').astype(np.float32)
+
+    if file_format == 'npz':
+        np.savez(file_path + '.npz', timestamps=timestamps, world=world, trs=trs,
+                 names=np.array(animation.skeleton.names), parents=animation.skeleton.parents)
+    else:
+        np.save(file_path + '_timestamps.npy', timestamps)
+        np.save(file_path + '_world.npy', world)
+        np.save(file_path + '_trs.npy', trs)
+    return len(timestamps)
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """
+    Runs the export.
+    :param args: Command line arguments, sys.argv if None.
+    """
+    parser = argparse.ArgumentParser(description="Exports the poses of every clip of the models.")
+    parser.add_argument('files', nargs='*', help="gltf files, every model in resources/models if none")
+    parser.add_argument('--rate', type=float, default=30.0, help="poses per second")
+    parser.add_argument('--method', choices=('linear', 'hermite'), default='hermite', help="interpolation method")
+    parser.add_argument('--keyframes', type=int, default=0, help="equidistant keyframes to use, 0 for all")
+    parser.add_argument('--format', choices=('npz', 'npy'), default='npz', help="output format")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="output folder")
+    options = parser.parse_args(args)
+
+    if options.files:
+        files: Dict[str, str] = {os.path.splitext(os.path.basename(path))[0]: path for path in options.files}
+    else:
+        files = index_models(MODELS_PATH)
+
+    loader = GLTFLoader(None)
+    for name, file_path in sorted(files.items()):
+        start = time.time()
+        animations = loader.get_animations(loader.load_asset(file_path))
+        model_output = os.path.join(options.output, name)
+        os.makedirs(model_output, exist_ok=True)
+
+        n_poses = 0
+        for index, animation in enumerate(animations):
+            n_poses += export_clip(animation, os.path.join(model_output, get_clip_file_name(index, animation)),
+                                   options.rate, options.method, options.keyframes, options.format)
+        print(f"Exported {name}: {len(animations)} clips, {n_poses} poses in {time.time() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
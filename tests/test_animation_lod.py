@@ -0,0 +1,164 @@
+import numpy as np
+import pytest
+from render.animation_lod import AnimationScheduler
+from render.mesh import Mesh
+from render.model import Model
+from test_pose_threads import DURATION, synthetic_animation
+
+from typing import List
+
+MESH_NAME = 'synthetic'
+
+
+class Loader:
+    """
+    Loader settings read by Model.
+    """
+    palette_layout = '4x4'
+
+
+class App:
+    """
+    Headless application: models are registered in the Mesh registry directly, nothing is uploaded.
+    """
+    loader = Loader()
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(Mesh, '_instance', None)
+    application = App()
+    first = synthetic_animation(0, scale_range=0.0)
+    second = synthetic_animation(1, first.skeleton, scale_range=0.0)
+    Mesh.instance(application).data[MESH_NAME] = ([], [first, second])
+    return application
+
+
+def create_models(app: App, n_models: int) -> List[Model]:
+    """
+    Creates models of the synthetic mesh playing both clips.
+    :param app: Application.
+    :param n_models: Number of models.
+    :return: Models.
+    """
+    models = []
+    for i in range(n_models):
+        model = Model(app, MESH_NAME)
+        model.set_animation_id(i % 2)
+        model.timestamp = 0.1 * i
+        models.append(model)
+    return models
+
+
+def exact_pose(model: Model, timestamp: float) -> np.ndarray:
+    """
+    Evaluates the pose of a model's clip without level of detail.
+    :param model: Model.
+    :param timestamp: Timestamp.
+    :return: (N, 4, 4) world transforms.
+    """
+    animation = model.current_animation.copy()
+    animation.set_pose(timestamp, 'linear', model.n_keyframes)
+    return animation.get_world_transforms()
+
+
+def exact_trs(model: Model, timestamp: float) -> np.ndarray:
+    """
+    Evaluates the local pose of a model's clip without level of detail.
+    :param model: Model.
+    :param timestamp: Timestamp.
+    :return: (N, TRS_SIZE) local translation, rotation and scale.
+    """
+    return model.current_animation.sample_poses(np.array([timestamp]), 'linear', model.n_keyframes, 'local')[0]
+
+
+def test_levels_follow_the_screen_size(app):
+    scheduler = AnimationScheduler()
+    model = create_models(app, 1)[0]
+    model.move(3.0, -2.0)
+    projection = np.identity(4)
+
+    positions = model.current_animation.get_node_positions()
+    centre = np.append(0.5 * (positions.min(axis=0) + positions.max(axis=0)), 1.0) @ model.get_model_matrix()
+    # Screen size at distance 1, i.e. the radius of the skeleton
+    _, radius = scheduler.get_level(model, centre[:3] + (0.0, 0.0, 1.0), projection)
+
+    for expected_level, screen_size in enumerate((0.5, 0.2, 0.1, 0.01)):
+        camera_position = centre[:3] + (0.0, 0.0, radius / screen_size)
+        level, size = scheduler.get_level(model, camera_position, projection)
+        assert level == expected_level
+        assert size == pytest.approx(screen_size)
+
+
+def test_due_updates_beyond_the_budget_are_deferred(app):
+    # Every model at 5 Hz, and a budget that only lets the most overdue update through
+    scheduler = AnimationScheduler(budget_ms=0.0, levels=((0.0, 5.0, 0),))
+    models = create_models(app, 4)
+    camera_position, projection = np.array([0.0, 0.0, 10.0]), np.identity(4)
+
+    # The first update of every model is required
+    scheduler.update(models, 0.0, 'linear', camera_position, projection)
+    assert scheduler.stats.posed == 4 and scheduler.stats.deferred == 0
+
+    # Between updates, models are interpolated
+    scheduler.update(models, 0.1, 'linear', camera_position, projection)
+    assert scheduler.stats.posed == 4 and scheduler.stats.interpolated == 4
+
+    # All due: one is posed, the others are deferred and extrapolate
+    models[2].lod.elapsed += 0.05
+    scheduler.update(models, 0.1, 'linear', camera_position, projection)
+    assert scheduler.stats.posed == 5 and scheduler.stats.deferred == 3
+    assert models[2].lod.elapsed == 0.0
+    assert all(model.lod.elapsed == pytest.approx(0.2) for i, model in enumerate(models) if i != 2)
+
+    # The deferred models come next
+    scheduler.update(models, 0.0, 'linear', camera_position, projection)
+    assert scheduler.stats.posed == 6 and scheduler.stats.deferred == 5
+
+
+def test_blended_poses_stay_rigid(app):
+    scheduler = AnimationScheduler(budget_ms=0.0, levels=((0.0, 5.0, 0),))
+    models = create_models(app, 2)
+    camera_position, projection = np.array([0.0, 0.0, 10.0]), np.identity(4)
+    scheduler.update(models, 0.0, 'linear', camera_position, projection)
+
+    # Interpolated, then deferred (extrapolated up to twice the update interval)
+    for _ in range(12):
+        scheduler.update(models, 0.05, 'linear', camera_position, projection)
+        for model in models:
+            world = model.current_animation.get_world_transforms()
+            linear = world[:, :3, :3]
+            identity = np.tile(np.identity(3), (len(world), 1, 1))
+            np.testing.assert_allclose(linear @ linear.transpose(0, 2, 1), identity, rtol=0, atol=1e-9)
+            np.testing.assert_allclose(np.linalg.det(linear), 1.0, rtol=0, atol=1e-9)
+    assert scheduler.stats.interpolated > 0 and scheduler.stats.deferred > 0
+
+    # Blending all the way reaches the target pose
+    model = models[0]
+    lod = model.lod
+    context = model.current_animation.get_context()
+    Mesh.instance().get_crowd(MESH_NAME).blend(lod.clip_id, lod.source, lod.target, 1.0, context.trs, context.world)
+    np.testing.assert_allclose(context.world, exact_pose(model, lod.timestamp + lod.interval), rtol=0, atol=1e-9)
+
+
+def test_updates_snap_to_their_target_after_a_loop(app):
+    scheduler = AnimationScheduler(levels=((0.0, 5.0, 0),))
+    model = create_models(app, 1)[0]
+    camera_position, projection = np.array([0.0, 0.0, 10.0]), np.identity(4)
+
+    model.timestamp = DURATION - 0.15
+    scheduler.update([model], 0.0, 'linear', camera_position, projection)
+    # Targets stop at the end of the clip
+    assert model.lod.timestamp == DURATION - 0.15
+    np.testing.assert_allclose(model.lod.target, exact_trs(model, np.nextafter(DURATION, 0.0)), rtol=0, atol=1e-12)
+
+    scheduler.update([model], 0.1, 'linear', camera_position, projection)
+    assert scheduler.stats.interpolated == 1
+
+    # The playback loops: the next update is not blended from the end of the clip but snaps to its new target
+    scheduler.update([model], 0.1, 'linear', camera_position, projection)
+    assert model.timestamp == 0.0
+    assert scheduler.stats.posed == 2 and scheduler.stats.interpolated == 1
+    np.testing.assert_allclose(model.current_animation.get_world_transforms(), exact_pose(model, 0.2), rtol=0,
+                               atol=1e-12)
+
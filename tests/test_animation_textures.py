@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from animation.baked import BakedClip
+from animation.skinning import MAX_INFLUENCES, skin
+from render.animation_textures import ANIMATION_TEXTURE_UNIT, AnimationTextures, get_texture_layout
+from test_pose_threads import N_KEYFRAMES, synthetic_animation
+from test_skinning import ctx, shader_skin  # noqa: F401
+
+N_VERTICES = 200
+RATE = 30.0
+
+
+class App:
+    """
+    Application holding the GL context AnimationTextures uploads to.
+    """
+
+    def __init__(self, ctx) -> None:
+        self.ctx = ctx
+
+
+@pytest.fixture
+def textures(ctx, monkeypatch):
+    monkeypatch.setattr(AnimationTextures, '_instance', None)
+    animation_textures = AnimationTextures.instance(App(ctx))
+    yield animation_textures
+    animation_textures.destroy()
+
+
+@pytest.mark.parametrize('n_frames, n_joints, max_size, expected', [
+    (61, 8, 16384, (61, 1)),
+    (61, 8, 256, (8, 8)),
+    (64, 8, 256, (8, 8)),
+    (61, 8, 64, (2, 31)),
+    (61, 8, 16, None),
+    (61, 8, 60, None),
+])
+def test_texture_layout(n_frames, n_joints, max_size, expected):
+    assert get_texture_layout(n_frames, n_joints, max_size) == expected
+
+
+@pytest.mark.parametrize('max_size', [None, 256, 64])
+def test_wrapped_frames_match_palettes(ctx, textures, max_size):
+    baked = BakedClip(synthetic_animation(0), 'linear', N_KEYFRAMES, RATE)
+    n_frames, n_joints = baked.palettes.shape[:2]
+    if max_size is not None:
+        textures.max_size = max_size
+    texture = textures.get(baked)
+    assert textures.get(baked) is texture
+    assert texture.width <= textures.max_size and texture.height <= textures.max_size
+    frames_per_row = texture.width // (4 * n_joints)
+
+    rng = np.random.default_rng(0)
+    positions = rng.normal(size=(N_VERTICES, 3)).astype(np.float32)
+    normals = np.tile(np.array([0.0, 0.0, 1.0], dtype=np.float32), (N_VERTICES, 1))
+    joint_indices = rng.integers(0, n_joints, size=(N_VERTICES, MAX_INFLUENCES)).astype(np.int32)
+    joint_weights = rng.uniform(0.1, 1.0, size=(N_VERTICES, MAX_INFLUENCES)).astype(np.float32)
+    joint_weights /= joint_weights.sum(axis=1, keepdims=True)
+
+    texture.use(location=ANIMATION_TEXTURE_UNIT)
+    # First and last frames of the first two rows, and the padded last row
+    for frame in sorted({0, 1, frames_per_row - 1, min(frames_per_row, n_frames - 1), n_frames // 2, n_frames - 1}):
+        uniforms = {'useAnimationTexture': True, 'animationTexture': ANIMATION_TEXTURE_UNIT,
+                    'animationFrame': float(frame), 'animationFramesPerRow': frames_per_row}
+        expected, _ = skin(positions, normals, joint_indices, joint_weights, baked.palettes[frame])
+        # The jointsMatrices uniform is left at zero: the joints come from the texture only
+        skinned = shader_skin(ctx, positions, normals, joint_indices, joint_weights, np.zeros((n_joints, 4, 4)),
+                              n_joints, uniforms=uniforms)
+        np.testing.assert_allclose(skinned, expected, rtol=0, atol=1e-5)
+
+
+def test_oversized_clips_are_not_uploaded(textures):
+    baked = BakedClip(synthetic_animation(0), 'linear', N_KEYFRAMES, RATE)
+    textures.max_size = 16
+    assert textures.get(baked) is None
+    assert textures.get(baked) is None
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from animation.crowd import Crowd
+from animation.pose import SELECTION_SIZE
+from test_pose_threads import DURATION, N_KEYFRAMES, pose, synthetic_animation
+
+from typing import List
+
+N_CLIPS = 3
+TIMESTAMPS = (0.0, 0.37, 1.23, 1.99, -0.4, -2.6, 2.6)
+
+
+def create_clips() -> List:
+    """
+    Creates clips sharing one skeleton.
+    :return: Animations.
+    """
+    first = synthetic_animation(0)
+    return [first] + [synthetic_animation(seed, first.skeleton) for seed in range(1, N_CLIPS)]
+
+
+@pytest.mark.parametrize('method', ['linear', 'hermite'])
+@pytest.mark.parametrize('n_keyframes', [2, 7, N_KEYFRAMES])
+def test_crowd_poses_match_animation_poses(method, n_keyframes):
+    clips = create_clips()
+    crowd = Crowd(clips)
+    # Every clip at every timestamp, instances of different clips interleaved
+    clip_ids = np.tile(np.arange(N_CLIPS), len(TIMESTAMPS))
+    timestamps = np.repeat(TIMESTAMPS, N_CLIPS)
+
+    world = crowd.pose(clip_ids, timestamps, method, n_keyframes)
+    joints = crowd.get_sorted_joints(world)
+
+    for i, (clip_id, timestamp) in enumerate(zip(clip_ids, timestamps)):
+        expected_world, expected_joints = pose(clips[clip_id].copy(), timestamp, method, n_keyframes)
+        np.testing.assert_array_equal(world[i], expected_world)
+        np.testing.assert_array_equal(joints[i], expected_joints)
+
+
+@pytest.mark.parametrize('method', ['linear', 'hermite'])
+def test_crowd_poses_with_mixed_key_counts_and_cursors(method):
+    clips = create_clips()
+    crowd = Crowd(clips)
+    rng = np.random.default_rng(0)
+    n_instances = 24
+    clip_ids = rng.integers(0, N_CLIPS, n_instances)
+    n_keyframes = rng.choice([2, 7, N_KEYFRAMES], n_instances)
+    world = crowd.allocate(n_instances)
+    keys = np.zeros((n_instances, SELECTION_SIZE), dtype=np.int64)
+
+    # Cursors carried over from the previous call, playing forwards, backwards and across the loop
+    for timestamps in (rng.uniform(0.0, DURATION, n_instances), rng.uniform(-DURATION, DURATION, n_instances),
+                       rng.uniform(-2 * DURATION, 2 * DURATION, n_instances)):
+        world = crowd.pose(clip_ids, timestamps, method, n_keyframes, world, keys)
+        joints = crowd.get_sorted_joints(world)
+
+        for i in range(n_instances):
+            expected_world, expected_joints = pose(clips[clip_ids[i]].copy(), timestamps[i], method, n_keyframes[i])
+            np.testing.assert_array_equal(world[i], expected_world)
+            np.testing.assert_array_equal(joints[i], expected_joints)
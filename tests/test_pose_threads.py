@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from animation.animation import Animation
+from animation.keyframe import JointChannels, Track
+from animation.skeleton import Skeleton
+
+from typing import List, Optional, Tuple
+
+N_NODES = 8
+N_KEYFRAMES = 24
+DURATION = 2.0
+
+
+def synthetic_animation(seed: int, skeleton: Optional[Skeleton] = None, scale_range: float = 0.1) -> Animation:
+    """
+    Creates a small clip: a branching skeleton with bind poses, rotating joints and a moving root.
+    :param seed: Random seed.
+    :param skeleton: Skeleton to play the clip on, a new one if None.
+    :param scale_range: Largest deviation of the animated scales from 1.
+    :return: Animation.
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = np.linspace(0.0, DURATION, N_KEYFRAMES)
+    parents = np.array([-1, 0, 1, 2, 1, 4, 0, 6])
+    rest_transforms = np.tile(np.identity(4), (N_NODES, 1, 1))
+    rest_transforms[:, :3, 3] = rng.uniform(-0.5, 0.5, (N_NODES, 3))
+    inverse_binds = np.tile(np.identity(4), (N_NODES, 1, 1))
+    inverse_binds[:, :3, 3] = rng.uniform(-1.0, 1.0, (N_NODES, 3))
+    if skeleton is None:
+        skeleton = Skeleton([f'node{i}' for i in range(N_NODES)], parents, np.arange(N_NODES), rest_transforms,
+                            inverse_binds)
+
+    channels = {}
+    for node in range(N_NODES):
+        axis = rng.normal(size=3)
+        axis /= np.linalg.norm(axis)
+        angle = rng.uniform(0.5, 2.0) * np.sin(2 * np.pi * timestamps / DURATION + rng.uniform(0, 6))
+        rotations = np.concatenate((axis[None] * np.sin(angle / 2)[:, None], np.cos(angle / 2)[:, None]), axis=1)
+        translations = rest_transforms[node, :3, 3] + rng.normal(scale=0.05, size=(N_KEYFRAMES, 3))
+        scales = 1.0 + rng.uniform(-scale_range, scale_range, (N_KEYFRAMES, 3))
+        channels[node] = JointChannels(Track(timestamps, translations), Track(timestamps, rotations),
+                                       Track(timestamps, scales))
+
+    return Animation(f'clip{seed}', DURATION, skeleton, channels)
+
+
+def pose(animation: Animation, timestamp: float, interpolation_method: str,
+         n_keyframes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Poses an animation and copies its results.
+    :param animation: Animation.
+    :param timestamp: Timestamp.
+    :param interpolation_method: Interpolation method.
+    :param n_keyframes: Number of equidistant keyframes to use.
+    :return: Tuple containing the world transforms and the joint palette.
+    """
+    animation.set_pose(timestamp, interpolation_method, n_keyframes)
+    return animation.get_world_transforms().copy(), animation.get_sorted_joints().copy()
+
+
+def get_jobs() -> List[Tuple[int, float, str, int]]:
+    """
+    Builds the poses to evaluate: every clip at several timestamps, with both methods and several key counts.
+    :return: List of (clip index, timestamp, method, number of keyframes).
+    """
+    return [(clip, timestamp, method, n_keyframes)
+            for clip in range(3)
+            for timestamp in (0.0, 0.37, 1.23, 1.99, 2.6)
+            for method in ('linear', 'hermite')
+            for n_keyframes in (2, 7, N_KEYFRAMES)]
+
+
+def test_threaded_poses_match_serial_poses():
+    clips = [synthetic_animation(seed) for seed in range(3)]
+    jobs = get_jobs()
+
+    # Serial references, each posed on its own copy
+    expected = [pose(clips[clip].copy(), timestamp, method, n_keyframes)
+                for clip, timestamp, method, n_keyframes in jobs]
+
+    # One instance per job, so that threads share clip data but never a pose, repeated to vary the interleaving
+    for _ in range(5):
+        instances = [clips[clip].copy() for clip, _, _, _ in jobs]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda args: pose(instances[args[0]], *jobs[args[0]][1:]),
+                                        enumerate(jobs)))
+
+        for job, (world, palette), (expected_world, expected_palette) in zip(jobs, results, expected):
+            assert np.array_equal(world, expected_world), job
+            assert np.array_equal(palette, expected_palette), job
+
+
+def test_threads_reusing_instances_match_serial_poses():
+    clips = [synthetic_animation(seed) for seed in range(3)]
+    jobs = get_jobs()
+    expected = [pose(clips[clip].copy(), timestamp, method, n_keyframes)
+                for clip, timestamp, method, n_keyframes in jobs]
+
+    # Every thread keeps posing its own instance of each clip, switching timestamps, methods and key counts
+    def pose_all(worker: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        instances = [clip.copy() for clip in clips]
+        order = np.random.default_rng(worker).permutation(len(jobs))
+        results = [None] * len(jobs)
+        for i in order:
+            clip, timestamp, method, n_keyframes = jobs[i]
+            results[i] = pose(instances[clip], timestamp, method, n_keyframes)
+        return results
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for results in executor.map(pose_all, range(4)):
+            for job, (world, palette), (expected_world, expected_palette) in zip(jobs, results, expected):
+                assert np.array_equal(world, expected_world), job
+                assert np.array_equal(palette, expected_palette), job
@@ -0,0 +1,85 @@
+import numpy as np
+from animation.animation import Animation
+from animation.skeleton import Skeleton, decompose_transforms
+from test_pose_threads import N_NODES, synthetic_animation
+
+from typing import Optional
+
+
+def compose(trs: np.ndarray) -> np.ndarray:
+    """
+    Builds T @ R @ S matrices from translations, xyzw quaternions and scales.
+    :param trs: (N, 10) translation, rotation and scale.
+    :return: (N, 4, 4) matrices.
+    """
+    x, y, z, w = trs[:, 3:7].T
+    rotations = np.stack((
+        np.stack((1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)), axis=1),
+        np.stack((2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)), axis=1),
+        np.stack((2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)), axis=1)), axis=1)
+    matrices = np.tile(np.identity(4), (len(trs), 1, 1))
+    matrices[:, :3, :3] = rotations * trs[:, None, 7:10]
+    matrices[:, :3, 3] = trs[:, :3]
+    return matrices
+
+
+def rest_posed_animation(animated_nodes: np.ndarray, root_transform: Optional[np.ndarray] = None) -> Animation:
+    """
+    Creates a clip of the synthetic skeleton with rotated, scaled (one of them mirrored) rest transforms, only
+    animating some of its nodes.
+    :param animated_nodes: Nodes keeping their keyframes.
+    :param root_transform: Transform of the root's parent.
+    :return: Animation.
+    """
+    rng = np.random.default_rng(7)
+    animation = synthetic_animation(0)
+    rest_trs = np.zeros((N_NODES, 10))
+    rest_trs[:, :3] = rng.normal(size=(N_NODES, 3))
+    rest_trs[:, 3:7] = rng.normal(size=(N_NODES, 4))
+    rest_trs[:, 3:7] /= np.linalg.norm(rest_trs[:, 3:7], axis=1, keepdims=True)
+    rest_trs[:, 7:10] = rng.uniform(0.5, 2.0, (N_NODES, 3))
+    rest_trs[3, 7] *= -1
+
+    skeleton = animation.skeleton
+    skeleton = Skeleton(skeleton.names, skeleton.parents, skeleton.joint_indices, compose(rest_trs),
+                        skeleton.inverse_binds, root_transform)
+    channels = {node: animation.channels[node] for node in animated_nodes}
+    return Animation(animation.name, animation.duration, skeleton, channels)
+
+
+def test_decompose_transforms_round_trip():
+    animation = rest_posed_animation(np.arange(N_NODES))
+    rest_trs = animation.skeleton.rest_trs
+
+    np.testing.assert_allclose(compose(rest_trs), animation.skeleton.rest_transforms, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(np.linalg.norm(rest_trs[:, 3:7], axis=1), 1.0, rtol=0, atol=1e-12)
+    assert rest_trs[3, 7] < 0
+    np.testing.assert_allclose(decompose_transforms(np.tile(np.identity(4), (2, 1, 1))),
+                               [[0, 0, 0, 0, 0, 0, 1, 1, 1, 1]] * 2, rtol=0, atol=0)
+
+
+def test_local_poses_keep_the_rest_transform_of_nodes_the_clip_does_not_animate():
+    animated_nodes = np.array([0, 1, 2, 6])
+    root_transform = np.identity(4)
+    root_transform[:3, 3] = (1, -2, 3)
+    animation = rest_posed_animation(animated_nodes, root_transform)
+    timestamps = np.array([0.0, 0.4, 1.3, 1.9])
+
+    for method in ('linear', 'hermite'):
+        trs = animation.sample_poses(timestamps, method, 7, 'local')
+        world = animation.sample_poses(timestamps, method, 7)
+
+        still = np.setdiff1d(np.arange(N_NODES), animated_nodes)
+        assert np.array_equal(trs[:, still], np.broadcast_to(animation.skeleton.rest_trs[still], trs[:, still].shape))
+
+        # As set_pose does, the world transforms of the other nodes are left to their rest transform
+        assert np.array_equal(world[:, still],
+                              np.broadcast_to(animation.skeleton.rest_transforms[still], world[:, still].shape))
+
+        # Composing the local transforms along the hierarchy gives back the world transforms of the animated nodes
+        for t in range(len(timestamps)):
+            local = compose(trs[t])
+            expected = np.empty_like(local)
+            for node, parent in enumerate(animation.skeleton.parents):
+                expected[node] = (expected[parent] if parent > -1 else root_transform) @ local[node]
+            np.testing.assert_allclose(world[t, animated_nodes], expected[animated_nodes], rtol=0, atol=1e-7)
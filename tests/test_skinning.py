@@ -0,0 +1,251 @@
+import os
+
+import numpy as np
+import pytest
+from animation.skinning import MAX_INFLUENCES, skin, skin_vertices
+from loaders.GltfLoader.gltf_loader_asset import PrimitiveData
+
+from typing import Dict, Optional, Tuple
+
+N_VERTICES = 500
+N_JOINTS = 12
+N_POSES = 6
+# Size of the jointsMatrices uniform of base.glsl
+MAX_BONES = 100
+SHADER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources', 'shaders',
+                           'base.glsl')
+
+
+@pytest.fixture(scope='module')
+def ctx():
+    moderngl = pytest.importorskip('moderngl')
+    try:
+        context = moderngl.create_standalone_context(backend='egl')
+    except Exception as e:
+        pytest.skip(f"No headless GL context: {e}")
+    # Transform feedback needs a bound framebuffer on some drivers (llvmpipe)
+    framebuffer = context.simple_framebuffer((4, 4))
+    framebuffer.use()
+    yield context
+    framebuffer.release()
+    context.release()
+
+
+def shader_skin(ctx, positions: np.ndarray, normals: np.ndarray, joint_indices: np.ndarray,
+                joint_weights: np.ndarray, palette: np.ndarray, n_joints: int, packed: bool = False,
+                uniforms: Optional[Dict[str, object]] = None) -> np.ndarray:
+    """
+    Runs the vertex stage of base.glsl through transform feedback, with the uniforms Model.draw sets and an identity
+    model matrix, and reads back fragPos.
+    :param ctx: Moderngl context.
+    :param positions: (V, 3) vertex positions.
+    :param normals: (V, 3) vertex normals.
+    :param joint_indices: (V, 4) joint indices.
+    :param joint_weights: (V, 4) joint weights.
+    :param palette: (J, 4, 4) transposed joint matrices, as returned by Animation.get_sorted_joints.
+    :param n_joints: numBones.
+    :param packed: Whether to use the PACKED_JOINTS variant, uploading the first three rows of the joint matrices.
+    :param uniforms: Other uniforms to set, by name.
+    :return: (V, 3) skinned positions.
+    """
+    import moderngl
+
+    lines = open(SHADER_PATH).read().split('\n')
+    defines = ['#define VERTEX_SHADER 1'] + (['#define PACKED_JOINTS 1'] if packed else [])
+    prog = ctx.program(vertex_shader='\n'.join(lines[:1] + defines + lines[1:]), varyings=['fragPos'])
+
+    uploaded = np.zeros((MAX_BONES, 3 if packed else 4, 4), dtype=np.float32)
+    uploaded[:len(palette)] = palette.transpose(0, 2, 1)[:, :3] if packed else palette
+    prog['jointsMatrices'].write(uploaded.tobytes())
+    prog['numBones'].value = n_joints
+    prog['numBoneInfluences'].value = MAX_INFLUENCES
+    prog['model'].write(np.identity(4, dtype=np.float32).tobytes())
+    for name, value in (uniforms or {}).items():
+        prog[name].value = value
+
+    attributes = [('in_position', positions, '3f'), ('in_normal', normals, '3f'),
+                  ('in_jointsWeight', joint_weights, '4f'), ('in_jointsIdx', joint_indices, '4i')]
+    buffers = [(ctx.buffer(np.ascontiguousarray(data, dtype='i4' if fmt == '4i' else 'f4')), fmt, name)
+               for name, data, fmt in attributes if name in prog]
+    vao = ctx.vertex_array(prog, buffers)
+    output = ctx.buffer(reserve=len(positions) * 3 * 4)
+    vao.transform(output, moderngl.POINTS, vertices=len(positions))
+    skinned = np.frombuffer(output.read(), dtype=np.float32).reshape(len(positions), 3).copy()
+
+    for buffer, _, _ in buffers:
+        buffer.release()
+    output.release()
+    vao.release()
+    prog.release()
+    return skinned
+
+
+def random_palettes(rng: np.random.Generator, n_poses: int) -> np.ndarray:
+    """
+    Creates random affine joint matrices (rotation, non-uniform scale and translation), transposed as in the palette.
+    :param rng: Random generator.
+    :param n_poses: Number of poses.
+    :return: (T, J, 4, 4) float32 palettes.
+    """
+    matrices = np.tile(np.identity(4), (n_poses, N_JOINTS, 1, 1))
+    rotations, _ = np.linalg.qr(rng.normal(size=(n_poses, N_JOINTS, 3, 3)))
+    matrices[..., :3, :3] = rotations * rng.uniform(0.5, 1.5, (n_poses, N_JOINTS, 1, 3))
+    matrices[..., :3, 3] = rng.normal(size=(n_poses, N_JOINTS, 3))
+    return matrices.transpose(0, 1, 3, 2).astype(np.float32)
+
+
+def random_mesh(rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Creates vertices with one to four influences, the unused ones as the loader decodes them (index -1, weight 0).
+    :param rng: Random generator.
+    :return: Tuple containing the positions, normals, joint indices and joint weights.
+    """
+    positions = rng.normal(size=(N_VERTICES, 3)).astype(np.float32)
+    normals = rng.normal(size=(N_VERTICES, 3))
+    normals = (normals / np.linalg.norm(normals, axis=1, keepdims=True)).astype(np.float32)
+
+    joint_indices = rng.integers(0, N_JOINTS, size=(N_VERTICES, MAX_INFLUENCES)).astype(np.int32)
+    joint_weights = rng.uniform(0.1, 1.0, size=(N_VERTICES, MAX_INFLUENCES)).astype(np.float32)
+    unused = np.arange(MAX_INFLUENCES)[None] >= rng.integers(1, MAX_INFLUENCES + 1, size=(N_VERTICES, 1))
+    joint_indices[unused] = -1
+    joint_weights[unused] = 0.0
+    joint_weights /= joint_weights.sum(axis=1, keepdims=True)
+    return positions, normals, joint_indices, joint_weights
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_single_palette_matches_shader(ctx, packed):
+    rng = np.random.default_rng(0)
+    positions, normals, joint_indices, joint_weights = random_mesh(rng)
+    palette = random_palettes(rng, 1)[0]
+
+    skinned_positions, _ = skin(positions, normals, joint_indices, joint_weights, palette)
+    expected = shader_skin(ctx, positions, normals, joint_indices, joint_weights, palette, N_JOINTS, packed)
+
+    assert skinned_positions.shape == (N_VERTICES, 3) and skinned_positions.dtype == np.float32
+    np.testing.assert_allclose(skinned_positions, expected, rtol=0, atol=1e-5)
+
+
+def test_batched_palettes_match_shader(ctx):
+    rng = np.random.default_rng(1)
+    positions, normals, joint_indices, joint_weights = random_mesh(rng)
+    palettes = random_palettes(rng, N_POSES)
+
+    skinned_positions, skinned_normals = skin(positions, normals, joint_indices, joint_weights, palettes)
+
+    assert skinned_positions.shape == (N_POSES, N_VERTICES, 3)
+    for t in range(N_POSES):
+        single_positions, single_normals = skin(positions, normals, joint_indices, joint_weights, palettes[t])
+        assert np.array_equal(skinned_positions[t], single_positions)
+        assert np.array_equal(skinned_normals[t], single_normals)
+
+        expected = shader_skin(ctx, positions, normals, joint_indices, joint_weights, palettes[t], N_JOINTS)
+        np.testing.assert_allclose(skinned_positions[t], expected, rtol=0, atol=1e-5)
+
+
+def test_skin_vertices_matches_shader(ctx):
+    rng = np.random.default_rng(2)
+    positions, normals, joint_indices, joint_weights = random_mesh(rng)
+    palettes = random_palettes(rng, 2)
+
+    skinned_positions = np.empty((2, N_VERTICES, 3), dtype=np.float32)
+    skinned_normals = np.empty((2, N_VERTICES, 3), dtype=np.float32)
+    skin_vertices(positions, normals, joint_indices, joint_weights, palettes, N_JOINTS, skinned_positions,
+                  skinned_normals)
+
+    for t in range(2):
+        expected = shader_skin(ctx, positions, normals, joint_indices, joint_weights, palettes[t], N_JOINTS)
+        np.testing.assert_allclose(skinned_positions[t], expected, rtol=0, atol=1e-5)
+
+
+def test_joints_past_n_joints_end_the_influences(ctx):
+    rng = np.random.default_rng(3)
+    positions, normals, joint_indices, joint_weights = random_mesh(rng)
+    palette = random_palettes(rng, 1)[0]
+    n_joints = N_JOINTS // 2
+
+    skinned_positions, _ = skin(positions, normals, joint_indices, joint_weights, palette, n_joints)
+    expected = shader_skin(ctx, positions, normals, joint_indices, joint_weights, palette, n_joints)
+    np.testing.assert_allclose(skinned_positions, expected, rtol=0, atol=1e-5)
+
+    # Influences after the first joint past n_joints are dropped, even when their joint is in range
+    palette = np.tile(np.identity(4, dtype=np.float32), (4, 1, 1))
+    palette[:, 3, :3] = np.arange(4)[:, None]
+    position, normal = np.zeros((1, 3), dtype=np.float32), np.array([[0, 0, 1]], dtype=np.float32)
+    indices = np.array([[1, 3, 2, -1]], dtype=np.int32)
+    weights = np.array([[0.5, 0.25, 0.25, 0.0]], dtype=np.float32)
+
+    skinned_position, _ = skin(position, normal, indices, weights, palette, n_joints=3)
+    assert np.array_equal(skinned_position, [[0.5, 0.5, 0.5]])
+    skinned_position, _ = skin(position, normal, indices, weights, palette)
+    assert np.array_equal(skinned_position, [[1.75, 1.75, 1.75]])
+
+
+def test_n_joints_past_the_palette_is_rejected():
+    palette = np.tile(np.identity(4, dtype=np.float32), (2, 1, 1))
+    positions, normals = np.zeros((1, 3), dtype=np.float32), np.array([[0, 0, 1]], dtype=np.float32)
+    indices = np.array([[5, -1, -1, -1]], dtype=np.int32)
+    weights = np.array([[1, 0, 0, 0]], dtype=np.float32)
+
+    with pytest.raises(ValueError):
+        skin(positions, normals, indices, weights, palette, n_joints=10)
+
+
+def test_unused_influences_are_skipped(ctx):
+    palette = np.tile(np.identity(4, dtype=np.float32), (3, 1, 1))
+    palette[:, 3, :3] = np.array([[0, 0, 0], [1, 2, 3], [-4, 0, 2]], dtype=np.float32)
+    positions = np.ones((3, 3), dtype=np.float32)
+    normals = np.tile(np.array([0, 1, 0], dtype=np.float32), (3, 1))
+    # A single influence, a -1 before a used slot and two half weights
+    indices = np.array([[1, -1, -1, -1], [-1, 2, -1, -1], [1, -1, 2, -1]], dtype=np.int32)
+    weights = np.array([[1, 0, 0, 0], [0, 1, 0, 0], [0.5, 0, 0.5, 0]], dtype=np.float32)
+    expected = [[2, 3, 4], [-3, 1, 3], [-0.5, 2, 3.5]]
+
+    skinned_positions, skinned_normals = skin(positions, normals, indices, weights, palette)
+
+    assert np.array_equal(skinned_positions, expected)
+    assert np.array_equal(shader_skin(ctx, positions, normals, indices, weights, palette, 3), expected)
+    assert np.array_equal(skinned_normals, normals)
+
+
+def test_normals_stay_perpendicular_under_non_uniform_scale():
+    # diag(4, 1, 1) stretches along x, so normals lean towards y
+    palette = np.identity(4, dtype=np.float32)[None].copy()
+    palette[0, 0, 0] = 4.0
+    position, indices = np.zeros((1, 3), dtype=np.float32), np.array([[0, -1, -1, -1]], dtype=np.int32)
+    weights = np.array([[1, 0, 0, 0]], dtype=np.float32)
+    normal = np.array([[1, 1, 0]], dtype=np.float32) / np.sqrt(2)
+
+    _, skinned_normal = skin(position, normal, indices, weights, palette)
+    np.testing.assert_allclose(skinned_normal, [[1 / np.sqrt(17), 4 / np.sqrt(17), 0]], rtol=0, atol=1e-6)
+
+    # With one influence, the normal is the inverse-transpose of the joint's 3x3 part applied to it, and stays
+    # perpendicular to the skinned tangents
+    rng = np.random.default_rng(4)
+    positions, normals, _, _ = random_mesh(rng)
+    palettes = random_palettes(rng, 1)
+    indices = np.tile(np.array([[7, -1, -1, -1]], dtype=np.int32), (N_VERTICES, 1))
+    weights = np.tile(np.array([[1, 0, 0, 0]], dtype=np.float32), (N_VERTICES, 1))
+
+    _, skinned_normals = skin(positions, normals, indices, weights, palettes[0])
+
+    linear = palettes[0, 7].T[:3, :3].astype(np.float64)
+    expected = normals @ np.linalg.inv(linear)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    np.testing.assert_allclose(skinned_normals, expected, rtol=0, atol=1e-5)
+
+    tangents = np.cross(normals, rng.normal(size=(N_VERTICES, 3)))
+    assert np.abs(np.sum((tangents @ linear.T) * skinned_normals, axis=1)).max() < 1e-4 * np.abs(tangents).max()
+
+
+def test_unskinned_primitives_are_rejected():
+    positions = np.zeros((4, 3), dtype=np.float32)
+    # As decoded by GLTFLoader for primitives without JOINTS_0/WEIGHTS_0
+    joint_indices = np.full((4, MAX_INFLUENCES), -1, dtype=np.int32)
+    joint_weights = np.zeros((4, MAX_INFLUENCES), dtype=np.float32)
+    primitive = PrimitiveData(positions, positions, np.zeros((4, 2), dtype=np.float32), joint_indices,
+                              joint_weights, np.arange(3, dtype=np.int32))
+
+    assert not primitive.is_skinned()
+    with pytest.raises(ValueError):
+        skin(positions, positions, joint_indices, joint_weights, np.tile(np.identity(4, dtype=np.float32), (2, 1, 1)))